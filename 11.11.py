@@ -6,14 +6,14 @@ import sys  # To find out the script name (in argv[0])
 import backtrader as bt
 import pandas as pd
 from datetime import datetime
-class TestStrategy(bt.Strategy):
+from bar_cache import load_frame
+from event_log import LoggedStrategy
+class TestStrategy(LoggedStrategy):
     params = (
         ('maperiod', 15),
     )
 
-    def log(self, txt, dt=None):
-        dt = dt or self.datas[0].datetime.date(0)
-        print('%s, %s' % (dt.isoformat(), txt))
+    console_format = '{dt:%Y-%m-%d}, {message}'
 
     def __init__(self):
         self.dataclose = self.datas[0].close
@@ -29,47 +29,53 @@ class TestStrategy(bt.Strategy):
 
         if order.status in [order.Completed]:
             if order.isbuy():
-                self.log('BUY EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                         (order.executed.price,
-                          order.executed.value,
-                          order.executed.comm))
+                self.events.info(
+                    'fill', 'BUY EXECUTED, Price: {price:.2f}, Cost: {value:.2f}, Comm {comm:.2f}',
+                    side='buy', price=order.executed.price, size=order.executed.size,
+                    value=order.executed.value, comm=order.executed.comm)
                 self.buyprice = order.executed.price
                 self.buycomm = order.executed.comm
             else:
-                self.log('SELL EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                         (order.executed.price,
-                          order.executed.value,
-                          order.executed.comm))
+                self.events.info(
+                    'fill', 'SELL EXECUTED, Price: {price:.2f}, Cost: {value:.2f}, Comm {comm:.2f}',
+                    side='sell', price=order.executed.price, size=order.executed.size,
+                    value=order.executed.value, comm=order.executed.comm)
             self.bar_executed = len(self)
 
         elif order.status in [order.Canceled, order.Margin, order.Rejected]:
-            self.log('Order Canceled/Margin/Rejected')
+            self.events.warning('order_failed', 'Order Canceled/Margin/Rejected',
+                                side='buy' if order.isbuy() else 'sell',
+                                status=order.getstatusname())
 
         self.order = None
 
     def notify_trade(self, trade):
         if not trade.isclosed:
             return
-        self.log('OPERATION PROFIT, GROSS %.2f, NET %.2f' %
-                 (trade.pnl, trade.pnlcomm))
+        self.events.info('trade', 'OPERATION PROFIT, GROSS {pnl:.2f}, NET {pnlcomm:.2f}',
+                         pnl=trade.pnl, pnlcomm=trade.pnlcomm)
 
     def next(self):
-        self.log('Close, %.2f' % self.dataclose[0])
+        # 每根 K 线的收盘价只在 log_level='DEBUG' 时记录
+        self.events.debug('bar', 'Close, {close:.2f}', close=self.dataclose[0])
 
         if self.order:
             return
 
         if not self.position:
             if self.dataclose[0] > self.sma[0]:
-                self.log('BUY CREATE, %.2f' % self.dataclose[0])
+                self.events.info('signal', 'BUY CREATE, {close:.2f}', side='buy',
+                                 close=self.dataclose[0])
                 self.order = self.buy()
         else:
             if self.dataclose[0] < self.sma[0]:
-                self.log('SELL CREATE, %.2f' % self.dataclose[0])
+                self.events.info('signal', 'SELL CREATE, {close:.2f}', side='sell',
+                                 close=self.dataclose[0])
                 self.order = self.sell()
 
     def next(self):
-        self.log('Close, %.2f' % self.dataclose[0])
+        # 每根 K 线的收盘价只在 log_level='DEBUG' 时记录
+        self.events.debug('bar', 'Close, {close:.2f}', close=self.dataclose[0])
 
         if self.order:
             return
@@ -77,11 +83,13 @@ class TestStrategy(bt.Strategy):
         if not self.position:
             if self.dataclose[0] < self.dataclose[-1]:
                 if self.dataclose[-1] < self.dataclose[-2]:
-                    self.log('BUY CREATE, %.2f' % self.dataclose[0])
+                    self.events.info('signal', 'BUY CREATE, {close:.2f}', side='buy',
+                                     close=self.dataclose[0])
                     self.order = self.buy()
         else:
             if len(self) >= (self.bar_executed + 5):
-                self.log('SELL CREATE, %.2f' % self.dataclose[0])
+                self.events.info('signal', 'SELL CREATE, {close:.2f}', side='sell',
+                                 close=self.dataclose[0])
                 self.order = self.sell()
 
 if __name__ == '__main__':
@@ -91,13 +99,7 @@ if __name__ == '__main__':
     modpath = os.path.dirname(os.path.abspath(sys.argv[0]))
     datapath = os.path.join(modpath, '../../datas/orcl-1995-2014.txt')
            #######
-    df = pd.read_excel('my513300.xlsx')
-    df['datetime'] = pd.to_datetime(
-    df['date'].dt.strftime('%Y-%m-%d') + ' ' + df['time'].astype(str)
-    )
-    
-    df['datetime'] = pd.to_datetime(df['datetime'])
-    df.set_index('datetime', inplace=True)
+    df = load_frame('my513300.xlsx')
     
     data = bt.feeds.PandasData(
         dataname=df,
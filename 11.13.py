@@ -6,15 +6,32 @@ import sys  # To find out the script name (in argv[0])
 import backtrader as bt
 import pandas as pd
 from datetime import datetime
+from bar_store import get_bars
+from array_feed import ArrayData
+from grid_levels import PriceBuckets
+from event_log import LoggedStrategy
+import fast_plot
 import sys
 
-class AdvancedGridStrategy(bt.Strategy):
+class _GridBook(object):
+    """AdvancedGridStrategy 中一个品种的指标和网格状态"""
+
+    def __init__(self, atr, sma, live_buys):
+        self.atr = atr
+        self.sma = sma
+        # 未成交的买单, 按价格分桶; 买单成交后移出这里、记入 order_pairs
+        self.live_buys = live_buys
+        self.quantity = 0       # 当前持仓的网格数量
+
+
+class AdvancedGridStrategy(LoggedStrategy):
     """
     高级动态ATR网格策略
     特点：
     1. 使用ATR计算动态网格间距。
     2. 包含趋势过滤器（SMA），防止在暴跌趋势中无脑加仓。
     3. 每一笔买单成交后，自动挂出对应的止盈卖单。
+    4. 有多个数据源时 (portfolio.run_portfolio) 每个品种各自一套网格, 共用资金。
     """
     
     params = (
@@ -22,89 +39,121 @@ class AdvancedGridStrategy(bt.Strategy):
         ('atr_dist_factor', 1.0), # 网格间距倍数 (1.0 表示 1倍ATR)
         ('trend_period', 200),    # 趋势线周期 (SMA200)
         ('qty_per_grid', 1500),     # 每一格买入的数量
-        ('max_grids', 10),        # 最大允许持有的网格层数 (风控)
+        ('max_grids', 10),        # 每个品种最大允许持有的网格层数 (风控)
         ('print_log', True),      # 是否打印日志
+        ('price_tick', 0.001),    # 挂单索引的价格分桶宽度 (最小报价单位)
     )
 
-    def log(self, txt, dt=None):
-        """ 日志记录函数 """
-        if self.params.print_log:
-            dt = dt or self.datas[0].datetime.date(0)
-            print(f'{dt.isoformat()}, {txt}')
+    console_format = '{dt:%Y-%m-%d}, {message}'
 
     def __init__(self):
-        # 初始化指标
-        self.atr = bt.indicators.ATR(self.data, period=self.params.atr_period)
-        self.sma = bt.indicators.SMA(self.data, period=self.params.trend_period)
-        
-        # 内部变量
+        # 每个数据源一套指标和网格状态
+        self.books = {}
+        for data in self.datas:
+            self.books[data] = _GridBook(
+                atr=bt.indicators.ATR(data, period=self.params.atr_period),
+                sma=bt.indicators.SMA(data, period=self.params.trend_period),
+                live_buys=PriceBuckets(self.params.price_tick))
+        # 单品种时沿用原来的属性名
+        first = self.books[self.data]
+        self.atr, self.sma, self.live_buys = first.atr, first.sma, first.live_buys
         self.order_pairs = {}  # 记录买单ID和对应的卖单信息
-        self.grids_quantity = 0 # 当前持仓的网格数量
+
+    @property
+    def grids_quantity(self):
+        """当前持仓的网格数量 (全部品种)"""
+        return sum(book.quantity for book in self.books.values())
+
+    def _prefix(self, data):
+        # 多品种时控制台消息前加品种名
+        return f"[{data._name}] " if len(self.datas) > 1 else ''
 
     def notify_order(self, order):
+        book = self.books[order.data]
+        if order.isbuy():
+            if order.alive():
+                book.live_buys.add(order)
+            else:
+                book.live_buys.remove(order)
+
         if order.status in [order.Submitted, order.Accepted]:
             return
 
+        prefix = self._prefix(order.data)
+        symbol = order.data._name
         if order.status in [order.Completed]:
             if order.isbuy():
-                self.log(f'✅ 网格买入成交: 价格: {order.executed.price:.2f}, 成本: {order.executed.value:.2f}, 手续费: {order.executed.comm:.2f}')
+                self.events.info(
+                    'fill', prefix + '✅ 网格买入成交: 价格: {price:.2f}, 成本: {value:.2f}, 手续费: {comm:.2f}',
+                    side='buy', price=order.executed.price, size=order.executed.size,
+                    value=order.executed.value, comm=order.executed.comm, symbol=symbol)
                 
                 # 买单成交后，立即计算止盈价格并挂卖单
                 price = order.executed.price
                 # 获取成交时的ATR (为了简化，这里取当天的ATR值，实盘可能需要更精细)
                 # 注意：在回测中，order.executed发生时，curr_atr可能已经变化，
                 # 这里为了稳健，使用买入价格 + 动态间距
-                grid_spread = self.atr[0] * self.params.atr_dist_factor
+                grid_spread = book.atr[0] * self.params.atr_dist_factor
                 target_price = price + grid_spread
                 
                 # 挂止盈单 (Sell Limit)
-                sell_order = self.sell(price=target_price, size=order.executed.size, exectype=bt.Order.Limit)
+                sell_order = self.sell(data=order.data, price=target_price,
+                                       size=order.executed.size, exectype=bt.Order.Limit)
                 
                 # 记录配对关系 (可选，用于后续分析)
                 self.order_pairs[order.ref] = sell_order.ref
-                self.grids_quantity += 1
-                self.log(f'⏳ 已挂出止盈单: 目标价格: {target_price:.2f} (间距: {grid_spread:.2f})')
+                book.quantity += 1
+                self.events.info('order', prefix + '⏳ 已挂出止盈单: 目标价格: {price:.2f} (间距: {spread:.2f})',
+                                 side='sell', price=target_price, size=order.executed.size,
+                                 spread=grid_spread, symbol=symbol)
 
             elif order.issell():
-                self.log(f'💰 网格止盈成交: 价格: {order.executed.price:.2f}, 收益: {order.executed.value:.2f}, 手续费: {order.executed.comm:.2f}')
-                self.grids_quantity -= 1
+                self.events.info(
+                    'fill', prefix + '💰 网格止盈成交: 价格: {price:.2f}, 收益: {value:.2f}, 手续费: {comm:.2f}',
+                    side='sell', price=order.executed.price, size=order.executed.size,
+                    value=order.executed.value, comm=order.executed.comm, symbol=symbol)
+                book.quantity -= 1
 
         elif order.status in [order.Canceled, order.Margin, order.Rejected]:
-            self.log('⚠️ 订单被取消/保证金不足/拒绝')
+            self.events.warning('order_failed', prefix + '⚠️ 订单被取消/保证金不足/拒绝',
+                                side='buy' if order.isbuy() else 'sell',
+                                status=order.getstatusname(), symbol=symbol)
 
     def next(self):
+        for data in self.datas:
+            self._next_grid(data, self.books[data])
+
+    def _next_grid(self, data, book):
         # 1. 趋势风控检查
         # 如果收盘价在SMA之下，且我们没有底仓，或者为了安全起见，暂停开新网格
-        is_uptrend = self.data.close[0] > self.sma[0]
+        is_uptrend = data.close[0] > book.sma[0]
         
         # 如果是严重下跌趋势，且持仓过重，这里可以加入止损逻辑 (本策略略过，专注网格)
         
         # 2. 动态网格逻辑
         # 如果当前没有待处理的买单，且持仓数未达上限，且处于上升/震荡趋势中
-        if self.grids_quantity < self.params.max_grids and is_uptrend:
+        if book.quantity < self.params.max_grids and is_uptrend:
             
             # 这是一个简单的连续入场逻辑：
             # 如果最近没有pending的买单，我们基于当前价格下方挂一个新的Buy Limit
             # 实际高级网格通常会预先计算好 Levels，这里演示动态挂单逻辑
             
             # 获取当前动态间距
-            current_grid_dist = self.atr[0] * self.params.atr_dist_factor
-            buy_price = self.data.close[0] - current_grid_dist
+            current_grid_dist = book.atr[0] * self.params.atr_dist_factor
+            buy_price = data.close[0] - current_grid_dist
             
             # 检查是否已经有类似的挂单 (防止在同一位置重复挂单)
-            # Backtrader的get_orders获取所有未成交订单
-            existing_orders = [o for o in self.broker.orders if o.status == bt.Order.Submitted]
-            is_duplicate = False
-            for o in existing_orders:
-                if o.isbuy() and abs(o.price - buy_price) < (current_grid_dist * 0.1):
-                    is_duplicate = True
-                    break
+            # live_buys 在 notify_order 中维护, 只需查 buy_price 附近的几个价格桶
+            is_duplicate = book.live_buys.any_within(buy_price, current_grid_dist * 0.1)
             
             if not is_duplicate:
-                self.log(f'📉 发现入场机会 (ATR: {self.atr[0]:.2f}), 挂买单 @ {buy_price:.2f}')
-                self.buy(price=buy_price, size=self.params.qty_per_grid, exectype=bt.Order.Limit)
+                self.events.info('signal', self._prefix(data) + '📉 发现入场机会 (ATR: {atr:.2f}), 挂买单 @ {price:.2f}',
+                                 side='buy', price=buy_price, close=data.close[0],
+                                 atr=book.atr[0], symbol=data._name)
+                self.buy(data=data, price=buy_price, size=self.params.qty_per_grid,
+                         exectype=bt.Order.Limit)
 
-class RSI_EMA_IntradayStrategy(bt.Strategy):
+class RSI_EMA_IntradayStrategy(LoggedStrategy):
     """
     基于 RSI 超买超卖和 EMA 趋势过滤的日内交易策略
     适用于分钟/小时级别的 K 线数据。
@@ -144,18 +193,20 @@ class RSI_EMA_IntradayStrategy(bt.Strategy):
 
         if order.status in [order.Completed]:
             if order.isbuy():
-                self.log(
-                    f'BUY EXECUTED, Price: {order.executed.price:.4f}, Size: {order.executed.size}',
-                    order_type='BUY'
-                )
+                self.events.info('fill', 'BUY EXECUTED, Price: {price:.4f}, Size: {size}',
+                                 side='buy', price=order.executed.price,
+                                 size=order.executed.size, value=order.executed.value,
+                                 comm=order.executed.comm)
             elif order.issell():
-                self.log(
-                    f'SELL EXECUTED, Price: {order.executed.price:.4f}, Size: {order.executed.size}',
-                    order_type='SELL'
-                )
+                self.events.info('fill', 'SELL EXECUTED, Price: {price:.4f}, Size: {size}',
+                                 side='sell', price=order.executed.price,
+                                 size=order.executed.size, value=order.executed.value,
+                                 comm=order.executed.comm)
         
         elif order.status in [order.Canceled, order.Margin, order.Rejected]:
-            self.log('Order Canceled/Margin/Rejected', order_type='ERROR')
+            self.events.warning('order_failed', 'Order Canceled/Margin/Rejected',
+                                side='buy' if order.isbuy() else 'sell',
+                                status=order.getstatusname())
 
         self.order = None
 
@@ -164,18 +215,8 @@ class RSI_EMA_IntradayStrategy(bt.Strategy):
         if not trade.isclosed:
             return
 
-        self.log(
-            f'OPERATION PROFIT, Gross: {trade.pnl:.2f}, Net: {trade.pnlcomm:.2f}', 
-            order_type='PROFIT'
-        )
-
-    def log(self, txt, order_type='INFO', dt=None):
-        """自定义日志函数，支持打印日志开关"""
-        if not self.p.printlog:
-            return
-        dt = dt or self.datas[0].datetime.datetime(0)
-        # 打印日期、时间、类型和信息
-        print(f'{dt.isoformat()} [{order_type}] {txt}')
+        self.events.info('trade', 'OPERATION PROFIT, Gross: {pnl:.2f}, Net: {pnlcomm:.2f}',
+                         pnl=trade.pnl, pnlcomm=trade.pnlcomm)
 
     def next(self):
         """主逻辑函数，每个新的 K 线 (分钟/小时) 都会调用一次"""
@@ -201,13 +242,11 @@ class RSI_EMA_IntradayStrategy(bt.Strategy):
                 # 注意：使用 order_target_percent 更方便管理仓位
                 target_value = self.broker.getvalue() * self.p.order_percent
                 
-                self.log(
-                    f'BUY SIGNAL: RSI={self.rsi[0]:.2f} < {self.p.rsi_low} AND Close > EMA', 
-                    order_type='SIGNAL'
-                )
+                self.events.info('signal', 'BUY SIGNAL: RSI={rsi:.2f} < {rsi_low} AND Close > EMA',
+                                 side='buy', close=current_close, rsi=self.rsi[0],
+                                 rsi_low=self.p.rsi_low)
                 
                 # 发出市价买入订单，将持仓价值调整到目标百分比
-                print("buy signal")
                 self.order = self.order_target_value(target=target_value)
                 
         # 2. 如果持有头寸 - 寻找卖出信号
@@ -216,26 +255,25 @@ class RSI_EMA_IntradayStrategy(bt.Strategy):
             is_overbought = self.rsi[0] > self.p.rsi_high
             
             if is_overbought:
-                self.log(
-                    f'SELL SIGNAL: RSI={self.rsi[0]:.2f} > {self.p.rsi_high}', 
-                    order_type='SIGNAL'
-                )
+                self.events.info('signal', 'SELL SIGNAL: RSI={rsi:.2f} > {rsi_high}',
+                                 side='sell', close=current_close, rsi=self.rsi[0],
+                                 rsi_high=self.p.rsi_high)
                 
                 # 发出卖出订单，将持仓价值调整到 0 (即全部平仓)
-                print("sell signal")
                 self.order = self.close()
 
+class BollingerBandsStrategy(LoggedStrategy):
+    """
+    布林带均值回归策略
+    收盘价跌破下轨时买入, 回到中轨上方时平仓。
+    """
     params = (
         ('period', 20),      # 布林带周期 (通常为20)
         ('devfactor', 2.0),  # 标准差倍数 (通常为2.0)
         ('printlog', True),  # 是否打印日志
     )
 
-    def log(self, txt, dt=None):
-        ''' 日志函数 '''
-        if self.params.printlog:
-            dt = dt or self.datas[0].datetime.date(0)
-            print(f'{dt.isoformat()}, {txt}')
+    console_format = '{dt:%Y-%m-%d}, {message}'
 
     def __init__(self):
         self.dataclose = self.datas[0].close
@@ -256,13 +294,24 @@ class RSI_EMA_IntradayStrategy(bt.Strategy):
         # 检查订单是否完成
         if order.status in [order.Completed]:
             if order.isbuy():
-                self.log(f'买单执行: 价格 {order.executed.price:.2f}, 成本 {order.executed.value:.2f}, 手续费 {order.executed.comm:.2f}')
+                self.events.info('fill', '买单执行: 价格 {price:.2f}, 成本 {value:.2f}, 手续费 {comm:.2f}',
+                                 side='buy', price=order.executed.price, size=order.executed.size,
+                                 value=order.executed.value, comm=order.executed.comm)
             elif order.issell():
-                self.log(f'卖单执行: 价格 {order.executed.price:.2f}, 成本 {order.executed.value:.2f}, 手续费 {order.executed.comm:.2f}')
+                self.events.info('fill', '卖单执行: 价格 {price:.2f}, 成本 {value:.2f}, 手续费 {comm:.2f}',
+                                 side='sell', price=order.executed.price, size=order.executed.size,
+                                 value=order.executed.value, comm=order.executed.comm)
             self.bar_executed = len(self)
 
         self.order = None
 
+    def notify_trade(self, trade):
+        if not trade.isclosed:
+            return
+
+        self.events.info('trade', 'OPERATION PROFIT, Gross: {pnl:.2f}, Net: {pnlcomm:.2f}',
+                         pnl=trade.pnl, pnlcomm=trade.pnlcomm)
+
     def next(self):
         # 如果有订单正在挂起，不进行操作
         if self.order:
@@ -274,7 +323,8 @@ class RSI_EMA_IntradayStrategy(bt.Strategy):
         if not self.position:
             # 买入信号: 收盘价跌破布林带下轨
             if self.dataclose[0] < self.bband.lines.bot[0]:
-                self.log(f'信号触发: 收盘价 {self.dataclose[0]:.2f} < 下轨 {self.bband.lines.bot[0]:.2f} -> 买入')
+                self.events.info('signal', '信号触发: 收盘价 {close:.2f} < 下轨 {bot:.2f} -> 买入',
+                                 side='buy', close=self.dataclose[0], bot=self.bband.lines.bot[0])
                 # 全仓买入 (根据下面 sizer 设置)
                 self.order = self.buy()
 
@@ -283,21 +333,18 @@ class RSI_EMA_IntradayStrategy(bt.Strategy):
             # 平仓信号: 价格回归均值 (突破中轨)
             # 也可以改为 > self.bband.lines.top[0] (触及上轨才卖，利润大但风险高)
             if self.dataclose[0] > self.bband.lines.mid[0]:
-                self.log(f'信号触发: 收盘价 {self.dataclose[0]:.2f} > 中轨 {self.bband.lines.mid[0]:.2f} -> 平仓')
+                self.events.info('signal', '信号触发: 收盘价 {close:.2f} > 中轨 {mid:.2f} -> 平仓',
+                                 side='sell', close=self.dataclose[0], mid=self.bband.lines.mid[0])
                 self.order = self.close()
 
-class DailyDipDCA(bt.Strategy):
+class DailyDipDCA(LoggedStrategy):
     params = (
         ('base_amount', 1000.0),   # 每日基础定投金额 (现金)
         ('dip_multiplier', 2.0),   # 下跌时的加倍系数
         ('print_log', True),       # 是否打印日志
     )
 
-    def log(self, txt, dt=None):
-        ''' 简单的日志记录函数 '''
-        if self.params.print_log:
-            dt = dt or self.datas[0].datetime.date(0)
-            print(f'{dt.isoformat()}, {txt}')
+    console_format = '{dt:%Y-%m-%d}, {message}'
 
     def __init__(self):
         # 引用收盘价数据
@@ -311,17 +358,21 @@ class DailyDipDCA(bt.Strategy):
 
         if order.status in [order.Completed]:
             if order.isbuy():
-                self.log(f'买入执行: 价格: {order.executed.price:.2f}, '
-                         f'数量: {order.executed.size:.4f}, '
-                         f'金额: {order.executed.value:.2f}, '
-                         f'手续费: {order.executed.comm:.2f}')
+                self.events.info('fill', '买入执行: 价格: {price:.2f}, 数量: {size:.4f}, '
+                                 '金额: {value:.2f}, 手续费: {comm:.2f}',
+                                 side='buy', price=order.executed.price, size=order.executed.size,
+                                 value=order.executed.value, comm=order.executed.comm)
             elif order.issell():
-                self.log(f'卖出执行: 价格: {order.executed.price:.2f}')
+                self.events.info('fill', '卖出执行: 价格: {price:.2f}',
+                                 side='sell', price=order.executed.price, size=order.executed.size,
+                                 value=order.executed.value, comm=order.executed.comm)
 
             self.bar_executed = len(self)
 
         elif order.status in [order.Canceled, order.Margin, order.Rejected]:
-            self.log('订单被取消/资金不足/拒绝')
+            self.events.warning('order_failed', '订单被取消/资金不足/拒绝',
+                                side='buy' if order.isbuy() else 'sell',
+                                status=order.getstatusname())
 
         self.order = None
 
@@ -356,22 +407,25 @@ class DailyDipDCA(bt.Strategy):
             # 注意：这里简单按收盘价计算，实际成交价可能是次日开盘价
             size = amount_to_invest / today_close
             
-            self.log(f'信号触发: {condition}, 目标金额: {amount_to_invest:.2f}, 当前价: {today_close:.2f}')
+            self.events.info('signal', '信号触发: {condition}, 目标金额: {value:.2f}, 当前价: {close:.2f}',
+                             side='buy', condition=condition, value=amount_to_invest,
+                             close=today_close)
             
             # 下单买入
             self.order = self.buy(size=size)
             self.total_invested += amount_to_invest
         else:
-            self.log(f'资金不足，无法定投。剩余现金: {cash:.2f}')
+            self.events.warning('no_cash', '资金不足，无法定投。剩余现金: {cash:.2f}', cash=cash)
 
     def stop(self):
         # 策略结束时打印总结
         value = self.broker.getvalue()
         pnl = value - self.broker.startingcash
-        #self.log(f'--- 策略结束 ---', dt=datetime.date.today())
-        self.log(f'总投入本金 (估算): {self.total_invested:.2f}')
-        self.log(f'最终账户总值: {value:.2f}')
-        self.log(f'总盈亏: {pnl:.2f}')
+        self.events.info('summary', '总投入本金 (估算): {invested:.2f}',
+                         invested=self.total_invested)
+        self.events.info('summary', '最终账户总值: {value:.2f}', value=value)
+        self.events.info('summary', '总盈亏: {pnl:.2f}', pnl=pnl)
+        super(DailyDipDCA, self).stop()
 
 if __name__ == '__main__':
     cerebro = bt.Cerebro()
@@ -389,25 +443,18 @@ if __name__ == '__main__':
     modpath = os.path.dirname(os.path.abspath(sys.argv[0]))
     datapath = os.path.join(modpath, '../../datas/orcl-1995-2014.txt')
            #######
-    #df = pd.read_excel('sh513310.xlsx')
-    df = pd.read_excel('sh511700场内货币.xlsx')
-    df['datetime'] = pd.to_datetime(
-    df['date'].dt.strftime('%Y-%m-%d') + ' ' + df['time'].astype(str)
-    )
-
-    df['datetime'] = pd.to_datetime(df['datetime'])
-    df.set_index('datetime', inplace=True)
-    data = bt.feeds.PandasData(
-        dataname=df,
-        open='open',
-        high='high',
-        low='low',
-        close='close',
-        volume='vol',
+    #bars = get_bars('513310', datetime(2025, 7, 5), datetime(2025, 11, 6), as_frame=False)
+    # DailyDipDCA 按日比较收盘价, 用分钟线合成的日线 (bar_store 缓存合成结果);
+    # 分钟线策略改回 freq='1min' 和 bt.TimeFrame.Minutes
+    bars = get_bars('511700', datetime(2025, 7, 5), datetime(2025, 11, 6), freq='D',
+                    as_frame=False)
+    # 列数组数据源: 预加载时整列拷入, 不逐行遍历 DataFrame
+    data = ArrayData(
+        dataname=bars,
         fromdate=datetime(2025, 7, 5),
         todate=datetime(2025, 11, 6),
-            timeframe=bt.TimeFrame.Minutes,  # 指定时间框架为分钟
-        compression=1  # 1分钟线    
+        timeframe=bt.TimeFrame.Days,  # 日线
+        compression=1
     )
     cerebro.adddata(data)
 
@@ -423,6 +470,7 @@ if __name__ == '__main__':
 
     # 添加分析器
     cerebro.addanalyzer(bt.analyzers.Returns, _name='returns')
+    fast_plot.attach(cerebro)
     thestrats = cerebro.run()
     # 获取
     returns = thestrats[0].analyzers.returns.get_analysis()['rtot']
@@ -431,6 +479,6 @@ if __name__ == '__main__':
     print('Final Portfolio Value: %.3f' % cerebro.broker.getvalue())
     
         
-    # Plot the result
-    
-    cerebro.plot()
\ No newline at end of file
+    # Plot the result: 降采样后写文件, 不需要图形界面
+    fast_plot.save(thestrats[0], ['strategy_plot.png', 'strategy_plot.html'])
+    print('图表已保存到 strategy_plot.png / strategy_plot.html')
\ No newline at end of file
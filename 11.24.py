@@ -3,14 +3,59 @@ from __future__ import (absolute_import, division, print_function,
 import datetime  # For datetime objects
 import os.path  # To manage paths
 import sys  # To find out the script name (in argv[0])
+from functools import partial
 import backtrader as bt
 import pandas as pd
 from datetime import datetime
 import itertools
 import numpy as np
 import matplotlib.pyplot as plt
+from array_feed import ArrayData
+from bar_store import get_bars
+from run_summary import SUMMARY_FIELDS, ResultStreamer, RunSummary, summary_record
+import indicator_cache
+import param_search
+import results_db
+import rsi_grid
+import walk_forward
+import bar_profiler
+import fast_plot
+from event_log import LoggedStrategy
 
-class RSI_EMA_IntradayStrategy(bt.Strategy):
+RESULTS_FILE = 'rsi_optimization_results.csv'
+# 回测结果库: 已回测过的组合 (同策略/参数/数据/区间/资金佣金) 不再重跑
+RESULTS_DB = 'backtest_results.db'
+
+# 数据区间与参数网格 (cerebro 路径和 numpy 路径共用)
+START = datetime(2025, 7, 5)
+END = datetime(2025, 11, 6)
+RSI_LOW_RANGE = range(20, 41, 5)   # 20, 25, 30, 35, 40
+RSI_HIGH_RANGE = range(60, 81, 5)  # 60, 65, 70, 75, 80
+# 网格优化中不变的策略参数
+GRID_FIXED = dict(rsi_period=14, ema_period=50, order_percent=0.95)
+# 对拍用的网格: 上面的网格在 513310 这段数据上几乎不触发交易
+PARITY_LOW_RANGE = range(40, 51, 5)
+PARITY_HIGH_RANGE = range(50, 61, 5)
+# 自适应搜索的参数空间 (穷举 31 x 31 x 12 x 10 = 115320 组)
+SEARCH_SPACE = dict(
+    rsi_low=range(20, 51),
+    rsi_high=range(50, 81),
+    rsi_period=range(6, 29, 2),
+    ema_period=range(20, 201, 20),
+)
+SEARCH_RESULTS_FILE = 'rsi_search_results.csv'
+# 滚动窗口优化: 训练/测试窗口长度 (交易日) 与每个训练窗口内的参数网格
+WF_TRAIN_DAYS = 30
+WF_TEST_DAYS = 10
+WF_LOW_RANGE = range(20, 51, 5)
+WF_HIGH_RANGE = range(50, 81, 5)
+WF_RESULTS_FILE = 'rsi_walk_forward.csv'
+WF_EQUITY_FILE = 'rsi_walk_forward_equity.csv'
+# --profile: 最佳参数回测的逐 K 线耗时报告
+PROFILE_FILE = 'rsi_best_profile.json'
+BEST_PLOT_FILES = ['rsi_best_plot.png', 'rsi_best_plot.html']
+
+class RSI_EMA_IntradayStrategy(LoggedStrategy):
     """
     基于 RSI 超买超卖和 EMA 趋势过滤的日内交易策略
     适用于分钟/小时级别的 K 线数据。
@@ -22,19 +67,23 @@ class RSI_EMA_IntradayStrategy(bt.Strategy):
         ('ema_period', 50),           # 长期 EMA 周期 (趋势过滤)
         ('order_percent', 0.95),      # 每次交易投入总资金的百分比
         ('printlog', False),          # 参数优化时关闭日志，避免输出过多
+        ('cache_indicators', True),   # 指标取自 indicator_cache (False 为 backtrader 原生指标)
     )
 
+    console_format = '{dt:%Y-%m-%dT%H:%M:%S} [{kind}] {message}'
+
     def __init__(self):
         # 记录收盘价和订单状态
         self.dataclose = self.datas[0].close
         self.order = None
         
-        # 1. 创建指标
+        # 1. 创建指标 (参数优化时各组合共用同一份预计算序列)
+        indicators = indicator_cache if self.p.cache_indicators else bt.indicators
         # 相对强弱指数 (RSI)
-        self.rsi = bt.indicators.RSI(self.datas[0], period=self.p.rsi_period)
+        self.rsi = indicators.RSI(self.datas[0], period=self.p.rsi_period)
         
         # 指数移动平均线 (EMA) 作为趋势过滤
-        self.ema = bt.indicators.ExponentialMovingAverage(
+        self.ema = indicators.ExponentialMovingAverage(
             self.datas[0], 
             period=self.p.ema_period
         )
@@ -50,25 +99,29 @@ class RSI_EMA_IntradayStrategy(bt.Strategy):
         if order.status in [order.Completed]:
             if order.isbuy():
                 self.trade_count += 1
+                self.events.info('fill', 'BUY EXECUTED, Price: {price:.4f}, Size: {size}',
+                                 side='buy', price=order.executed.price,
+                                 size=order.executed.size, value=order.executed.value,
+                                 comm=order.executed.comm)
             elif order.issell():
-                pass
+                self.events.info('fill', 'SELL EXECUTED, Price: {price:.4f}, Size: {size}',
+                                 side='sell', price=order.executed.price,
+                                 size=order.executed.size, value=order.executed.value,
+                                 comm=order.executed.comm)
         
         elif order.status in [order.Canceled, order.Margin, order.Rejected]:
-            pass
+            self.events.warning('order_failed', 'Order Canceled/Margin/Rejected',
+                                side='buy' if order.isbuy() else 'sell',
+                                status=order.getstatusname())
 
         self.order = None
 
     def notify_trade(self, trade):
         """交易状态发生变化时调用 (平仓时)"""
-        pass
-
-    def log(self, txt, order_type='INFO', dt=None):
-        """自定义日志函数，支持打印日志开关"""
-        if not self.p.printlog:
+        if not trade.isclosed:
             return
-        dt = dt or self.datas[0].datetime.datetime(0)
-        # 打印日期、时间、类型和信息
-        print(f'{dt.isoformat()} [{order_type}] {txt}')
+        self.events.info('trade', 'OPERATION PROFIT, Gross: {pnl:.2f}, Net: {pnlcomm:.2f}',
+                         pnl=trade.pnl, pnlcomm=trade.pnlcomm)
 
     def next(self):
         """主逻辑函数，每个新的 K 线 (分钟/小时) 都会调用一次"""
@@ -91,6 +144,9 @@ class RSI_EMA_IntradayStrategy(bt.Strategy):
             if is_uptrend and is_oversold:
                 # 计算买入手数 (使用可用资金的指定百分比)
                 target_value = self.broker.getvalue() * self.p.order_percent
+                self.events.info('signal', 'BUY SIGNAL: RSI={rsi:.2f} < {rsi_low} AND Close > EMA',
+                                 side='buy', close=current_close, rsi=self.rsi[0],
+                                 rsi_low=self.p.rsi_low, value=target_value)
                 
                 # 发出市价买入订单，将持仓价值调整到目标百分比
                 self.order = self.order_target_value(target=target_value)
@@ -101,21 +157,46 @@ class RSI_EMA_IntradayStrategy(bt.Strategy):
             is_overbought = self.rsi[0] > self.p.rsi_high
             
             if is_overbought:
+                self.events.info('signal', 'SELL SIGNAL: RSI={rsi:.2f} > {rsi_high}',
+                                 side='sell', close=current_close, rsi=self.rsi[0],
+                                 rsi_high=self.p.rsi_high)
                 # 发出卖出订单，将持仓价值调整到 0 (即全部平仓)
                 self.order = self.close()
 
 
-def run_optimization():
-    """运行参数优化并返回结果"""
+def _cached_grid(db, bars, run, rsi_low_range, rsi_high_range):
+    """先查结果库, 只把库里没有的组合交给 run(rsi_low, rsi_high) 回测"""
+    scope = db.scope(RSI_EMA_IntradayStrategy, bars, cash=1500000, commission=0.00005)
+    before = len(db)
+    records = results_db.cached_grid(db, scope, run, fixed=GRID_FIXED,
+                                     rsi_low=rsi_low_range, rsi_high=rsi_high_range)
+    print(f"结果库 {db.path}: 共 {len(records)} 组参数, 新写入 {len(db) - before} 组")
+    return records
+
+
+def run_optimization(bars=None, rsi_low_range=RSI_LOW_RANGE, rsi_high_range=RSI_HIGH_RANGE,
+                     results_file=RESULTS_FILE, db=None):
+    """
+    运行参数优化并返回结果
+    bars 为已加载的 K 线 (列式或 DataFrame, 滚动窗口优化时传入各训练段), None 时按
+    START~END 读取; results_file 为 None 时不写文件; db 为 ResultsDB 时跳过库里已有的组合
+    """
     # 1. 准备数据
-    df = pd.read_excel('sh513310.xlsx')
-    df['datetime'] = pd.to_datetime(
-        df['date'].dt.strftime('%Y-%m-%d') + ' ' + df['time'].astype(str)
-    )
-    df.set_index('datetime', inplace=True)
+    if bars is None:
+        df = get_bars('513310', START, END)
+    elif isinstance(bars, pd.DataFrame):
+        df = bars
+    else:
+        df = pd.DataFrame(bars).set_index('datetime')
+    if db is not None:
+        return _cached_grid(
+            db, df,
+            lambda rsi_low, rsi_high: run_optimization(df, rsi_low, rsi_high, results_file),
+            rsi_low_range, rsi_high_range)
     
     # 2. 创建cerebro实例
-    cerebro = bt.Cerebro(maxcpus=None, optreturn=False)  # optreturn=False获取完整策略实例
+    # optreturn=True: 子进程只回传参数和 RunSummary 的汇总记录, 不回传完整策略实例
+    cerebro = bt.Cerebro(maxcpus=None, optreturn=True)
     
     # 3. 添加数据
     data = bt.feeds.PandasData(
@@ -125,8 +206,8 @@ def run_optimization():
         low='low',
         close='close',
         volume='vol',
-        fromdate=datetime(2025, 7, 5),
-        todate=datetime(2025, 11, 6),
+        fromdate=START,
+        todate=END,
         timeframe=bt.TimeFrame.Minutes,
         compression=1  # 1分钟线    
     )
@@ -136,17 +217,10 @@ def run_optimization():
     cerebro.broker.setcash(1500000)
     cerebro.broker.setcommission(commission=0.00005)  # 0.005%
     
-    # 5. 添加分析器
-    cerebro.addanalyzer(bt.analyzers.Returns, _name='returns')
-    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe', riskfreerate=0.0)
-    cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
-    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
+    # 5. 添加分析器 (收益率/夏普/回撤/交易次数在子进程内汇总成一条记录)
+    cerebro.addanalyzer(RunSummary, _name='summary', riskfreerate=0.0)
     
     # 6. 设置参数优化
-    # 定义要测试的参数范围
-    rsi_low_range = range(20, 41, 5)  # 20, 25, 30, 35, 40
-    rsi_high_range = range(60, 81, 5) # 60, 65, 70, 75, 80
-    
     # 添加策略进行优化
     cerebro.optstrategy(
         RSI_EMA_IntradayStrategy,
@@ -158,43 +232,240 @@ def run_optimization():
         printlog=False
     )
     
-    # 7. 运行回测
+    # 7. 运行回测, 每跑完一组参数就追加写入结果文件
+    #    RSI/EMA 只与周期有关, 在主进程算好放进共享内存, 各子进程直接映射
+    cache = indicator_cache.default_cache()
+    cache.precompute(df, [('rsi', dict(period=14)), ('ema', dict(period=50))])
     print(f"开始参数优化，共测试 {len(rsi_low_range)*len(rsi_high_range)} 种参数组合...")
-    optimized_runs = cerebro.run()
-    
-    # 8. 收集结果
-    results = []
-    for run in optimized_runs:
-        strategy = run[0]
-        params = strategy.params
-        
-        # 获取分析结果
-        returns_analysis = strategy.analyzers.returns.get_analysis()
-        sharpe_analysis = strategy.analyzers.sharpe.get_analysis()
-        drawdown_analysis = strategy.analyzers.drawdown.get_analysis()
-        trades_analysis = strategy.analyzers.trades.get_analysis()
-        
-        # 计算总收益率
-        total_return = returns_analysis.get('rtot', 0)
-        
-        # 计算交易次数
-        total_trades = 0
-        if hasattr(trades_analysis, 'total'):
-            total_trades = trades_analysis.total.total
-        
-        results.append({
-            'rsi_low': params.rsi_low,
-            'rsi_high': params.rsi_high,
-            'final_value': strategy.broker.getvalue(),
-            'total_return': total_return * 100,  # 转换为百分比
-            'sharpe_ratio': sharpe_analysis.get('sharperatio', 0),
-            'max_drawdown': drawdown_analysis.max.drawdown,
-            'trade_count': total_trades,
-        })
+    with ResultStreamer(results_file, ['rsi_low', 'rsi_high']) as streamer, cache.shared():
+        cerebro.optcallback(streamer)
+        cerebro.run()
     
+    # 8. 收集结果 (精简记录: rsi_low / rsi_high / final_value / total_return /
+    #    sharpe_ratio / max_drawdown / trade_count)
+    return streamer.records
+
+
+def run_vectorized_optimization(rsi_low_range=RSI_LOW_RANGE, rsi_high_range=RSI_HIGH_RANGE,
+                                db=None):
+    """
+    用 numpy 引擎一次跑完整个参数网格, 返回与 run_optimization 相同的记录;
+    db 为 ResultsDB 时跳过库里已有的组合
+    """
+    bars = get_bars('513310', START, END, as_frame=False)
+
+    def run(rsi_low, rsi_high):
+        print(f"开始参数优化 (numpy)，共测试 {len(rsi_low)*len(rsi_high)} 种参数组合...")
+        return rsi_grid.run_grid(bars, rsi_low, rsi_high, cash=1500000, commission=0.00005,
+                                 **GRID_FIXED)
+
+    if db is None:
+        return run(rsi_low_range, rsi_high_range)
+    return _cached_grid(db, bars, run, rsi_low_range, rsi_high_range)
+
+
+def check_parity(rsi_low_range=PARITY_LOW_RANGE, rsi_high_range=PARITY_HIGH_RANGE):
+    """numpy 引擎与 cerebro 逐笔对拍: 成交 (K 线/股数/价格) 和各项指标都要一致"""
+    bars = get_bars('513310', START, END, as_frame=False)
+    records, fills = rsi_grid.run_grid(bars, rsi_low_range, rsi_high_range,
+                                       rsi_period=14, ema_period=50, order_percent=0.95,
+                                       cash=1500000, commission=0.00005,
+                                       record_fills=True)
+
+    cerebro = bt.Cerebro(maxcpus=None, optreturn=True)
+    cerebro.adddata(bt.feeds.PandasData(
+        dataname=get_bars('513310', START, END),
+        volume='vol',
+        openinterest=None,
+        fromdate=START,
+        todate=END,
+        timeframe=bt.TimeFrame.Minutes,
+        compression=1
+    ))
+    cerebro.broker.setcash(1500000)
+    cerebro.broker.setcommission(commission=0.00005)
+    cerebro.addanalyzer(RunSummary, _name='summary', riskfreerate=0.0)
+    cerebro.addanalyzer(rsi_grid.FillRecorder, _name='fills')
+    cerebro.optstrategy(
+        RSI_EMA_IntradayStrategy,
+        rsi_period=14,
+        ema_period=50,
+        order_percent=0.95,
+        rsi_low=rsi_low_range,
+        rsi_high=rsi_high_range,
+        printlog=False,
+        cache_indicators=False  # cerebro 一侧用 backtrader 原生指标作为基准
+    )
+    print(f"对拍 {len(rsi_low_range)*len(rsi_high_range)} 种参数组合 (cerebro vs numpy)...")
+    runs = cerebro.run()
+    expected = [summary_record(run[0], ['rsi_low', 'rsi_high']) for run in runs]
+    expected_fills = [run[0].analyzers.fills.get_analysis() for run in runs]
+
+    problems = rsi_grid.compare_results(expected, records, expected_fills, fills)
+    for line in problems:
+        print(line)
+    total = sum(len(f) for f in expected_fills)
+    if problems:
+        print(f"对拍失败: {len(problems)} 处不一致")
+    else:
+        print(f"对拍通过: {len(expected)} 组参数, {total} 笔成交完全一致")
+    return not problems
+
+
+def run_search(method, n_trials=None, engine='numpy', seed=None, db=None):
+    """
+    在 SEARCH_SPACE 上做自适应搜索 (random / halving / tpe), 返回全量窗口上的记录;
+    db 为 ResultsDB 时库里已有的参数直接取结果
+    """
+    space = param_search.search_space(RSI_EMA_IntradayStrategy, **SEARCH_SPACE)
+    bars = get_bars('513310', START, END, as_frame=False)
+    if engine == 'numpy':
+        objective = rsi_grid.GridObjective(bars, order_percent=0.95, cash=1500000,
+                                           commission=0.00005)
+    else:
+        objective = param_search.CerebroObjective(
+            RSI_EMA_IntradayStrategy, bars,
+            fixed=dict(order_percent=0.95, printlog=False),
+            cash=1500000, commission=0.00005, jobs=None)
+    if db is not None:
+        objective = results_db.CachedObjective(
+            objective, db, RSI_EMA_IntradayStrategy, bars, fixed=dict(order_percent=0.95),
+            cash=1500000, commission=0.00005)
+
+    kwargs = {} if n_trials is None else {'n_trials': n_trials}
+    optimizer = param_search.make_optimizer(
+        method, space, seed=seed,
+        constraint=lambda p: p['rsi_low'] < p['rsi_high'], **kwargs)
+    total = param_search.space_size(space)
+    print(f"开始参数搜索 ({method}, {engine})，参数空间共 {total} 种组合...")
+    trials = optimizer.run(objective)
+    if hasattr(objective, 'close'):
+        objective.close()
+
+    print(f"共回测 {len(trials)} 次, 折合全量回测 {optimizer.cost:.1f} 次 "
+          f"(穷举的 {optimizer.cost / total:.2%})")
+    if db is not None:
+        print(f"结果库 {db.path}: 命中 {objective.hits} 次, 新回测 {objective.misses} 次")
+    names = list(space) + ['final_value', 'total_return', 'sharpe_ratio',
+                           'max_drawdown', 'trade_count']
+    return [{name: t[name] for name in names} for t in trials if t['fraction'] >= 1.0]
+
+
+def report_search_results(results, top=20):
+    """打印并保存搜索结果 (按总收益率排序), 返回最佳参数"""
+    results_df = pd.DataFrame(results).sort_values('total_return', ascending=False)
+    print("\n" + "="*80)
+    print(f"参数搜索结果 (前 {top} 名):")
+    print("="*80)
+    print(results_df.head(top).to_string(index=False))
+    results_df.to_csv(SEARCH_RESULTS_FILE, index=False)
+    print(f"\n结果已保存到 {SEARCH_RESULTS_FILE}")
+    return results_df.iloc[0]
+
+
+def _wf_optimize(bars, engine='numpy'):
+    """滚动窗口的训练段: 在 WF 网格上取总收益率最高的参数"""
+    if engine == 'numpy':
+        records = rsi_grid.run_grid(bars, WF_LOW_RANGE, WF_HIGH_RANGE,
+                                    rsi_period=14, ema_period=50, order_percent=0.95,
+                                    cash=1500000, commission=0.00005)
+    else:
+        records = run_optimization(bars, WF_LOW_RANGE, WF_HIGH_RANGE, results_file=None)
+    best = max(records, key=lambda r: r['total_return'])
+    return {'rsi_low': best['rsi_low'], 'rsi_high': best['rsi_high']}, best
+
+
+def _wf_evaluate(bars, params, engine='numpy'):
+    """滚动窗口的测试段: 用训练出的参数回测, 返回汇总记录和逐根总资产"""
+    if engine == 'numpy':
+        records, equity = rsi_grid.run_grid(bars, [params['rsi_low']], [params['rsi_high']],
+                                            rsi_period=14, ema_period=50, order_percent=0.95,
+                                            cash=1500000, commission=0.00005,
+                                            record_equity=True)
+        return records[0], equity[:, 0]
+
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(ArrayData(dataname=bars, timeframe=bt.TimeFrame.Minutes, compression=1))
+    cerebro.broker.setcash(1500000)
+    cerebro.broker.setcommission(commission=0.00005)
+    cerebro.addstrategy(RSI_EMA_IntradayStrategy, rsi_period=14, ema_period=50,
+                        order_percent=0.95, printlog=False, **params)
+    cerebro.addanalyzer(RunSummary, _name='summary', riskfreerate=0.0)
+    cerebro.addanalyzer(walk_forward.EquityCurve, _name='equity')
+    strategy = cerebro.run()[0]
+    return (summary_record(strategy, ['rsi_low', 'rsi_high']),
+            strategy.analyzers.equity.get_analysis())
+
+
+def run_walk_forward(engine='numpy', train_days=WF_TRAIN_DAYS, test_days=WF_TEST_DAYS):
+    """
+    滚动窗口优化: 每个训练窗口选出最优 rsi_low / rsi_high, 在紧随其后的测试窗口
+    回测, 拼出样本外资金曲线并报告参数稳定性
+    """
+    # K 线只读一次, 各窗口按下标切片
+    bars = get_bars('513310', START, END, as_frame=False)
+    warmup = max(14 + 1, 50) - 1  # 测试段前补足策略最小周期 (rsi_period=14, ema_period=50)
+    windows = walk_forward.split_windows(bars['datetime'], train_days, test_days,
+                                         warmup=warmup)
+    print(f"开始滚动窗口优化 ({engine})，训练 {train_days} 个交易日 / 测试 {test_days} 个交易日，"
+          f"共 {len(windows)} 个窗口，每个窗口 {len(WF_LOW_RANGE)*len(WF_HIGH_RANGE)} 种参数组合...")
+
+    # numpy 引擎各窗口在进程池里并行; cerebro 引擎窗口依次进行,
+    # 每个窗口内 optstrategy 已经用满所有核 (进程池里不能再开进程池)
+    results = walk_forward.run_walk_forward(
+        bars, windows,
+        partial(_wf_optimize, engine=engine),
+        partial(_wf_evaluate, engine=engine),
+        jobs=None if engine == 'numpy' else 1)
+
+    table, summary = walk_forward.stability_report(results, ['rsi_low', 'rsi_high'])
+    equity = walk_forward.stitch_equity(results, 1500000)
+    print("\n" + "="*80)
+    print("逐窗口结果 (is_ 为样本内, oos_ 为样本外):")
+    print("="*80)
+    print(table.to_string(index=False))
+    print("\n参数稳定性:")
+    print(summary.to_string(index=False))
+    if len(equity):
+        print(f"\n样本外总收益率: {(equity.iloc[-1] / 1500000 - 1) * 100:.2f}%")
+    print(f"walk-forward 效率 (样本外/样本内 每日收益): {walk_forward.efficiency(results):.2f}")
+
+    table.to_csv(WF_RESULTS_FILE, index=False)
+    equity.rename('value').to_csv(WF_EQUITY_FILE, index_label='datetime')
+    print(f"\n结果已保存到 {WF_RESULTS_FILE} / {WF_EQUITY_FILE}")
+
+    # 样本外资金曲线, 竖线为各测试窗口起点
+    plt.figure(figsize=(16, 6))
+    plt.plot(np.arange(len(equity)), equity.values, label='out-of-sample value')
+    start = 0
+    for result in results:
+        plt.axvline(start, color='grey', linestyle='--', linewidth=0.8)
+        plt.text(start, equity.max(), f" {result['params']['rsi_low']}/{result['params']['rsi_high']}",
+                 va='top', fontsize=9)
+        start += len(result['equity'])
+    plt.title('Walk-forward - out-of-sample equity (labels: RSI Low/High per window)')
+    plt.xlabel('bar')
+    plt.ylabel('value')
+    plt.grid(True)
+    plt.legend()
+    plt.savefig('rsi_walk_forward.png', dpi=150, bbox_inches='tight')
+    print("样本外资金曲线已保存到 rsi_walk_forward.png")
     return results
 
 
+def plot_from_db(db):
+    """不做回测, 用结果库里 START~END 数据上的网格记录重建热力图"""
+    bars = get_bars('513310', START, END, as_frame=False)
+    scope = db.scope(RSI_EMA_IntradayStrategy, bars, cash=1500000, commission=0.00005)
+    stored = db.query(scope, **GRID_FIXED)
+    if not stored:
+        print(f"结果库 {db.path} 中没有这段数据上的记录, 请先运行优化")
+        return None
+    print(f"从结果库 {db.path} 取出 {len(stored)} 组参数的结果")
+    fields = ['rsi_low', 'rsi_high'] + SUMMARY_FIELDS
+    return analyze_and_plot_results([{f: r[f] for f in fields} for r in stored])
+
+
 def analyze_and_plot_results(results):
     """分析和可视化优化结果"""
     # 转换为DataFrame
@@ -209,20 +480,20 @@ def analyze_and_plot_results(results):
     print(results_df.to_string(index=False))
     
     # 保存结果到CSV
-    results_df.to_csv('rsi_optimization_results.csv', index=False)
-    print(f"\n结果已保存到 rsi_optimization_results.csv")
+    results_df.to_csv(RESULTS_FILE, index=False)
+    print(f"\n结果已保存到 {RESULTS_FILE}")
     
-    # 创建热力图
+    # 创建热力图 (图中文字用英文, 无图形界面的机器上一般没有中文字体)
     plt.figure(figsize=(16, 10))
     
     # 1. 总收益率热力图
     pivot_return = results_df.pivot(index='rsi_low', columns='rsi_high', values='total_return')
     plt.subplot(2, 2, 1)
     im = plt.imshow(pivot_return, cmap='RdYlGn', aspect='auto')
-    plt.colorbar(im, label='总收益率 (%)')
-    plt.title('RSI参数组合 - 总收益率 (%)')
-    plt.xlabel('RSI High 阈值')
-    plt.ylabel('RSI Low 阈值')
+    plt.colorbar(im, label='total return (%)')
+    plt.title('RSI params - total return (%)')
+    plt.xlabel('RSI High')
+    plt.ylabel('RSI Low')
     
     # 添加数值标签
     for i in range(len(pivot_return.index)):
@@ -231,13 +502,16 @@ def analyze_and_plot_results(results):
                     ha='center', va='center', color='black' if abs(pivot_return.iloc[i, j]) < 50 else 'white')
     
     # 2. 夏普比率热力图
-    pivot_sharpe = results_df.pivot(index='rsi_low', columns='rsi_high', values='sharpe_ratio')
+    # 只有一年数据时夏普比率为 None, 画图时按 NaN 处理
+    sharpe = pd.to_numeric(results_df['sharpe_ratio'])
+    pivot_sharpe = results_df.assign(sharpe_ratio=sharpe).pivot(
+        index='rsi_low', columns='rsi_high', values='sharpe_ratio')
     plt.subplot(2, 2, 2)
     im = plt.imshow(pivot_sharpe, cmap='RdYlGn', aspect='auto')
-    plt.colorbar(im, label='夏普比率')
-    plt.title('RSI参数组合 - 夏普比率')
-    plt.xlabel('RSI High 阈值')
-    plt.ylabel('RSI Low 阈值')
+    plt.colorbar(im, label='Sharpe ratio')
+    plt.title('RSI params - Sharpe ratio')
+    plt.xlabel('RSI High')
+    plt.ylabel('RSI Low')
     
     # 3. 3D图表：收益率 vs RSI Low vs RSI High
     ax = plt.subplot(2, 2, 3, projection='3d')
@@ -251,18 +525,18 @@ def analyze_and_plot_results(results):
     sc = ax.scatter(rsi_lows, rsi_highs, returns, c=returns, cmap='viridis', s=50, alpha=0.8)
     ax.set_xlabel('RSI Low')
     ax.set_ylabel('RSI High')
-    ax.set_zlabel('总收益率 (%)')
-    ax.set_title('3D: RSI参数与收益率关系')
-    plt.colorbar(sc, ax=ax, label='总收益率 (%)')
+    ax.set_zlabel('total return (%)')
+    ax.set_title('3D: RSI params vs total return')
+    plt.colorbar(sc, ax=ax, label='total return (%)')
     
     # 4. 交易次数与收益率关系
     plt.subplot(2, 2, 4)
     scatter = plt.scatter(results_df['trade_count'], results_df['total_return'], 
-                         c=results_df['sharpe_ratio'], s=50, alpha=0.7, cmap='viridis')
-    plt.colorbar(scatter, label='夏普比率')
-    plt.xlabel('总交易次数')
-    plt.ylabel('总收益率 (%)')
-    plt.title('交易频率与收益关系')
+                         c=sharpe, s=50, alpha=0.7, cmap='viridis')
+    plt.colorbar(scatter, label='Sharpe ratio')
+    plt.xlabel('trade count')
+    plt.ylabel('total return (%)')
+    plt.title('trade count vs total return')
     plt.grid(True)
     
     plt.tight_layout()
@@ -274,7 +548,7 @@ def analyze_and_plot_results(results):
     print("\n" + "="*80)
     print(f"最佳参数组合: RSI Low = {best_result['rsi_low']}, RSI High = {best_result['rsi_high']}")
     print(f"预期总收益率: {best_result['total_return']:.2f}%")
-    print(f"夏普比率: {best_result['sharpe_ratio']:.2f}")
+    print(f"夏普比率: {sharpe[best_result.name]:.2f}")
     print(f"最大回撤: {best_result['max_drawdown']:.2f}%")
     print(f"总交易次数: {best_result['trade_count']}")
     print("="*80)
@@ -282,18 +556,14 @@ def analyze_and_plot_results(results):
     return best_result
 
 
-def run_best_strategy(best_params):
-    """使用最佳参数运行完整回测，生成详细图表和日志"""
+def run_best_strategy(best_params, profile=False):
+    """使用最佳参数运行完整回测，生成详细图表和日志; profile=True 时另出耗时报告"""
     print("\n" + "="*80)
     print(f"使用最佳参数运行完整回测: RSI Low={best_params['rsi_low']}, RSI High={best_params['rsi_high']}")
     print("="*80)
     
     # 1. 准备数据
-    df = pd.read_excel('sh513310.xlsx')
-    df['datetime'] = pd.to_datetime(
-        df['date'].dt.strftime('%Y-%m-%d') + ' ' + df['time'].astype(str)
-    )
-    df.set_index('datetime', inplace=True)
+    df = get_bars('513310', START, END)
     
     # 2. 创建cerebro实例
     cerebro = bt.Cerebro()
@@ -306,8 +576,8 @@ def run_best_strategy(best_params):
         low='low',
         close='close',
         volume='vol',
-        fromdate=datetime(2025, 7, 5),
-        todate=datetime(2025, 11, 6),
+        fromdate=START,
+        todate=END,
         timeframe=bt.TimeFrame.Minutes,
         compression=1  # 1分钟线    
     )
@@ -321,8 +591,8 @@ def run_best_strategy(best_params):
     # 5. 添加策略（使用最佳参数）
     cerebro.addstrategy(
         RSI_EMA_IntradayStrategy,
-        rsi_period=14,
-        ema_period=50,
+        rsi_period=int(best_params.get('rsi_period', 14)),
+        ema_period=int(best_params.get('ema_period', 50)),
         order_percent=0.95,
         rsi_low=best_params['rsi_low'],
         rsi_high=best_params['rsi_high'],
@@ -341,6 +611,10 @@ def run_best_strategy(best_params):
     cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
     cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
     
+    # 可选: 各阶段逐 K 线耗时 (不开启时没有任何开销)
+    bar_profiler.attach(cerebro, report=PROFILE_FILE, enabled=profile)
+    fast_plot.attach(cerebro)
+    
     # 8. 运行回测
     print(f'初始资金: {initial_cash:.2f}')
     results = cerebro.run()
@@ -352,31 +626,64 @@ def run_best_strategy(best_params):
     
     print(f'\n最终资金: {final_value:.2f}')
     print(f'总收益率: {total_return:.2f}%')
-    print(f"夏普比率: {strategy.analyzers.sharpe.get_analysis().get('sharperatio', 0):.2f}")
+    # 没有交易时 sharperatio 为 None
+    print(f"夏普比率: {strategy.analyzers.sharpe.get_analysis().get('sharperatio') or 0:.2f}")
     print(f"最大回撤: {strategy.analyzers.drawdown.get_analysis().max.drawdown:.2f}%")
     
-    # 10. 绘制详细图表
+    # 10. 绘制详细图表: 价格和资金曲线降采样, 成交标记逐笔画出, 直接写文件
     print("\n生成详细回测图表...")
-    cerebro.plot(
-        style='candlestick',
-        barup='red', bardown='green',  # A股习惯红涨绿跌
-        volume=False,
-        subplot=True,
-        plotvaluetrades=True,
-        plotname=f"RSI_EMA策略 (RSI-Low={best_params['rsi_low']}, RSI-High={best_params['rsi_high']})",
-        figsize=(16, 10)
+    fast_plot.save(
+        strategy, BEST_PLOT_FILES,
+        title=f"RSI_EMA strategy (RSI-Low={best_params['rsi_low']}, RSI-High={best_params['rsi_high']})"
     )
-    
-    print("图表已生成并显示。按任意键继续...")
-    input()  # 等待用户按键
+    print(f"图表已保存到 {' / '.join(BEST_PLOT_FILES)}")
 
 
 if __name__ == '__main__':
-    # 步骤1: 运行参数优化
-    optimization_results = run_optimization()
-    
-    # 步骤2: 分析和可视化结果
-    best_params = analyze_and_plot_results(optimization_results)
+    import argparse
+    parser = argparse.ArgumentParser(description="RSI_EMA 日内策略参数优化")
+    parser.add_argument("--engine", choices=("numpy", "cerebro"), default="numpy",
+                        help="numpy: 向量化一次跑完整个网格 (默认); cerebro: 逐组事件驱动回测")
+    parser.add_argument("--parity", action="store_true",
+                        help="只做 numpy 引擎与 cerebro 的对拍, 不优化、不出图")
+    parser.add_argument("--search", choices=("grid",) + tuple(param_search.OPTIMIZERS),
+                        default="grid",
+                        help="grid: 穷举 RSI_LOW_RANGE x RSI_HIGH_RANGE (默认); "
+                             "random / halving / tpe: 在 SEARCH_SPACE 上自适应搜索")
+    parser.add_argument("--trials", type=int, default=None,
+                        help="自适应搜索的试验次数 (halving 为初始参数组数)")
+    parser.add_argument("--seed", type=int, default=None, help="自适应搜索的随机种子")
+    parser.add_argument("--no-db", action="store_true",
+                        help=f"不读写结果库 {RESULTS_DB}, 所有组合都重新回测")
+    parser.add_argument("--from-db", action="store_true",
+                        help="不回测, 直接用结果库里的记录重建热力图")
+    parser.add_argument("--walk-forward", action="store_true",
+                        help="滚动窗口优化: 逐窗口训练/样本外测试, 输出样本外资金曲线和参数稳定性")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"最佳参数回测时记录各阶段逐 K 线耗时, 报告写入 {PROFILE_FILE}")
+    args = parser.parse_args()
+
+    if args.parity:
+        sys.exit(0 if check_parity() else 1)
+
+    if args.walk_forward:
+        run_walk_forward(args.engine)
+        sys.exit(0)
+
+    db = None if args.no_db else results_db.ResultsDB(RESULTS_DB)
+    if args.from_db:
+        sys.exit(0 if db is not None and plot_from_db(db) is not None else 1)
+
+    # 步骤1/2: 运行参数优化, 分析和可视化结果
+    if args.search != "grid":
+        search_results = run_search(args.search, args.trials, args.engine, args.seed, db)
+        best_params = report_search_results(search_results)
+    else:
+        if args.engine == "numpy":
+            optimization_results = run_vectorized_optimization(db=db)
+        else:
+            optimization_results = run_optimization(db=db)
+        best_params = analyze_and_plot_results(optimization_results)
     
     # 步骤3: 使用最佳参数运行完整回测
-    run_best_strategy(best_params)
\ No newline at end of file
+    run_best_strategy(best_params, profile=args.profile)
\ No newline at end of file
@@ -4,8 +4,13 @@ import datetime
 import pandas as pd
 import os
 import sys
+from bar_store import get_bars
+import indicator_cache
+import event_log
+import fast_plot
+from event_log import LoggedStrategy
 
-class ATRChannelBreakout(bt.Strategy):
+class ATRChannelBreakout(LoggedStrategy):
     """
     ATR通道突破策略:
     1. 计算ATR指标
@@ -22,12 +27,6 @@ class ATRChannelBreakout(bt.Strategy):
         ('printlog', True),       # 是否打印日志
     )
     
-    def log(self, txt, dt=None, doprint=False):
-        ''' 日志记录函数 '''
-        if self.params.printlog or doprint:
-            dt = dt or self.datas[0].datetime.datetime(0)
-            print('%s, %s' % (dt.isoformat(), txt))
-            
     def __init__(self):
         # 保留对data[0]的引用
         self.dataclose = self.datas[0].close
@@ -40,8 +39,8 @@ class ATRChannelBreakout(bt.Strategy):
         self.buycomm = None
         self.entry_price = None  # 记录入场价格，用于追踪止损
         
-        # 计算ATR指标
-        self.atr = bt.indicators.ATR(
+        # 计算ATR指标 (经 indicator_cache 缓存, 扫描 atr_multiplier 时只算一次)
+        self.atr = indicator_cache.ATR(
             self.datas[0],
             period=self.p.atr_period
         )
@@ -62,24 +61,25 @@ class ATRChannelBreakout(bt.Strategy):
             
         if order.status in [order.Completed]:
             if order.isbuy():
-                self.log(
-                    'BUY EXECUTED, Price: %.4f, Cost: %.2f, Comm %.2f' %
-                    (order.executed.price,
-                     order.executed.value,
-                     order.executed.comm))
+                self.events.info(
+                    'fill', 'BUY EXECUTED, Price: {price:.4f}, Cost: {value:.2f}, Comm {comm:.2f}',
+                    side='buy', price=order.executed.price, size=order.executed.size,
+                    value=order.executed.value, comm=order.executed.comm)
                 self.buyprice = order.executed.price
                 self.buycomm = order.executed.comm
                 self.entry_price = order.executed.price  # 保存入场价格
             else:  # Sell
-                self.log('SELL EXECUTED, Price: %.4f, Cost: %.2f, Comm %.2f' %
-                         (order.executed.price,
-                          order.executed.value,
-                          order.executed.comm))
+                self.events.info(
+                    'fill', 'SELL EXECUTED, Price: {price:.4f}, Cost: {value:.2f}, Comm {comm:.2f}',
+                    side='sell', price=order.executed.price, size=order.executed.size,
+                    value=order.executed.value, comm=order.executed.comm)
                 
             self.bar_executed = len(self)
             
         elif order.status in [order.Canceled, order.Margin, order.Rejected]:
-            self.log('Order Canceled/Margin/Rejected')
+            self.events.warning('order_failed', 'Order Canceled/Margin/Rejected',
+                                side='buy' if order.isbuy() else 'sell',
+                                status=order.getstatusname())
             
         self.order = None
         
@@ -87,8 +87,8 @@ class ATRChannelBreakout(bt.Strategy):
         if not trade.isclosed:
             return
             
-        self.log('OPERATION PROFIT, GROSS %.2f, NET %.2f' %
-                 (trade.pnl, trade.pnlcomm))
+        self.events.info('trade', 'OPERATION PROFIT, GROSS {pnl:.2f}, NET {pnlcomm:.2f}',
+                         pnl=trade.pnl, pnlcomm=trade.pnlcomm)
                  
     def next(self):
         # 检查是否有挂起的订单，如果有，不执行新订单
@@ -99,7 +99,8 @@ class ATRChannelBreakout(bt.Strategy):
         if not self.position:  # 没有持仓
             # 买入条件：收盘价突破上轨
             if self.dataclose[0] > self.upper[0]:
-                self.log('BUY CREATE, %.4f' % self.dataclose[0])
+                self.events.info('signal', 'BUY CREATE, {close:.4f}', side='buy',
+                                 close=self.dataclose[0], upper=self.upper[0])
                 self.order = self.buy(size=self.p.stake)
                 self.trail_stop_price = None  # 重置追踪止损价格
                 
@@ -114,19 +115,27 @@ class ATRChannelBreakout(bt.Strategy):
                 
                 # 检查是否触发追踪止损
                 if self.dataclose[0] < self.trail_stop_price:
-                    self.log('TRAILING STOP TRIGGERED, %.4f' % self.dataclose[0])
+                    self.events.info('signal', 'TRAILING STOP TRIGGERED, {close:.4f}',
+                                     side='sell', close=self.dataclose[0],
+                                     price=self.trail_stop_price)
                     self.order = self.sell(size=self.p.stake)
                     return
                     
             # 卖出条件：收盘价跌破下轨
             if self.dataclose[0] < self.lower[0]:
-                self.log('SELL CREATE, %.4f' % self.dataclose[0])
+                self.events.info('signal', 'SELL CREATE, {close:.4f}', side='sell',
+                                 close=self.dataclose[0], lower=self.lower[0])
                 self.order = self.sell(size=self.p.stake)
                 
     def stop(self):
-        self.log('(ATR Period %2d, Multiplier %.2f) Ending Value %.2f' %
-                 (self.params.atr_period, self.params.atr_multiplier,
-                  self.broker.getvalue()), doprint=True)
+        # 汇总行与原 doprint=True 一样总是打印
+        self.events.log(event_log.INFO, 'summary',
+                        '(ATR Period {atr_period:2d}, Multiplier {atr_multiplier:.2f}) '
+                        'Ending Value {value:.2f}', echo=True,
+                        atr_period=self.params.atr_period,
+                        atr_multiplier=self.params.atr_multiplier,
+                        value=self.broker.getvalue())
+        super(ATRChannelBreakout, self).stop()
 
 # 回测主程序
 if __name__ == '__main__':
@@ -149,13 +158,8 @@ if __name__ == '__main__':
     
     # 读取数据
     try:
-        # 尝试读取Excel文件
-        df = pd.read_excel('sh513310.xlsx')
-        # 处理日期时间
-        df['datetime'] = pd.to_datetime(
-            df['date'].dt.strftime('%Y-%m-%d') + ' ' + df['time'].astype(str)
-        )
-        df.set_index('datetime', inplace=True)
+        # 从本地K线库按品种和区间取数
+        df = get_bars('513310', datetime.datetime(2025, 7, 5), datetime.datetime(2025, 11, 6))
         
         # 创建数据源
         data = bt.feeds.PandasData(
@@ -204,6 +208,9 @@ if __name__ == '__main__':
     # 打印初始资金
     print('Starting Portfolio Value: %.2f' % cerebro.broker.getvalue())
     
+    # 记录出图用的资产曲线和成交
+    fast_plot.attach(cerebro)
+
     # 运行回测
     results = cerebro.run()
     strat = results[0]
@@ -214,5 +221,6 @@ if __name__ == '__main__':
     print('DrawDown:', strat.analyzers.drawdown.get_analysis())
     print('Returns:', strat.analyzers.returns.get_analysis())
     
-    # 绘制结果
-    cerebro.plot(style='candlestick')
\ No newline at end of file
+    # 绘制结果: 降采样后写文件, 不逐根画蜡烛、不需要图形界面
+    fast_plot.save(strat, ['atr_breakout_plot.png', 'atr_breakout_plot.html'])
+    print('图表已保存到 atr_breakout_plot.png / atr_breakout_plot.html')
\ No newline at end of file
@@ -6,6 +6,12 @@ import sys  # To find out the script name (in argv[0])
 import backtrader as bt
 import pandas as pd
 from datetime import datetime
+from bar_cache import load_bars
+from bar_store import get_bars
+from array_feed import ArrayData
+from grid_levels import GridLevels
+from event_log import LoggedStrategy
+import fast_plot
 import sys
 # class TestStrategy(bt.Strategy):
 #     params = (
@@ -69,7 +75,7 @@ import sys
 #                 self.log('SELL CREATE, %.3f' % self.dataclose[0])
 #                 self.order = self.sell()
 
-class GridStrategy(bt.Strategy):
+class GridStrategy(LoggedStrategy):
     params = (
         ('grid_interval', 0.01),      # 间隔值：绝对值 or 百分比（小数形式）
         ('grid_type', 'absolute'),    # 'absolute' 或 'percentage'
@@ -77,10 +83,6 @@ class GridStrategy(bt.Strategy):
         ('stake', 10),                # 每格交易数量
     )
 
-    def log(self, txt, dt=None):
-        dt = dt or self.datas[0].datetime.datetime(0)
-        print('%s, %s' % (dt.isoformat(), txt))
-
     def __init__(self):
         self.dataclose = self.datas[0].close
         self.order = None
@@ -107,14 +109,22 @@ class GridStrategy(bt.Strategy):
             else:
                 raise ValueError("grid_type must be 'absolute' or 'percentage'")
 
-            print(f"Initial grid prices: {self.grid_prices}")
+            self.events.debug('grid_prices', 'Initial grid prices: {prices}',
+                              prices=self.grid_prices)
 
             self.grid_prices.sort()
-            self.log(
-                f"Grid initialized. Base={self.base_price:.6f}, "
-                f"Type={self.p.grid_type}, Interval={self.p.grid_interval}, "
-                f"Levels=±{self.p.grid_levels}"
-            )
+            # 有序价位 + 整数 tick 的触发状态, 每根 K 线二分查找穿越的价位
+            self.levels = GridLevels(self.grid_prices)
+            self.active_grids = self.levels.active
+            if self.p.grid_type == 'absolute':
+                self.tolerance = self.p.grid_interval * 0.1
+            else:
+                self.tolerance = abs(self.base_price * self.p.grid_interval * 0.1)
+            self.events.info(
+                'grid', "Grid initialized. Base={close:.6f}, Type={grid_type}, "
+                "Interval={interval}, Levels=±{levels}",
+                close=self.base_price, grid_type=self.p.grid_type,
+                interval=self.p.grid_interval, levels=self.p.grid_levels)
 
     # def next(self):
     #     if self.order:
@@ -156,46 +166,26 @@ class GridStrategy(bt.Strategy):
             return
 
         current_price = float(self.dataclose[0])
-        candidate_grids = []
-
-        for price in self.grid_prices:
-            key = round(price, 3)
-            if key in self.active_grids:
-                continue
-
-            # 判断是否穿过，可触发
-            if self.p.grid_type == 'absolute':
-                tolerance = self.p.grid_interval * 0.1
-            else:
-                tolerance = abs(self.base_price * self.p.grid_interval * 0.1)
-
-            crossed = False
-            if abs(current_price - price) <= tolerance:
-                crossed = True
-            elif len(self) > 1:
-                if (self.dataclose[-1] < price <= current_price) or \
-                (self.dataclose[-1] > price >= current_price):
-                    crossed = True
-
-            if crossed:
-                candidate_grids.append(price)
+        previous_price = float(self.dataclose[-1]) if len(self) > 1 else None
 
-        # 只触发距离当前价最近的那个网格
-        if candidate_grids:
-            # 按距离当前价的绝对值升序排列
-            candidate_grids.sort(key=lambda p: abs(current_price - p))
-            best_price = candidate_grids[0]
-            key = round(best_price, 3)
-            self.active_grids.add(key)
+        # 判断是否穿过 (距现价不超过容差, 或落在上根收盘与现价之间), 只触发距离
+        # 当前价最近的那个未触发网格
+        index = self.levels.crossed(current_price, previous_price, self.tolerance)
+        if index is not None:
+            best_price = self.levels.prices[index]
+            self.levels.deactivate(index)
 
             if best_price > self.base_price:
                 if self.position:
-                    self.log(f'SELL at grid {best_price:.6f} (current={current_price:.6f})')
+                    self.events.info('signal', 'SELL at grid {price:.6f} (current={close:.6f})',
+                                     side='sell', price=best_price, close=current_price)
                     self.order = self.sell(size=self.p.stake)
                 else:
-                    self.log(f'SKIP SELL (no position) at {best_price:.6f}')
+                    self.events.info('signal_skipped', 'SKIP SELL (no position) at {price:.6f}',
+                                     side='sell', price=best_price, close=current_price)
             elif best_price < self.base_price:
-                self.log(f'BUY at grid {best_price:.6f} (current={current_price:.6f})')
+                self.events.info('signal', 'BUY at grid {price:.6f} (current={close:.6f})',
+                                 side='buy', price=best_price, close=current_price)
                 self.order = self.buy(size=self.p.stake)
 
     #监听订单状态
@@ -204,19 +194,28 @@ class GridStrategy(bt.Strategy):
             return
         if order.status == order.Completed:
             if order.isbuy():
-                self.log(f'BUY EXECUTED, Price: {order.executed.price:.6f}')
+                self.events.info('fill', 'BUY EXECUTED, Price: {price:.6f}', side='buy',
+                                 price=order.executed.price, size=order.executed.size,
+                                 value=order.executed.value, comm=order.executed.comm)
             else:
-                self.log(f'SELL EXECUTED, Price: {order.executed.price:.6f}')
+                self.events.info('fill', 'SELL EXECUTED, Price: {price:.6f}', side='sell',
+                                 price=order.executed.price, size=order.executed.size,
+                                 value=order.executed.value, comm=order.executed.comm)
         elif order.status in [order.Canceled, order.Margin, order.Rejected]:
-            self.log('Order Canceled/Margin/Rejected')
+            self.events.warning('order_failed', 'Order Canceled/Margin/Rejected',
+                                side='buy' if order.isbuy() else 'sell',
+                                status=order.getstatusname())
         self.order = None
     #记录每次交易
     def notify_trade(self, trade):
         if trade.isclosed:
-            self.log(f'TRADE PROFIT, GROSS {trade.pnl:.3f}, NET {trade.pnlcomm:.3f}')
+            self.events.info('trade', 'TRADE PROFIT, GROSS {pnl:.3f}, NET {pnlcomm:.3f}',
+                             pnl=trade.pnl, pnlcomm=trade.pnlcomm)
             commission = trade.commission
             self.total_commission += commission
-            self.log(f'>>> Commission this trade: {commission:.3f}, Total so far: {self.total_commission:.3f}')
+            self.events.info('commission',
+                             '>>> Commission this trade: {comm:.3f}, Total so far: {total:.3f}',
+                             comm=commission, total=self.total_commission)
         
 if __name__ == '__main__':
     cerebro = bt.Cerebro()
@@ -226,22 +225,12 @@ if __name__ == '__main__':
     modpath = os.path.dirname(os.path.abspath(sys.argv[0]))
     datapath = os.path.join(modpath, '../../datas/orcl-1995-2014.txt')
            #######
-    #df = pd.read_excel('my513300.xlsx')
-    df = pd.read_excel('sh513310.xlsx')
-    df['datetime'] = pd.to_datetime(
-    df['date'].dt.strftime('%Y-%m-%d') + ' ' + df['time'].astype(str)
-    )
-    
-    df['datetime'] = pd.to_datetime(df['datetime'])
-    df.set_index('datetime', inplace=True)
+    #bars = load_bars('my513300.xlsx')
+    bars = get_bars('513310', datetime(2025, 7, 28), datetime(2025, 8, 29), as_frame=False)
 
-    data = bt.feeds.PandasData(
-        dataname=df,
-        open='open',
-        high='high',
-        low='low',
-        close='close',
-        volume='vol',
+    # 列数组数据源: 预加载时整列拷入, 不逐行遍历 DataFrame
+    data = ArrayData(
+        dataname=bars,
         fromdate=datetime(2025, 7, 28),
         todate=datetime(2025, 8, 29),
             timeframe=bt.TimeFrame.Minutes,  # 指定时间框架为分钟
@@ -257,11 +246,12 @@ if __name__ == '__main__':
 
     print('Starting Portfolio Value: %.3f' % cerebro.broker.getvalue())
 
-    cerebro.run()
+    fast_plot.attach(cerebro)
+    strategy = cerebro.run()[0]
 
     print('Final Portfolio Value: %.3f' % cerebro.broker.getvalue())
     
         
-    # Plot the result
-    
-    cerebro.plot()
\ No newline at end of file
+    # Plot the result: 降采样后写文件, 不需要图形界面
+    fast_plot.save(strategy, ['grid_plot.png', 'grid_plot.html'])
+    print('图表已保存到 grid_plot.png / grid_plot.html')
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""
+基于 numpy 列数组的 backtrader 数据源
+
+bt.feeds.PandasData 在 _load 里逐行取 DataFrame 的值并逐个把 Timestamp 转成
+backtrader 的浮点日期。ArrayData 在 start() 时把整列 datetime 一次性换算成
+backtrader 日期数, 预加载 (cerebro 默认 preload=True) 时直接把各列整块拷进
+line 缓冲区, 不再逐根 K 线调用 _load。
+
+dataname 可以是:
+    - 列式 K 线 dict (bar_cache.load_bars / bar_store.get_bars(as_frame=False) /
+      bar_writers.read_npy_dir 的内存映射列 / Lc1Archive.read)
+    - datetime 索引的 DataFrame
+    - .lc1 文件路径: 经 Lc1Archive 内存映射, 只解码 fromdate~todate 之间的记录
+
+    data = ArrayData(dataname=get_bars('513310', as_frame=False),
+                     fromdate=datetime(2025, 7, 28), todate=datetime(2025, 8, 29),
+                     timeframe=bt.TimeFrame.Minutes, compression=1)
+
+有过滤器 (addfilter / resample / replay)、输入时区 (tzinput) 或 exactbars 省内存
+模式时自动退回逐根加载, 行为与普通数据源一致。
+"""
+import math
+import os
+
+import backtrader as bt
+import numpy as np
+
+import bar_cache
+import tdx_reader
+
+# datetime.date(1970, 1, 1).toordinal()
+_EPOCH_ORDINAL = 719163
+_NS_PER_DAY = 86400 * 1000000000
+_NS_PER_US = 1000
+
+
+def _fraction_of_day(ns_of_day):
+    """当日偏移纳秒 -> 与 bt.utils.date2num 相同取整方式的日内小数"""
+    us = ns_of_day // _NS_PER_US
+    hour, rem = divmod(us, 3600 * 1000000)
+    minute, rem = divmod(rem, 60 * 1000000)
+    second, micro = divmod(rem, 1000000)
+    return math.fsum((hour / 24.0, minute / 1440.0, second / 86400.0,
+                      micro / 86400000000.0))
+
+
+def to_bt_datenum(dt):
+    """
+    datetime64 数组 -> backtrader 浮点日期 (公历序数日 + 日内小数)
+    日内小数按去重后的时刻计算, 分钟线每天只有几百个不同时刻
+    """
+    ns = np.asarray(dt, dtype='M8[ns]').view(np.int64)
+    days, tod = np.divmod(ns, _NS_PER_DAY)
+    uniq, inverse = np.unique(tod, return_inverse=True)
+    fractions = np.array([_fraction_of_day(int(t)) for t in uniq], dtype=np.float64)
+    return (days + _EPOCH_ORDINAL).astype(np.float64) + fractions[inverse]
+
+
+def bt_timeframe(freq):
+    """bar_store 周期 '1min' / '5min' / 'D' -> (bt.TimeFrame, compression)"""
+    if freq == 'D':
+        return bt.TimeFrame.Days, 1
+    if freq.endswith('min'):
+        return bt.TimeFrame.Minutes, int(freq[:-3])
+    raise ValueError(f"不支持的周期: {freq}")
+
+
+def _as_columns(dataname, fromdate, todate):
+    if isinstance(dataname, str):
+        if os.path.splitext(dataname)[1].lower() == '.lc1':
+            with tdx_reader.Lc1Archive(dataname) as archive:
+                return archive.read(fromdate, todate)
+        return bar_cache.load_bars(dataname)
+    if isinstance(dataname, dict):
+        return dataname
+    # DataFrame: datetime 索引或 datetime 列
+    columns = {name: dataname[name].to_numpy() for name in dataname.columns}
+    if 'datetime' not in columns:
+        columns['datetime'] = dataname.index.to_numpy()
+    return columns
+
+
+class ArrayData(bt.feed.DataBase):
+    """
+    列数组数据源; 参数与 PandasData 类似, 值为 dataname 中的列名, None 表示没有该列
+    """
+
+    params = (
+        ('datetime', 'datetime'),
+        ('open', 'open'),
+        ('high', 'high'),
+        ('low', 'low'),
+        ('close', 'close'),
+        ('volume', 'vol'),
+        ('openinterest', None),
+    )
+
+    def start(self):
+        super(ArrayData, self).start()
+        # 提前完成时区/起止日期换算, 以便按 self.fromdate/self.todate 切片
+        self._start_finish()
+
+        columns = _as_columns(self.p.dataname, self.p.fromdate, self.p.todate)
+        dtnum = to_bt_datenum(columns[self.p.datetime])
+        lo = int(np.searchsorted(dtnum, self.fromdate, 'left'))
+        hi = int(np.searchsorted(dtnum, self.todate, 'right'))
+
+        self._columns = []
+        for alias in self.getlinealiases():
+            field = dtnum if alias == 'datetime' else None
+            name = getattr(self.params, alias, None)
+            if field is None and name is not None and name in columns:
+                field = columns[name]
+            if field is None:
+                field = np.full(len(dtnum), np.nan)
+            values = np.ascontiguousarray(field[lo:hi], dtype=np.float64)
+            self._columns.append((getattr(self.lines, alias), values))
+        self._size = hi - lo
+        self._idx = 0
+
+    def _can_bulk_load(self):
+        if self._filters or self._ffilters or self._tzinput:
+            return False
+        return all(line.mode == bt.LineBuffer.UnBounded for line, _ in self._columns)
+
+    def preload(self):
+        if not self._can_bulk_load():
+            return super(ArrayData, self).preload()
+
+        for line, values in self._columns:
+            line.array.frombytes(values[self._idx:].tobytes())
+        self._idx = self._size
+        self._last()
+        self.home()
+
+    def _load(self):
+        if self._idx >= self._size:
+            return False
+        i = self._idx
+        for line, values in self._columns:
+            line[0] = values[i]
+        self._idx += 1
+        return True
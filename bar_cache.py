@@ -0,0 +1,224 @@
+"""
+K 线数据的列式磁盘缓存
+
+xlsx / xls / csv / txt / lc1 / lc5 / day / parquet / feather 源文件第一次加载时解析一次, 结果以
+未压缩 .npz 列存到源文件旁边的 .bar_cache/ 目录。之后再加载只需读几个连续的
+numpy 数组, 不再走 Excel 解析。lc1_to_csv_cli.py --format npy 写出的列目录本身就是
+这种布局, 直接内存映射读取, 不经缓存。
+
+缓存以源文件的绝对路径、大小和修改时间为键; 源文件有变化时自动重建。
+
+表格来源的 date/time 两列直接换算成 int64 纳秒时间戳 (日期纳秒 + 当日秒数 * 1e9),
+只对去重后的几百个日期/时间取值做解析, 不再逐行拼字符串再 pd.to_datetime。
+日期或时间为空的行 (如 Excel 导出末尾的空行、汇总行) 时间为 NaT, 解析时丢弃并提示。
+
+    df = load_frame('sh513310.xlsx')   # datetime 索引, open/high/low/close/amount/vol
+
+load_resampled() 在同一目录缓存由分钟线合成的大周期 K 线 (resample.py), 每个周期
+一个文件, 同样随源文件变化失效:
+
+    bars_60 = load_resampled('sh513300.lc1', '60min')
+"""
+import datetime
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+import bar_writers
+import resample
+import tdx_reader
+
+CACHE_DIRNAME = '.bar_cache'
+CACHE_VERSION = 2
+
+NS_PER_SECOND = 1000000000
+NS_PER_DAY = 86400 * NS_PER_SECOND
+NAT = np.datetime64('NaT', 'ns').view(np.int64)
+
+TDX_EXTS = tuple(tdx_reader.RECORD_LAYOUTS)
+EXCEL_EXTS = ('.xlsx', '.xls')
+TEXT_EXTS = ('.csv', '.txt')
+COLUMNAR_EXTS = ('.parquet', '.feather')
+
+# 不同来源的列名统一成 BAR_FIELDS
+_COLUMN_ALIASES = {
+    'volume': 'vol',
+    'turnover': 'amount',
+}
+
+
+def cache_path(source_path, freq=None):
+    """源文件对应的缓存文件路径; freq 为合成周期 (None 为源文件原样)"""
+    source_path = os.path.abspath(source_path)
+    digest = hashlib.sha1(source_path.encode('utf-8')).hexdigest()[:12]
+    suffix = f".{freq}" if freq else ''
+    name = f"{os.path.basename(source_path)}-{digest}{suffix}.npz"
+    return os.path.join(os.path.dirname(source_path), CACHE_DIRNAME, name)
+
+
+def _fingerprint(source_path):
+    st = os.stat(source_path)
+    return os.path.abspath(source_path), st.st_size, st.st_mtime_ns
+
+
+def _time_of_day_seconds(value):
+    """单个时间取值 -> 当日秒数; 支持 datetime.time / timedelta / '9:30:0' 字符串"""
+    if isinstance(value, datetime.time):
+        return value.hour * 3600 + value.minute * 60 + value.second
+    if isinstance(value, (datetime.timedelta, pd.Timedelta)):
+        return int(value.total_seconds())
+    parts = [int(float(p)) for p in str(value).strip().split(':')]
+    parts += [0] * (3 - len(parts))
+    return parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+
+def date_to_ns(dates):
+    """日期列 -> 当日 0 点的 int64 纳秒时间戳; 空值为 NAT"""
+    dates = pd.Series(dates)
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        ns = dates.to_numpy(dtype='M8[ns]').view(np.int64)
+        return np.where(ns == NAT, NAT, ns - ns % NS_PER_DAY)
+    # 字符串日期: 每天只解析一次; 空值的 code 为 -1
+    codes, uniques = pd.factorize(dates)
+    parsed = pd.to_datetime(pd.Index(uniques).astype(str)).to_numpy(dtype='M8[ns]')
+    return np.where(codes < 0, NAT, parsed.view(np.int64)[codes])
+
+
+def time_to_ns(times):
+    """时间列 -> 当日偏移纳秒数; 空值为 NAT"""
+    codes, uniques = pd.factorize(pd.Series(times))
+    seconds = np.array([_time_of_day_seconds(t) for t in uniques], dtype=np.int64)
+    return np.where(codes < 0, NAT, seconds[codes] * NS_PER_SECOND)
+
+
+def combine_datetime(dates, times):
+    """date 列 + time 列 -> int64 纳秒时间戳 (可 .view('M8[ns]')); 任一为空时为 NAT"""
+    day, offset = date_to_ns(dates), time_to_ns(times)
+    return np.where((day == NAT) | (offset == NAT), NAT, day + offset)
+
+
+def _table_to_bars(df):
+    """Excel/CSV 表格 -> 列式 K 线"""
+    df = df.rename(columns=lambda c: _COLUMN_ALIASES.get(str(c).strip().lower(),
+                                                         str(c).strip().lower()))
+    if 'datetime' in df.columns:
+        dt = pd.to_datetime(df['datetime']).to_numpy(dtype='M8[ns]')
+    elif 'time' in df.columns:
+        dt = combine_datetime(df['date'], df['time']).view('M8[ns]')
+    else:
+        dt = date_to_ns(df['date']).view('M8[ns]')
+
+    # 时间为空的行不是 K 线, 不进缓存
+    valid = ~np.isnat(dt)
+    if not valid.all():
+        print(f"丢弃 {int((~valid).sum())} 行日期/时间为空的记录")
+    bars = {'datetime': dt[valid]}
+    for name in tdx_reader.BAR_FIELDS:
+        if name in df.columns:
+            bars[name] = df[name].to_numpy(dtype=np.float64)[valid]
+        else:
+            bars[name] = np.zeros(int(valid.sum()), dtype=np.float64)
+    return bars
+
+
+def parse_source(source_path):
+    """不经缓存直接解析源文件, 返回列式 K 线"""
+    ext = os.path.splitext(source_path)[1].lower()
+    if ext in TDX_EXTS:
+        return tdx_reader.read_bars(source_path)
+    if ext in EXCEL_EXTS:
+        return _table_to_bars(pd.read_excel(source_path))
+    if ext in TEXT_EXTS:
+        return _table_to_bars(pd.read_csv(source_path))
+    if ext == '.parquet':
+        return _table_to_bars(pd.read_parquet(source_path))
+    if ext == '.feather':
+        return _table_to_bars(pd.read_feather(source_path))
+    raise ValueError(f"不支持的数据文件类型: {source_path}")
+
+
+def _read_cache(path, fingerprint):
+    try:
+        with np.load(path, allow_pickle=False) as z:
+            meta = (str(z['source'][()]), int(z['size'][()]), int(z['mtime_ns'][()]))
+            if int(z['version'][()]) != CACHE_VERSION or meta != fingerprint:
+                return None
+            bars = {'datetime': z['datetime'].view('M8[ns]')}
+            for name in tdx_reader.BAR_FIELDS:
+                bars[name] = z[name]
+            return bars
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _write_cache(path, fingerprint, bars):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    source, size, mtime_ns = fingerprint
+    arrays = {name: bars[name] for name in tdx_reader.BAR_FIELDS}
+    arrays['datetime'] = bars['datetime'].astype('M8[ns]').view(np.int64)
+    # 先写临时文件再替换, 避免并行进程读到写了一半的缓存
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, source=np.array(source), size=np.array(size),
+                 mtime_ns=np.array(mtime_ns), version=np.array(CACHE_VERSION),
+                 **arrays)
+    os.replace(tmp, path)
+
+
+def load_bars(source_path, refresh=False):
+    """
+    加载列式 K 线 dict (datetime 为 datetime64[ns]), 优先读缓存
+    refresh=True 强制重新解析源文件
+    """
+    if bar_writers.is_npy_dir(source_path):
+        return bar_writers.read_npy_dir(source_path)
+
+    fingerprint = _fingerprint(source_path)
+    path = cache_path(source_path)
+    if not refresh:
+        bars = _read_cache(path, fingerprint)
+        if bars is not None:
+            return bars
+
+    bars = parse_source(source_path)
+    _write_cache(path, fingerprint, bars)
+    return bars
+
+
+def load_resampled(source_path, freq, refresh=False):
+    """
+    源文件的分钟线合成 freq 周期 ('5min' / '60min' / 'D' ...) 后的列式 K 线,
+    优先读缓存; npy 列目录可能被追加写入, 每次重新合成不缓存
+    """
+    if bar_writers.is_npy_dir(source_path):
+        bars = bar_writers.read_npy_dir(source_path)
+        return resample.resample_bars(_sorted(bars), freq)
+
+    fingerprint = _fingerprint(source_path)
+    path = cache_path(source_path, freq)
+    if not refresh:
+        bars = _read_cache(path, fingerprint)
+        if bars is not None:
+            return bars
+
+    bars = resample.resample_bars(_sorted(load_bars(source_path, refresh)), freq)
+    _write_cache(path, fingerprint, bars)
+    return bars
+
+
+def _sorted(bars):
+    dt = np.asarray(bars['datetime'], dtype='M8[ns]').view(np.int64)
+    if len(dt) > 1 and np.any(dt[1:] < dt[:-1]):
+        order = np.argsort(dt, kind='stable')
+        bars = {name: np.asarray(col)[order] for name, col in bars.items()}
+    return bars
+
+
+def load_frame(source_path, refresh=False):
+    """
+    加载为 datetime 索引的 DataFrame, 可直接交给 bt.feeds.PandasData
+    (索引已是 datetime64, 不需要再 pd.to_datetime / set_index)
+    """
+    return tdx_reader.bars_to_frame(load_bars(source_path, refresh))
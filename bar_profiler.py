@@ -0,0 +1,310 @@
+"""
+逐 K 线耗时分析
+
+一次回测慢, 却看不出时间花在数据加载、指标更新、next()、notify_order 还是 broker
+撮合上。attach() 给 cerebro 挂上计时层, 按阶段记录累计耗时和每根 K 线的耗时:
+
+    bar_profiler.attach(cerebro, report='profile.json')
+    strategy = cerebro.run()[0]     # stop() 时打印汇总表, 写出 JSON 报告
+    report = strategy.analyzers.profile.get_analysis()
+
+阶段:
+    preload            数据预加载 (整段一次)
+    indicators_once    runonce 模式下指标整段向量计算 (一次)
+    data               每根 K 线推进数据源
+    broker             broker.next(): 订单激活与撮合
+    indicators         next 模式下逐根更新指标
+    prenext / nextstart / next / notify_order / notify_trade /
+    notify_cashvalue / notify_fund      策略回调
+    analyzers / observers
+    strategy_other     策略一根 K 线内上面各项之外的部分 (通知分发、指标推进等)
+    cerebro_other      cerebro 主循环自身 (数据对齐、定时器等)
+另按 K 线统计 broker 处理的订单数 (orders, 撮合队列长度) 和 notify_order 次数。
+
+计时是在实例上替换方法 (不改类), run 结束时恢复; 不调用 attach() 就没有任何开销,
+attach(..., enabled=False) 同样什么都不做。一个 cerebro 只支持一个策略、不支持
+optstrategy 多进程。
+"""
+import json
+import time
+from array import array
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+CALLBACKS = ('prenext', 'nextstart', 'next', 'notify_order', 'notify_trade',
+             'notify_cashvalue', 'notify_fund')
+# 每根 K 线计时的阶段 (报告中的顺序)
+BAR_PHASES = ('data', 'broker', 'indicators') + CALLBACKS + ('analyzers', 'observers')
+BATCH_PHASES = ('preload', 'indicators_once')
+DERIVED_PHASES = ('strategy_other', 'cerebro_other', 'bar_total')
+
+
+class _Phase(object):
+    __slots__ = ('total', 'calls', 'bar', 'bar_calls', 'active')
+
+    def __init__(self):
+        self.total = 0.0
+        self.calls = 0
+        self.bar = 0.0          # 当前 K 线内的累计耗时
+        self.bar_calls = 0
+        self.active = False     # 同一阶段嵌套调用 (如 nextstart -> next) 只计外层
+
+
+def _timed(phase, original, before=None, after=None):
+    clock = time.perf_counter
+
+    def timed(*args, **kwargs):
+        if phase.active:
+            return original(*args, **kwargs)
+        if before is not None:
+            before()
+        phase.active = True
+        start = clock()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            elapsed = clock() - start
+            phase.active = False
+            phase.total += elapsed
+            phase.calls += 1
+            phase.bar += elapsed
+            phase.bar_calls += 1
+            if after is not None:
+                after()
+
+    timed._bar_profiler = True
+    return timed
+
+
+class _Patches(object):
+    """记录实例上替换过的方法, restore() 时还原"""
+
+    def __init__(self):
+        self._items = []
+
+    def wrap(self, owner, name, phase, before=None, after=None):
+        original = getattr(owner, name, None)
+        if original is None or getattr(original, '_bar_profiler', False):
+            return False
+        self._items.append((owner, name, owner.__dict__.get(name)))
+        setattr(owner, name, _timed(phase, original, before, after))
+        return True
+
+    def restore(self):
+        for owner, name, previous in reversed(self._items):
+            if previous is None:
+                owner.__dict__.pop(name, None)
+            else:
+                setattr(owner, name, previous)
+        self._items = []
+
+
+def _stats(values):
+    if not len(values):
+        return dict(mean_us=None, p50_us=None, p95_us=None, max_us=None)
+    us = np.asarray(values) * 1e6
+    return dict(mean_us=float(us.mean()), p50_us=float(np.percentile(us, 50)),
+                p95_us=float(np.percentile(us, 95)), max_us=float(us.max()))
+
+
+class BarProfiler(bt.Analyzer):
+    """
+    计时分析器; 一般通过 attach() 添加。report 为 JSON 报告路径, per_bar_file 为
+    逐 K 线耗时 CSV (微秒), printout 为 stop() 时是否打印汇总表
+    get_analysis() 返回报告 dict, per_bar 为逐 K 线 DataFrame
+    """
+
+    params = (
+        ('report', None),
+        ('per_bar_file', None),
+        ('printout', True),
+        ('slowest', 5),             # 报告中列出最慢的 K 线根数
+        ('preload', None),          # attach() 传入的预加载计时 (_Phase) 和 _Patches
+    )
+
+    def start(self):
+        clock = time.perf_counter
+        self._phases = {name: _Phase() for name in BAR_PHASES + ('strategy',)}
+        self._per_bar = {name: array('d') for name in BAR_PHASES + ('strategy', 'bar_total')}
+        self._orders = array('l')
+        self._notifications = array('l')
+        self._dt = array('d')
+        self._bar_orders = 0
+        self._mode = None
+        self._patches = _Patches()
+        self._once = _Phase()
+
+        strategy = self.strategy
+        broker = strategy.broker
+        phases = self._phases
+        wrap = self._patches.wrap
+
+        for data in strategy.datas:
+            wrap(data, 'next', phases['data'])
+            wrap(data, 'advance', phases['data'])
+
+        def count_orders():
+            # 新提交的订单在 submitted 里, 本次 next() 中转入 pending 撮合
+            self._bar_orders += (len(getattr(broker, 'submitted', ())) +
+                                 len(getattr(broker, 'pending', ())))
+        wrap(broker, 'next', phases['broker'], before=count_orders)
+
+        for name in CALLBACKS:
+            wrap(strategy, name, phases[name])
+        wrap(strategy, '_next_analyzers', phases['analyzers'])
+        wrap(strategy, '_next_observers', phases['observers'])
+        for indicator in strategy._lineiterators[bt.LineIterator.IndType]:
+            wrap(indicator, '_next', phases['indicators'])
+
+        def reset_clock():
+            # 整段指标计算不算进第一根 K 线
+            self._last = clock()
+        wrap(strategy, '_once', self._once, after=reset_clock)
+
+        def end_bar_once():
+            self._mode = 'runonce'
+            self._end_bar()
+
+        def end_bar_next():
+            self._mode = 'next'
+            self._end_bar()
+        wrap(strategy, '_oncepost', phases['strategy'], after=end_bar_once)
+        wrap(strategy, '_next', phases['strategy'], after=end_bar_next)
+
+        self._started = clock()
+        self._last = self._started
+
+    def _end_bar(self):
+        now = time.perf_counter()
+        self._per_bar['bar_total'].append(now - self._last)
+        self._last = now
+        for name, phase in self._phases.items():
+            self._per_bar[name].append(phase.bar)
+            phase.bar = 0.0
+        self._orders.append(self._bar_orders)
+        self._bar_orders = 0
+        notify = self._phases['notify_order']
+        self._notifications.append(notify.bar_calls)
+        for phase in self._phases.values():
+            phase.bar_calls = 0
+        self._dt.append(self.strategy.datetime[0])
+
+    def stop(self):
+        wall = time.perf_counter() - self._started
+        self._patches.restore()
+        preload, preload_patches = self.p.preload or (None, None)
+        if preload_patches is not None:
+            preload_patches.restore()
+
+        self.per_bar = self._frame()
+        self.rets = self._report(wall, preload)
+        if self.p.printout:
+            self.print_report()
+        if self.p.report:
+            with open(self.p.report, 'w', encoding='utf-8') as f:
+                json.dump(self.rets, f, ensure_ascii=False, indent=2)
+        if self.p.per_bar_file:
+            self.per_bar.to_csv(self.p.per_bar_file)
+
+    def _frame(self):
+        columns = {}
+        for name in BAR_PHASES:
+            if self._phases[name].calls:
+                columns[name] = np.asarray(self._per_bar[name])
+        inner = sum(np.asarray(self._per_bar[name]) for name in BAR_PHASES
+                    if name not in ('data', 'broker'))
+        strategy = np.asarray(self._per_bar['strategy'])
+        total = np.asarray(self._per_bar['bar_total'])
+        columns['strategy_other'] = np.maximum(strategy - inner, 0.0)
+        columns['cerebro_other'] = np.maximum(
+            total - strategy - np.asarray(self._per_bar['data']) -
+            np.asarray(self._per_bar['broker']), 0.0)
+        columns['bar_total'] = total
+        frame = pd.DataFrame({name: values * 1e6 for name, values in columns.items()})
+        frame['orders'] = np.asarray(self._orders, dtype=np.int64)
+        frame['notifications'] = np.asarray(self._notifications, dtype=np.int64)
+        frame.index = pd.DatetimeIndex([bt.num2date(x) for x in self._dt], name='datetime')
+        return frame
+
+    def _report(self, wall, preload):
+        bars = len(self.per_bar)
+        rows = []
+        batch = {'preload': preload, 'indicators_once': self._once}
+        for name in BATCH_PHASES:
+            phase = batch[name]
+            if phase is not None and phase.calls:
+                rows.append(dict(phase=name, calls=phase.calls, total_s=phase.total,
+                                 **_stats(())))
+        for name in BAR_PHASES:
+            phase = self._phases[name]
+            if phase.calls:
+                rows.append(dict(phase=name, calls=phase.calls, total_s=phase.total,
+                                 **_stats(self.per_bar[name].to_numpy() / 1e6)))
+        for name in DERIVED_PHASES:
+            values = self.per_bar[name].to_numpy() / 1e6
+            rows.append(dict(phase=name, calls=bars, total_s=float(values.sum()),
+                             **_stats(values)))
+        total = wall + (preload.total if preload is not None else 0.0)
+        for row in rows:
+            row['share'] = row['total_s'] / total if total else None
+
+        orders = self.per_bar['orders']
+        slowest = self.per_bar.nlargest(self.p.slowest, 'bar_total')
+        return {
+            'strategy': type(self.strategy).__name__,
+            'mode': self._mode,
+            'bars': bars,
+            'wall_s': total,
+            'phases': rows,
+            'orders': {
+                'processed': int(orders.sum()),
+                'max_per_bar': int(orders.max()) if bars else 0,
+                'bars_with_orders': int((orders > 0).sum()),
+                'notifications': int(self.per_bar['notifications'].sum()),
+            },
+            'slowest_bars': [
+                dict(datetime=str(dt), bar_total_us=float(row['bar_total']),
+                     orders=int(row['orders']), notifications=int(row['notifications']))
+                for dt, row in slowest.iterrows()],
+        }
+
+    def summary_table(self):
+        """汇总表 DataFrame (阶段 x 调用次数 / 累计秒数 / 占比 / 每根 K 线微秒数)"""
+        table = pd.DataFrame(self.rets['phases'])
+        return table[['phase', 'calls', 'total_s', 'share', 'mean_us', 'p50_us', 'p95_us',
+                      'max_us']]
+
+    def print_report(self):
+        report = self.rets
+        print("\n" + "=" * 80)
+        print(f"逐 K 线耗时: {report['strategy']}, {report['bars']} 根 K 线 ({report['mode']}), "
+              f"总耗时 {report['wall_s']:.3f} s")
+        print("=" * 80)
+        print(self.summary_table().to_string(index=False, float_format=lambda x: f"{x:.4g}"))
+        orders = report['orders']
+        print(f"订单: broker 撮合队列共 {orders['processed']} 单次, 单根最多 "
+              f"{orders['max_per_bar']}, 有订单的 K 线 {orders['bars_with_orders']} 根, "
+              f"notify_order {orders['notifications']} 次")
+        if report['slowest_bars']:
+            print("最慢的 K 线:")
+            for bar in report['slowest_bars']:
+                print(f"  {bar['datetime']}  {bar['bar_total_us']:.0f} us  "
+                      f"orders={bar['orders']}  notifications={bar['notifications']}")
+
+
+def attach(cerebro, report=None, per_bar_file=None, printout=True, enabled=True,
+           name='profile'):
+    """
+    给 cerebro 挂上计时 (需在 adddata 之后、run 之前调用); enabled=False 时什么都
+    不做。run 之后用 strategy.analyzers.<name>.get_analysis() 取报告
+    """
+    if not enabled:
+        return
+    preload = _Phase()
+    patches = _Patches()
+    for data in cerebro.datas:
+        patches.wrap(data, 'preload', preload)
+    cerebro.addanalyzer(BarProfiler, _name=name, report=report, per_bar_file=per_bar_file,
+                        printout=printout, preload=(preload, patches))
@@ -0,0 +1,243 @@
+"""
+本地多品种 K 线库
+
+按品种代码取数, 不再在每个脚本里写死某个 xlsx:
+
+    from bar_store import get_bars
+    df = get_bars('513310', datetime(2025, 7, 5), datetime(2025, 11, 6))
+
+- 启动时扫描目录下以 sh/sz + 6 位代码开头的数据文件 (sh513310.xlsx, sh513300.lc1,
+  sh511700场内货币.lc1 ...), 同一品种同一周期有多个来源时按 SOURCE_PRIORITY 取第一个;
+  文件名不符合规则的 (如 my513300.xlsx) 用 register() 显式登记
+- 每个品种/周期第一次查询时经 bar_cache 加载整段数据, 按时间排序后常驻内存,
+  区间查询在 int64 时间索引上二分查找, 结果是原数组的切片
+- 最近用过的区间结果放在有界 LRU 里, 重复取同一窗口直接返回
+- 没有原生来源的周期 (如 get_bars('513300', freq='60min')) 由能整除它的分钟线
+  来源合成 (resample.py), 合成结果经 bar_cache.load_resampled 缓存在源文件旁
+"""
+import datetime
+import os
+import re
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import bar_cache
+import bar_writers
+import resample
+import tdx_reader
+
+# 同一品种多个来源时的优先级 (扩展名; '' 为 npy 列目录)
+SOURCE_PRIORITY = ('.lc1', '.lc5', '.day', '', '.parquet', '.feather',
+                   '.csv', '.txt', '.xlsx', '.xls')
+
+_SYMBOL_RE = re.compile(r'^(sh|sz)(\d{6})', re.IGNORECASE)
+
+NS_PER_MINUTE = 60 * 1000000000
+NS_PER_DAY = 1440 * NS_PER_MINUTE
+
+
+def normalize_symbol(symbol):
+    """'sh513310' / '513310' / 513310 -> '513310'"""
+    symbol = str(symbol).strip().lower()
+    if symbol[:2] in ('sh', 'sz'):
+        symbol = symbol[2:]
+    return symbol
+
+
+def infer_freq(dt):
+    """由相邻 K 线的时间间隔推断周期: '1min' / '5min' / ... / 'D'"""
+    ns = np.asarray(dt, dtype='M8[ns]').view(np.int64)
+    if len(ns) < 2:
+        return '1min'
+    step = int(np.median(np.diff(ns)))
+    if step >= NS_PER_DAY:
+        return 'D'
+    return f"{max(1, step // NS_PER_MINUTE)}min"
+
+
+def parse_when(value):
+    """
+    '2025-08-05' -> date (作区间终点时含当天全部 K 线); 带时刻的字符串 -> datetime
+    非字符串 (None / date / datetime / Timestamp) 原样返回
+    """
+    if not isinstance(value, str):
+        return value
+    text = value.strip()
+    parsed = datetime.datetime.fromisoformat(text)
+    if len(text) <= 10:
+        return parsed.date()
+    return parsed
+
+
+def _start_ns(when):
+    return pd.Timestamp(parse_when(when)).value
+
+
+def _end_ns(when):
+    """区间终点 (含): 纯日期 (含 '2025-08-05' 这样的字符串) 表示包含当天全部 K 线"""
+    when = parse_when(when)
+    if not isinstance(when, datetime.datetime) and isinstance(when, datetime.date):
+        return pd.Timestamp(when).value + NS_PER_DAY - 1
+    return pd.Timestamp(when).value
+
+
+def _source_rank(path):
+    ext = '' if bar_writers.is_npy_dir(path) else os.path.splitext(path)[1].lower()
+    return SOURCE_PRIORITY.index(ext) if ext in SOURCE_PRIORITY else len(SOURCE_PRIORITY)
+
+
+class BarStore(object):
+    """
+    多品种 K 线库; get_bars 返回的 DataFrame 与 LRU 共享, 调用方不要原地修改
+    """
+
+    def __init__(self, root=None, cache_size=32):
+        self.root = root or os.path.dirname(os.path.abspath(__file__))
+        self.cache_size = cache_size
+        self._sources = {}      # symbol -> [path, ...]
+        self._freqs = {}        # path -> freq
+        self._series = {}       # (symbol, freq) -> (时间索引 int64, 列式 K 线)
+        self._slices = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.scan(self.root)
+
+    def scan(self, directory):
+        """登记目录下文件名以 sh/sz + 6 位代码开头的数据文件"""
+        for name in sorted(os.listdir(directory)):
+            match = _SYMBOL_RE.match(name)
+            path = os.path.join(directory, name)
+            if not match or name.startswith('~$'):
+                continue
+            if os.path.isfile(path) and _source_rank(path) == len(SOURCE_PRIORITY):
+                continue
+            if os.path.isdir(path) and not bar_writers.is_npy_dir(path):
+                continue
+            self._add(match.group(2), path)
+
+    def _add(self, symbol, path, front=False):
+        paths = self._sources.setdefault(symbol, [])
+        if path in paths:
+            paths.remove(path)
+        if front:
+            paths.insert(0, path)
+        else:
+            paths.append(path)
+            paths.sort(key=_source_rank)
+
+    def register(self, symbol, path, freq=None):
+        """显式登记一个数据来源, 优先于扫描到的同周期来源"""
+        symbol = normalize_symbol(symbol)
+        self._add(symbol, path, front=True)
+        if freq is not None:
+            self._freqs[path] = freq
+        self._forget(symbol)
+
+    def _forget(self, symbol):
+        for key in [k for k in self._series if k[0] == symbol]:
+            del self._series[key]
+        for key in [k for k in self._slices if k[0] == symbol]:
+            del self._slices[key]
+
+    def symbols(self):
+        return sorted(self._sources)
+
+    def sources(self, symbol):
+        return list(self._sources.get(normalize_symbol(symbol), []))
+
+    def source_freq(self, path):
+        if path not in self._freqs:
+            ext = os.path.splitext(path)[1].lower()
+            if ext in tdx_reader.RECORD_LAYOUTS:
+                minutes = tdx_reader.RECORD_LAYOUTS[ext][1]
+                self._freqs[path] = 'D' if minutes is None else f"{minutes}min"
+            else:
+                self._freqs[path] = infer_freq(bar_cache.load_bars(path)['datetime'])
+        return self._freqs[path]
+
+    def freqs(self, symbol):
+        """品种可用的原生周期"""
+        return sorted({self.source_freq(p) for p in self.sources(symbol)})
+
+    def _load_series(self, symbol, freq):
+        paths = self._sources.get(symbol, [])
+        bars = None
+        for path in paths:
+            if self.source_freq(path) == freq:
+                bars = bar_cache.load_bars(path)
+                break
+        if bars is None:
+            # 没有原生来源时由分钟线合成, 取能合成的最大周期来源 (同周期按优先级)
+            candidates = [p for p in paths
+                          if resample.can_resample(self.source_freq(p), freq)]
+            if candidates:
+                path = max(candidates, key=lambda p: resample.freq_minutes(self.source_freq(p)))
+                bars = bar_cache.load_resampled(path, freq)
+        if bars is None:
+            raise KeyError(f"没有品种 {symbol} 周期 {freq} 的数据; 已登记来源: {paths}")
+
+        index = np.asarray(bars['datetime'], dtype='M8[ns]').view(np.int64)
+        if len(index) > 1 and np.any(index[1:] < index[:-1]):
+            order = np.argsort(index, kind='stable')
+            bars = {name: np.asarray(col)[order] for name, col in bars.items()}
+            index = index[order]
+        return index, bars
+
+    def series(self, symbol, freq='1min'):
+        """品种/周期的完整 (时间索引, 列式 K 线), 首次访问时加载"""
+        key = (normalize_symbol(symbol), freq)
+        if key not in self._series:
+            self._series[key] = self._load_series(*key)
+        return self._series[key]
+
+    def locate(self, symbol, start=None, end=None, freq='1min'):
+        """区间 [start, end] 在时间索引上的下标 (lo, hi), 不含 hi"""
+        index, _ = self.series(symbol, freq)
+        lo = int(np.searchsorted(index, _start_ns(start), 'left')) if start is not None else 0
+        hi = int(np.searchsorted(index, _end_ns(end), 'right')) if end is not None else len(index)
+        return lo, max(lo, hi)
+
+    def get_bars(self, symbol, start=None, end=None, freq='1min', as_frame=True):
+        """
+        取 [start, end] 区间的 K 线; 默认返回 datetime 索引的 DataFrame
+        (可直接交给 bt.feeds.PandasData), as_frame=False 返回列式 dict
+        """
+        symbol = normalize_symbol(symbol)
+        lo, hi = self.locate(symbol, start, end, freq)
+        key = (symbol, freq, lo, hi, as_frame)
+        if key in self._slices:
+            self.hits += 1
+            self._slices.move_to_end(key)
+            return self._slices[key]
+
+        self.misses += 1
+        _, bars = self.series(symbol, freq)
+        result = {name: col[lo:hi] for name, col in bars.items()}
+        if as_frame:
+            result = tdx_reader.bars_to_frame(result)
+        self._slices[key] = result
+        while len(self._slices) > self.cache_size:
+            self._slices.popitem(last=False)
+        return result
+
+    def clear_cache(self):
+        self._series.clear()
+        self._slices.clear()
+
+
+_default_store = None
+
+
+def default_store():
+    """以本文件所在目录为根的全局 BarStore"""
+    global _default_store
+    if _default_store is None:
+        _default_store = BarStore()
+    return _default_store
+
+
+def get_bars(symbol, start=None, end=None, freq='1min', as_frame=True):
+    """default_store().get_bars 的快捷方式"""
+    return default_store().get_bars(symbol, start, end, freq, as_frame)
@@ -0,0 +1,157 @@
+"""
+列式 K 线的批量输出
+
+所有格式都直接从列数组整体写出, 不再为每根 K 线构造 dict 再 DictWriter.writerow:
+
+    csv      date,time,open,high,low,close,amount,vol  日期/时间为 2025-07-28 / 09:30:00
+    parquet  datetime 列为 datetime64[ns] (需要 pyarrow)
+    feather  同上 (需要 pyarrow)
+    npy      目录, 每列一个 .npy 文件 (datetime.npy 为 datetime64[ns]),
+             可以 np.load(mmap_mode='r') 直接映射, 无需任何解析
+
+csv 和 npy 支持 append=True 续写 (增量转换用)。
+"""
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from tdx_reader import BAR_FIELDS, COLS
+
+FORMATS = ('csv', 'parquet', 'feather', 'npy')
+APPENDABLE_FORMATS = ('csv', 'npy')
+
+_EXTENSIONS = {
+    'csv': '.csv',
+    'parquet': '.parquet',
+    'feather': '.feather',
+    'npy': '',          # 目录
+}
+
+
+def output_name(stem, fmt):
+    """输出文件名 (npy 为目录名)"""
+    return stem + _EXTENSIONS[fmt]
+
+
+def format_datetimes(dt):
+    """datetime64 数组 -> (日期字符串数组, 时间字符串数组), 整列转换"""
+    text = np.datetime_as_string(np.asarray(dt, dtype='M8[s]'), unit='s').astype('U19')
+    chars = text.view('U1').reshape(len(text), 19)
+    dates = np.ascontiguousarray(chars[:, :10]).view('U10').ravel()
+    times = np.ascontiguousarray(chars[:, 11:]).view('U8').ravel()
+    return dates, times
+
+
+def write_csv(bars, path, append=False):
+    # 每列先整体转成字符串数组 (浮点数为最短可还原表示), 再一次性拼接写出
+    dates, times = format_datetimes(bars['datetime'])
+    columns = [dates, times] + [np.asarray(bars[name], dtype=np.float64).astype(str)
+                                for name in BAR_FIELDS]
+    lines = map(','.join, zip(*[col.tolist() for col in columns]))
+    with open(path, 'a' if append else 'w', newline='', encoding='utf-8') as f:
+        if not append:
+            f.write(','.join(COLS) + '\n')
+        f.writelines(line + '\n' for line in lines)
+
+
+def _frame(bars):
+    table = pd.DataFrame({'datetime': np.asarray(bars['datetime'], dtype='M8[ns]')})
+    for name in BAR_FIELDS:
+        table[name] = bars[name]
+    return table
+
+
+def write_parquet(bars, path):
+    _frame(bars).to_parquet(path, index=False)
+
+
+def write_feather(bars, path):
+    _frame(bars).to_feather(path)
+
+
+def _column_arrays(bars):
+    arrays = {'datetime': np.asarray(bars['datetime'], dtype='M8[ns]')}
+    for name in BAR_FIELDS:
+        arrays[name] = np.ascontiguousarray(bars[name], dtype=np.float64)
+    return arrays
+
+
+def _append_npy(path, arr):
+    """
+    在已有 .npy 文件末尾追加数据: 只改写头部的 shape, 头部长度变化时才整体重写
+    """
+    fmt = np.lib.format
+    with open(path, 'r+b') as f:
+        version = fmt.read_magic(f)
+        if version == (1, 0):
+            read_header, write_header = fmt.read_array_header_1_0, fmt.write_array_header_1_0
+        elif version == (2, 0):
+            read_header, write_header = fmt.read_array_header_2_0, fmt.write_array_header_2_0
+        else:
+            read_header = None
+
+        if read_header is not None:
+            shape, fortran, dtype = read_header(f)
+            data_offset = f.tell()
+            if dtype != arr.dtype or fortran or len(shape) != 1:
+                raise ValueError(f"{path} 与追加数据的类型不一致")
+
+            header = {'descr': fmt.dtype_to_descr(dtype),
+                      'fortran_order': False,
+                      'shape': (shape[0] + len(arr),)}
+            buf = io.BytesIO()
+            buf.write(fmt.magic(*version))
+            write_header(buf, header)
+
+        if read_header is not None and buf.tell() == data_offset:
+            f.seek(0)
+            f.write(buf.getvalue())
+            f.seek(0, os.SEEK_END)
+            f.write(arr.tobytes())
+            return
+
+    old = np.load(path)
+    np.save(path, np.concatenate([old, arr]))
+
+
+def write_npy_dir(bars, path, append=False):
+    os.makedirs(path, exist_ok=True)
+    for name, arr in _column_arrays(bars).items():
+        column_path = os.path.join(path, name + '.npy')
+        if append and os.path.exists(column_path):
+            _append_npy(column_path, arr)
+        else:
+            np.save(column_path, arr)
+
+
+def read_npy_dir(path, mmap_mode='r'):
+    """读取 write_npy_dir 写出的目录, 默认内存映射"""
+    bars = {'datetime': np.load(os.path.join(path, 'datetime.npy'), mmap_mode=mmap_mode)}
+    for name in BAR_FIELDS:
+        bars[name] = np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+    return bars
+
+
+def is_npy_dir(path):
+    return os.path.isdir(path) and os.path.isfile(os.path.join(path, 'datetime.npy'))
+
+
+def write_bars(bars, path, fmt='csv', append=False):
+    """按 fmt 写出列式 K 线; append 只对 APPENDABLE_FORMATS 有效"""
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的输出格式: {fmt}")
+    if append and fmt not in APPENDABLE_FORMATS:
+        raise ValueError(f"{fmt} 格式不支持续写")
+
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    if fmt == 'csv':
+        write_csv(bars, path, append)
+    elif fmt == 'npy':
+        write_npy_dir(bars, path, append)
+    elif fmt == 'parquet':
+        write_parquet(bars, path)
+    else:
+        write_feather(bars, path)
@@ -0,0 +1,282 @@
+"""
+批量回测: 策略 x 参数 x 品种 x 区间
+
+日常研究要把几个策略在每个关注的 ETF、几个时间窗口上都跑一遍, 以前只能挨个改
+各脚本的 __main__。这里用一份矩阵描述全部任务, 放到进程池里跑, 结果汇总成一张表:
+
+    jobs = job_matrix(
+        strategies=[('grid', dict(grid_type='absolute', grid_interval=0.001,
+                                  grid_levels=10, stake=800)),
+                    ('atr', expand(atr_period=[14], atr_multiplier=[1.5, 2.0]))],
+        symbols=['513310', '513300'],
+        windows=[('2025-08-05', '2025-09-05'), ('2025-09-05', '2025-10-31')])
+    table = run_batch(jobs, processes=None)   # DataFrame, 每个任务一行
+
+    python batch_runner.py                  # DEFAULT_MATRIX
+    python batch_runner.py matrix.json -j 4 -o batch_results.csv
+
+- 策略用 STRATEGIES 里的短名 (或 '文件:类名'), 子进程按名字自行加载脚本
+- 父进程经 bar_store 把每个品种覆盖全部窗口的 K 线取一次, 由进程池 initializer
+  传给每个子进程一次; 任务本身只带策略名、参数和区间, 子进程在内存里按区间切片
+- 同时在途的任务不超过 2 x 进程数, 每个任务只回传一条 RunSummary 记录,
+  主进程内存不随任务数增长
+- 单个任务出错只记在该行的 error 列, 不影响其他任务
+"""
+import argparse
+import contextlib
+import datetime
+import gc
+import importlib.util
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from array_feed import ArrayData, bt_timeframe
+from bar_store import default_store, normalize_symbol, parse_when
+from run_summary import RunSummary, SUMMARY_FIELDS, summary_record
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 短名 -> (脚本文件, 策略类名)
+STRATEGIES = {
+    'grid': ('Backtrader_text.py', 'GridStrategy'),
+    'atr': ('ATRChannelBreakout.py', 'ATRChannelBreakout'),
+    'bollinger': ('11.13.py', 'BollingerBandsStrategy'),
+    'dca': ('11.13.py', 'DailyDipDCA'),
+    'advanced_grid': ('11.13.py', 'AdvancedGridStrategy'),
+    'rsi': ('11.24.py', 'RSI_EMA_IntradayStrategy'),
+}
+
+# 每天的例行矩阵: 参数取各脚本主程序里的取值
+DEFAULT_MATRIX = {
+    'symbols': ['513310', '513300', '511700'],
+    'windows': [['2025-08-05', '2025-09-05'], ['2025-09-05', '2025-10-31']],
+    'cash': 1500000.0,
+    'commission': 0.00005,
+    'strategies': [
+        {'strategy': 'grid', 'params': {'grid_type': 'absolute', 'grid_interval': 0.001,
+                                        'grid_levels': 10, 'stake': 800}},
+        {'strategy': 'atr', 'params': {'atr_period': 14, 'stake': 1000,
+                                       'use_trailing_stop': True, 'trailing_percent': 0.03},
+         'grid': {'atr_multiplier': [1.5, 2.0, 2.5]}},
+        {'strategy': 'bollinger', 'stake': 1000, 'grid': {'period': [20, 60]}},
+        {'strategy': 'dca', 'params': {'base_amount': 45.0, 'dip_multiplier': 2.0}},
+    ],
+}
+
+RESULT_COLUMNS = ['job', 'strategy', 'symbol', 'start', 'end', 'params', 'bars'] + \
+    SUMMARY_FIELDS + ['seconds', 'error']
+
+
+def expand(**grid):
+    """{参数名: 候选值列表} -> 笛卡尔积的参数 dict 列表"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def job_matrix(strategies, symbols, windows, stake=None):
+    """
+    任务列表; strategies 为 (策略名, 参数 dict 或参数 dict 列表) 序列, windows 为
+    (start, end) 序列 (None 表示不限)。stake 不为 None 时加 FixedSize sizer
+    """
+    jobs = []
+    for name, params in strategies:
+        for p in ([params] if isinstance(params, dict) else params):
+            for symbol in symbols:
+                for start, end in windows:
+                    jobs.append(dict(strategy=name, params=dict(p),
+                                     symbol=normalize_symbol(symbol),
+                                     start=parse_when(start), end=parse_when(end),
+                                     stake=stake))
+    return jobs
+
+
+def matrix_jobs(matrix):
+    """DEFAULT_MATRIX 格式的 dict (或 JSON 文件内容) -> 任务列表"""
+    jobs = []
+    for entry in matrix['strategies']:
+        fixed = entry.get('params', {})
+        params = [dict(fixed, **p) for p in expand(**entry.get('grid', {}))]
+        jobs += job_matrix([(entry['strategy'], params)],
+                           entry.get('symbols', matrix['symbols']),
+                           entry.get('windows', matrix['windows']),
+                           stake=entry.get('stake'))
+    return jobs
+
+
+def load_data(jobs, freq='1min', store=None):
+    """每个品种取一次覆盖其全部任务区间的列式 K 线"""
+    store = store or default_store()
+    spans = {}
+    for job in jobs:
+        spans.setdefault(job['symbol'], []).append((job['start'], job['end']))
+    data = {}
+    for symbol, windows in spans.items():
+        starts = [s for s, _ in windows]
+        ends = [e for _, e in windows]
+        start = None if None in starts else min(pd.Timestamp(s) for s in starts)
+        end = None if None in ends else max(ends, key=pd.Timestamp)
+        bars = store.get_bars(symbol, start, end, freq, as_frame=False)
+        data[symbol] = {name: col for name, col in bars.items()
+                        if name in ('datetime', 'open', 'high', 'low', 'close', 'vol')}
+    return data
+
+
+# ---------------------------------------------------------------------------
+# 子进程
+
+_worker_data = None
+_strategies = {}
+
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+
+def resolve_strategy(name):
+    """STRATEGIES 短名或 '文件:类名' -> 策略类 (每个进程只加载一次脚本)"""
+    if name not in _strategies:
+        filename, cls = (STRATEGIES[name] if name in STRATEGIES else
+                         name.partition(':')[::2])
+        module_name = '_batch_' + os.path.splitext(filename)[0].replace('.', '_')
+        if module_name not in sys.modules:
+            spec = importlib.util.spec_from_file_location(module_name,
+                                                          os.path.join(ROOT, filename))
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+        _strategies[name] = getattr(sys.modules[module_name], cls)
+    return _strategies[name]
+
+
+def _bar_count(bars, start, end):
+    """区间 [start, end] 内的 K 线根数 (end 为日期时含当天)"""
+    dt = np.asarray(bars['datetime'], dtype='M8[ns]')
+    lo = 0 if start is None else np.searchsorted(dt, np.datetime64(pd.Timestamp(start)), 'left')
+    if end is None:
+        hi = len(dt)
+    elif isinstance(end, datetime.datetime):
+        hi = np.searchsorted(dt, np.datetime64(pd.Timestamp(end)), 'right')
+    else:
+        hi = np.searchsorted(dt, np.datetime64(pd.Timestamp(end) + pd.Timedelta(days=1)), 'left')
+    return int(max(0, hi - lo))
+
+
+def run_job(job, settings, data=None):
+    """跑一个任务, 返回一行结果 (出错时 error 列为异常信息)"""
+    data = _worker_data if data is None else data
+    record = dict(strategy=job['strategy'], symbol=job['symbol'],
+                  start=str(job['start'] or ''), end=str(job['end'] or ''),
+                  params=json.dumps(job['params'], sort_keys=True, ensure_ascii=False),
+                  error=None)
+    started = time.perf_counter()
+    try:
+        if not _bar_count(data[job['symbol']], job['start'], job['end']):
+            raise ValueError("区间内没有 K 线")
+        strategy = resolve_strategy(job['strategy'])
+        timeframe, compression = bt_timeframe(settings['freq'])
+        cerebro = bt.Cerebro(stdstats=False)
+        cerebro.adddata(ArrayData(dataname=data[job['symbol']], fromdate=job['start'],
+                                  todate=job['end'], timeframe=timeframe,
+                                  compression=compression))
+        cerebro.broker.setcash(settings['cash'])
+        cerebro.broker.setcommission(commission=settings['commission'])
+        if job.get('stake'):
+            cerebro.addsizer(bt.sizers.FixedSize, stake=job['stake'])
+        params = dict(job['params'])
+        if 'log_level' in strategy.params._getkeys():
+            params.setdefault('log_level', 'OFF')
+        cerebro.addstrategy(strategy, **params)
+        cerebro.addanalyzer(RunSummary, _name='summary')
+        # 个别策略 stop() 时总是打印汇总行, 批量运行时丢掉
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = cerebro.run()[0]
+        record['bars'] = len(result)
+        record.update(summary_record(result, []))
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+    record['seconds'] = time.perf_counter() - started
+    # 策略和指标之间有循环引用, 及时回收, 子进程内存不随任务数增长
+    gc.collect()
+    return record
+
+
+# ---------------------------------------------------------------------------
+# 调度
+
+def run_batch(jobs, processes=1, cash=1500000.0, commission=0.00005, freq='1min',
+              store=None, progress=True):
+    """
+    跑全部任务, 返回 RESULT_COLUMNS 列的 DataFrame (按任务顺序)
+    processes > 1 时用进程池 (None 为 CPU 核数)
+    """
+    settings = dict(cash=cash, commission=commission, freq=freq)
+    data = load_data(jobs, freq, store)
+    processes = processes or os.cpu_count() or 1
+    records = [None] * len(jobs)
+
+    def done(index, record):
+        record['job'] = index
+        records[index] = record
+        if progress:
+            count = sum(r is not None for r in records)
+            status = (record['error'] if record['error'] else
+                      f"收益 {record['total_return']:.2f}%")
+            print(f"[{count}/{len(jobs)}] {record['strategy']} {record['symbol']} "
+                  f"{record['start']}~{record['end']} {record['params']}: {status}")
+
+    if processes <= 1 or len(jobs) <= 1:
+        for index, job in enumerate(jobs):
+            done(index, run_job(job, settings, data))
+    else:
+        pending = {}
+        queue = iter(enumerate(jobs))
+        with ProcessPoolExecutor(max_workers=min(processes, len(jobs)),
+                                 initializer=_init_worker, initargs=(data,)) as pool:
+            # 在途任务数有上限, 不一次性提交全部
+            for index, job in itertools.islice(queue, processes * 2):
+                pending[pool.submit(run_job, job, settings)] = index
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    done(pending.pop(future), future.result())
+                    for index, job in itertools.islice(queue, 1):
+                        pending[pool.submit(run_job, job, settings)] = index
+
+    return pd.DataFrame(records, columns=RESULT_COLUMNS)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='批量回测: 策略 x 参数 x 品种 x 区间')
+    parser.add_argument('matrix', nargs='?', help='任务矩阵 JSON 文件 (格式同 DEFAULT_MATRIX)')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='进程数 (默认 CPU 核数)')
+    parser.add_argument('-o', '--output', default='batch_results.csv', help='结果 CSV')
+    parser.add_argument('--freq', default='1min')
+    args = parser.parse_args()
+
+    matrix = DEFAULT_MATRIX
+    if args.matrix:
+        with open(args.matrix, encoding='utf-8') as f:
+            matrix = json.load(f)
+    jobs = matrix_jobs(matrix)
+    print(f"共 {len(jobs)} 个任务")
+    started = time.perf_counter()
+    table = run_batch(jobs, args.processes, matrix.get('cash', 1500000.0),
+                      matrix.get('commission', 0.00005), args.freq)
+    print(f"\n用时 {time.perf_counter() - started:.1f} 秒, "
+          f"失败 {int(table['error'].notna().sum())} 个")
+    columns = ['strategy', 'symbol', 'start', 'end', 'params', 'total_return',
+               'max_drawdown', 'trade_count']
+    print(table[columns].to_string(index=False))
+    table.to_csv(args.output, index=False)
+    print(f"结果已保存到 {args.output}")
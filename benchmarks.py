@@ -0,0 +1,358 @@
+"""
+性能基准
+
+只用仓库里自带的数据文件, 测量:
+
+    lc1/<文件>        .lc1 解码 (tdx_reader.read_bars)
+    parse/<文件>      xlsx / csv / txt 不经缓存直接解析 (bar_cache.parse_source)
+    cached/<文件>     同一文件经 .bar_cache 缓存加载 (bar_cache.load_bars)
+    cerebro/<策略>    GridStrategy / ATRChannelBreakout / DailyDipDCA 各跑一次完整回测
+                      (DailyDipDCA 另有 -daily 一项, 用 11.13.py 主程序的日线数据)
+    optimize/numpy    11.24.py 的参数网格 (numpy 引擎)
+    optimize/cerebro  11.24.py 的参数网格 (cerebro optstrategy)
+
+每项重复若干次 (计时期间关闭 gc), 取最短时间为成绩; 单次不到 MIN_SAMPLE 秒的
+项每个样本连续调用多次再取平均 (同 timeit), 减小毫秒级基准的抖动。
+
+每次运行的结果连同提交号、Python/库版本追加到仓库目录下的 benchmark_history.json;
+与基线 (benchmark_baseline.json) 比较, 比基线慢 threshold 以上的项记为退化, 有退化时
+退出码为 1:
+
+    python benchmarks.py                     # 全部基准
+    python benchmarks.py --only lc1 cached   # 名称包含任一关键字的基准
+    python benchmarks.py --save-baseline     # 本次结果存为基线
+    python benchmarks.py --threshold 0.2     # 慢 20% 以上算退化 (默认 0.15)
+"""
+import argparse
+import contextlib
+import datetime
+import gc
+import importlib.util
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+import bar_cache
+import tdx_reader
+from array_feed import ArrayData
+from bar_store import get_bars
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# 与工作目录无关, 总在仓库目录下
+HISTORY_FILE = os.path.join(ROOT, 'benchmark_history.json')
+BASELINE_FILE = os.path.join(ROOT, 'benchmark_baseline.json')
+DEFAULT_THRESHOLD = 0.15
+MIN_SAMPLE = 0.05
+
+LC1_FILES = ('sh513300.lc1', 'sh511700场内货币.lc1')
+TABLE_FILES = ('sh513310.xlsx', 'my513300.csv', 'orcl-1995-2014.txt')
+GRID_DATA = 'sh513310.xlsx'
+DCA_DATA = 'sh511700场内货币.lc1'
+
+
+def _path(name):
+    return os.path.join(ROOT, name)
+
+
+def _load_script(filename):
+    """按文件加载 11.24.py 这类不能直接 import 的脚本"""
+    name = '_bench_' + os.path.splitext(filename)[0].replace('.', '_')
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, _path(filename))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+class Benchmark(object):
+    """setup() 做准备工作并返回被计时的函数, 该函数返回处理的 K 线根数"""
+
+    def __init__(self, name, setup, repeat=5):
+        self.name = name
+        self.setup = setup
+        self.repeat = repeat
+
+    @staticmethod
+    def _sample(fn, loops):
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(loops):
+                    items = fn()
+        finally:
+            elapsed = time.perf_counter() - start
+            gc.enable()
+        return elapsed / loops, items
+
+    def run(self, repeat=None):
+        fn = self.setup()
+        repeat = repeat or self.repeat
+        # 第一次调用: 够长就算作第一个样本, 否则只用来决定每个样本的调用次数
+        first, items = self._sample(fn, 1)
+        if first >= MIN_SAMPLE:
+            loops, times = 1, [first]
+        else:
+            loops, times = int(MIN_SAMPLE / max(first, 1e-6)) + 1, []
+        while len(times) < repeat:
+            elapsed, items = self._sample(fn, loops)
+            times.append(elapsed)
+        best = min(times)
+        return {
+            'min_s': best,
+            'median_s': statistics.median(times),
+            'repeat': len(times),
+            'loops': loops,
+            'bars': int(items or 0),
+            'bars_per_s': (items / best) if items and best else None,
+        }
+
+
+# ---------------------------------------------------------------------------
+# 各项基准
+
+def _lc1(filename):
+    path = _path(filename)
+
+    def setup():
+        def fn():
+            return len(tdx_reader.read_bars(path)['datetime'])
+        return fn
+    return setup
+
+
+def _parse(filename):
+    path = _path(filename)
+
+    def setup():
+        def fn():
+            return len(bar_cache.parse_source(path)['datetime'])
+        return fn
+    return setup
+
+
+def _cached(filename):
+    path = _path(filename)
+
+    def setup():
+        bar_cache.load_bars(path)     # 预热: 缓存文件不存在时先建好
+
+        def fn():
+            return len(bar_cache.load_bars(path)['datetime'])
+        return fn
+    return setup
+
+
+def _cerebro_run(strategy, bars, cash, commission, timeframe=bt.TimeFrame.Minutes, **params):
+    cerebro = bt.Cerebro()
+    cerebro.adddata(ArrayData(dataname=bars, timeframe=timeframe, compression=1))
+    cerebro.broker.setcash(cash)
+    cerebro.broker.setcommission(commission=commission)
+    cerebro.addstrategy(strategy, **params)
+    cerebro.run()
+    return len(bars['datetime'])
+
+
+def _grid_strategy():
+    # 参数同 Backtrader_text.py 主程序
+    strategy = _load_script('Backtrader_text.py').GridStrategy
+    bars = bar_cache.load_bars(_path(GRID_DATA))
+    return lambda: _cerebro_run(strategy, bars, 15000, 0.005, grid_type='absolute',
+                                grid_interval=0.001, grid_levels=10, stake=800)
+
+
+def _atr_strategy():
+    # 参数同 ATRChannelBreakout.py 主程序, 关闭逐笔日志
+    strategy = _load_script('ATRChannelBreakout.py').ATRChannelBreakout
+    bars = bar_cache.load_bars(_path(GRID_DATA))
+    return lambda: _cerebro_run(strategy, bars, 15000.0, 0.00005, atr_period=14,
+                                atr_multiplier=2.0, stake=1000, use_trailing_stop=True,
+                                trailing_percent=0.03, printlog=False)
+
+
+def _dca_strategy():
+    # 策略参数同 11.13.py 主程序, 关闭逐笔日志; 数据有意保留整个 .lc1 分钟线
+    # (主程序已改用日线), 作为逐分钟跑 DailyDipDCA 的负载, 与已有基线可比
+    strategy = _load_script('11.13.py').DailyDipDCA
+    bars = bar_cache.load_bars(_path(DCA_DATA))
+    return lambda: _cerebro_run(strategy, bars, 1500000, 0.00005, base_amount=45.0,
+                                dip_multiplier=2.0, print_log=False)
+
+
+def _dca_daily_strategy():
+    # 同 11.13.py 主程序: 511700 分钟线合成的日线 (bar_store 缓存合成结果)
+    strategy = _load_script('11.13.py').DailyDipDCA
+    bars = get_bars('511700', datetime.datetime(2025, 7, 5), datetime.datetime(2025, 11, 6),
+                    freq='D', as_frame=False)
+    return lambda: _cerebro_run(strategy, bars, 1500000, 0.00005, bt.TimeFrame.Days,
+                                base_amount=45.0, dip_multiplier=2.0, print_log=False)
+
+
+def _optimize_numpy():
+    script = _load_script('11.24.py')
+    return lambda: len(script.run_vectorized_optimization())
+
+
+def _optimize_cerebro():
+    script = _load_script('11.24.py')
+    df = script.get_bars('513310', script.START, script.END)
+    return lambda: len(script.run_optimization(df, results_file=None))
+
+
+BENCHMARKS = (
+    [Benchmark('lc1/' + f, _lc1(f)) for f in LC1_FILES] +
+    [Benchmark('parse/' + f, _parse(f), repeat=3 if f.endswith('.xlsx') else 5)
+     for f in TABLE_FILES] +
+    [Benchmark('cached/' + f, _cached(f)) for f in TABLE_FILES] +
+    [
+        Benchmark('cerebro/GridStrategy', _grid_strategy, repeat=3),
+        Benchmark('cerebro/ATRChannelBreakout', _atr_strategy, repeat=3),
+        Benchmark('cerebro/DailyDipDCA', _dca_strategy, repeat=3),
+        Benchmark('cerebro/DailyDipDCA-daily', _dca_daily_strategy),
+        Benchmark('optimize/numpy', _optimize_numpy, repeat=3),
+        Benchmark('optimize/cerebro', _optimize_cerebro, repeat=1),
+    ]
+)
+
+
+# ---------------------------------------------------------------------------
+# 记录与比较
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                             capture_output=True, text=True, timeout=30)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               cwd=ROOT, capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if out.returncode != 0:
+        return None
+    return out.stdout.strip() + ('-dirty' if dirty.stdout.strip() else '')
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'backtrader': bt.__version__,
+    }
+
+
+def run_benchmarks(only=None, repeat=None):
+    """运行 (名称包含 only 中任一关键字的) 基准, 返回一条运行记录"""
+    selected = [b for b in BENCHMARKS
+                if not only or any(key in b.name for key in only)]
+    results = {}
+    for bench in selected:
+        result = bench.run(repeat)
+        results[bench.name] = result
+        print(f"{bench.name:<36} {result['min_s'] * 1000:10.2f} ms  "
+              f"(中位 {result['median_s'] * 1000:.2f} ms, {result['repeat']} 次)")
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'environment': environment(),
+        'results': results,
+    }
+
+
+def load_history(path=HISTORY_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def append_history(run, path=HISTORY_FILE):
+    history = load_history(path)
+    history.append(run)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, indent=1)
+    return history
+
+
+def compare(run, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    逐项比较 min_s, 返回 DataFrame (name / baseline_ms / current_ms / ratio / status);
+    status: regression (慢 threshold 以上) / faster / ok / new (基线中没有)
+    """
+    rows = []
+    for name, result in run['results'].items():
+        base = baseline['results'].get(name)
+        row = {'name': name, 'current_ms': result['min_s'] * 1000}
+        if base is None:
+            row.update(baseline_ms=None, ratio=None, status='new')
+        else:
+            ratio = result['min_s'] / base['min_s'] if base['min_s'] else None
+            if ratio is None:
+                status = 'ok'
+            elif ratio > 1 + threshold:
+                status = 'regression'
+            elif ratio < 1 - threshold:
+                status = 'faster'
+            else:
+                status = 'ok'
+            row.update(baseline_ms=base['min_s'] * 1000, ratio=ratio, status=status)
+        rows.append(row)
+    return pd.DataFrame(rows, columns=['name', 'baseline_ms', 'current_ms', 'ratio', 'status'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="用仓库自带数据跑性能基准")
+    parser.add_argument("--only", nargs='+', default=None,
+                        help="只跑名称包含这些关键字的基准 (如 lc1 cached cerebro)")
+    parser.add_argument("--repeat", type=int, default=None, help="覆盖每项的重复次数")
+    parser.add_argument("--history", default=HISTORY_FILE, help="结果历史 JSON")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="基线 JSON")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果存为基线")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="比基线慢多少 (比例) 算退化")
+    parser.add_argument("--list", action="store_true", help="只列出基准名称")
+    args = parser.parse_args()
+
+    if args.list:
+        for bench in BENCHMARKS:
+            print(bench.name)
+        sys.exit(0)
+
+    run = run_benchmarks(args.only, args.repeat)
+    append_history(run, args.history)
+    print(f"\n结果已追加到 {args.history}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(run, f, ensure_ascii=False, indent=1)
+        print(f"已存为基线 {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"没有基线 {args.baseline}, 用 --save-baseline 保存")
+        sys.exit(0)
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('environment') != run['environment']:
+        print("注意: 基线与本次的运行环境 (机器/Python/库版本) 不同, 比较结果仅供参考")
+    table = compare(run, baseline, args.threshold)
+    print(f"\n与基线比较 (基线 {baseline.get('commit')} @ {baseline.get('timestamp')}, "
+          f"阈值 {args.threshold:.0%}):")
+    print(table.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    regressions = table[table['status'] == 'regression']
+    if len(regressions):
+        print(f"\n{len(regressions)} 项退化: {', '.join(regressions['name'])}")
+        sys.exit(1)
@@ -0,0 +1,207 @@
+"""
+策略结构化事件日志
+
+各策略的 log() 原来都是 print(f-string): 分钟线上打开日志时控制台 I/O 占了大部分
+运行时间, 输出也只能看不能分析。EventLog 把日志换成带字段的事件:
+
+    events.info('fill', 'BUY EXECUTED, Price: {price:.4f}', side='buy', price=1.234,
+                size=800, value=987.2, comm=0.05)
+
+    - 按级别过滤 (DEBUG < INFO < WARNING), 未启用的级别在格式化之前直接返回;
+      时间戳由 clock() 在启用时才取
+    - 控制台行立即打印 (异常中断时不丢失, 长时间运行也不滞后); 文件事件先缓存在
+      内存里, 攒够 batch_size 条或 close() 时一次写出
+    - 文件格式由扩展名决定: .jsonl 每行一个事件; .csv / .parquet 为列式, 常用字段
+      (side / price / size / value / comm / pnl / pnlcomm / close) 为有类型的列,
+      其余字段放在 extra 列 (JSON); parquet 需要 pyarrow
+    - read_events(path) 读回 DataFrame 供事后分析
+
+策略继承 LoggedStrategy 即可得到 self.events (start 时创建, stop 时写出); 控制台
+开关沿用各策略已有的 printlog / print_log 参数, 另有 log_level / log_file 参数。
+参数优化时多个进程同时运行, 不要设置 log_file。
+"""
+import json
+
+import backtrader as bt
+import pandas as pd
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+OFF = 100
+
+LEVELS = {'DEBUG': DEBUG, 'INFO': INFO, 'WARNING': WARNING, 'OFF': OFF}
+LEVEL_NAMES = {v: k for k, v in LEVELS.items()}
+
+# 列式文件中有类型的字段, 其余字段进 extra
+FLOAT_FIELDS = ('price', 'size', 'value', 'comm', 'pnl', 'pnlcomm', 'close')
+COLUMNS = ['dt', 'strategy', 'level', 'kind', 'side'] + list(FLOAT_FIELDS) + ['extra']
+FORMATS = ('jsonl', 'csv', 'parquet')
+
+
+def _level(level):
+    if isinstance(level, str):
+        return LEVELS[level.upper()]
+    return int(level)
+
+
+def _format_of(path):
+    fmt = path.rsplit('.', 1)[-1].lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的事件日志格式: {path} (可选 {', '.join(FORMATS)})")
+    return fmt
+
+
+def _plain(value):
+    # numpy / backtrader 数值 -> Python 标量
+    item = getattr(value, 'item', None)
+    return item() if callable(item) else value
+
+
+def to_frame(events):
+    """事件 dict 列表 -> COLUMNS 列的 DataFrame"""
+    known = set(COLUMNS)
+    rows = []
+    for event in events:
+        row = {name: event.get(name) for name in COLUMNS[:-1]}
+        extra = {k: _plain(v) for k, v in event.items() if k not in known}
+        row['extra'] = json.dumps(extra, ensure_ascii=False, default=str) if extra else None
+        rows.append(row)
+    frame = pd.DataFrame(rows, columns=COLUMNS)
+    frame['dt'] = pd.to_datetime(frame['dt'])
+    for name in FLOAT_FIELDS:
+        frame[name] = pd.to_numeric(frame[name]).astype('float64')
+    for name in ('strategy', 'level', 'kind', 'side', 'extra'):
+        frame[name] = frame[name].astype(object)
+    return frame
+
+
+def read_events(path):
+    """读回事件文件, 返回 DataFrame (jsonl 为各事件原有字段)"""
+    fmt = _format_of(path)
+    if fmt == 'jsonl':
+        return pd.read_json(path, lines=True, convert_dates=['dt'])
+    if fmt == 'csv':
+        return pd.read_csv(path, parse_dates=['dt'])
+    return pd.read_parquet(path)
+
+
+class EventLog(object):
+    """
+    结构化事件日志; console 为是否打印, path 为事件文件 (None 不写文件)
+    两者都没有时相当于关闭, 所有调用立即返回
+    """
+
+    def __init__(self, level=INFO, console=True, path=None, clock=None, source=None,
+                 console_format='{dt:%Y-%m-%dT%H:%M:%S}, {message}', batch_size=1000):
+        self.level = _level(level) if (console or path) else OFF
+        self.console = console
+        self.path = path
+        self.clock = clock
+        self.source = source
+        self.console_format = console_format
+        self.batch_size = batch_size
+        self.count = 0
+        self._events = []
+        self._fmt = _format_of(path) if path else None
+        self._started = False
+        self._parquet = None
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, kind, template=None, echo=False, **fields):
+        """
+        记录一个事件; template 为控制台消息模板 (str.format, 引用 fields 中的字段),
+        echo=True 时无论级别和控制台开关都打印
+        """
+        if level < self.level and not echo:
+            return
+        dt = self.clock() if self.clock is not None else None
+        self.count += 1
+        if (self.console and level >= self.level) or echo:
+            message = template.format(**fields) if template else kind
+            print(self.console_format.format(
+                dt=dt, message=message, kind=kind, level=LEVEL_NAMES.get(level, level)))
+        if self._fmt is not None and level >= self.level:
+            event = {'dt': dt, 'strategy': self.source,
+                     'level': LEVEL_NAMES.get(level, level), 'kind': kind}
+            event.update(fields)
+            self._events.append(event)
+            if len(self._events) >= self.batch_size:
+                self._flush_file()
+
+    def debug(self, kind, template=None, **fields):
+        if DEBUG >= self.level:
+            self.log(DEBUG, kind, template, **fields)
+
+    def info(self, kind, template=None, **fields):
+        if INFO >= self.level:
+            self.log(INFO, kind, template, **fields)
+
+    def warning(self, kind, template=None, **fields):
+        if WARNING >= self.level:
+            self.log(WARNING, kind, template, **fields)
+
+    def _flush_file(self):
+        if not self._events:
+            return
+        events, self._events = self._events, []
+        if self._fmt == 'jsonl':
+            with open(self.path, 'a' if self._started else 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps({k: _plain(v) for k, v in e.items()},
+                                        ensure_ascii=False, default=str) + '\n'
+                             for e in events)
+        elif self._fmt == 'csv':
+            to_frame(events).to_csv(self.path, mode='a' if self._started else 'w',
+                                    header=not self._started, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            schema = pa.schema(
+                [('dt', pa.timestamp('ns'))] +
+                [(name, pa.string()) for name in ('strategy', 'level', 'kind', 'side')] +
+                [(name, pa.float64()) for name in FLOAT_FIELDS] + [('extra', pa.string())])
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, schema)
+            self._parquet.write_table(pa.Table.from_pandas(to_frame(events), schema=schema,
+                                                           preserve_index=False))
+        self._started = True
+
+    def flush(self):
+        self._flush_file()
+
+    def close(self):
+        self.flush()
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+
+
+class LoggedStrategy(bt.Strategy):
+    """
+    带 self.events 的策略基类; 子类的 start/stop 需调用父类方法
+    console_format 为控制台行格式 (可用 dt / message / kind / level)
+    """
+
+    params = (
+        ('log_level', 'INFO'),    # DEBUG 时另记每根 K 线的事件
+        ('log_file', None),       # 事件文件 (.jsonl / .csv / .parquet), None 不写
+    )
+
+    console_format = '{dt:%Y-%m-%dT%H:%M:%S}, {message}'
+
+    def _console_enabled(self):
+        for name in ('printlog', 'print_log'):
+            if name in self.params._getkeys():
+                return getattr(self.params, name)
+        return True
+
+    def start(self):
+        data = self.datas[0]
+        self.events = EventLog(level=self.p.log_level, console=self._console_enabled(),
+                               path=self.p.log_file, clock=lambda: data.datetime.datetime(0),
+                               source=type(self).__name__, console_format=self.console_format)
+
+    def stop(self):
+        self.events.close()
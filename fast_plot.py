@@ -0,0 +1,325 @@
+"""
+长周期分钟线回测的快速出图
+
+cerebro.plot() 逐根画出全部 K 线和观察器, 四个月分钟线要画几万根蜡烛, 很慢且需要
+图形界面。这里只记录必要的序列, 降采样后直接写文件, 不需要显示器:
+
+    fast_plot.attach(cerebro)                       # run 之前
+    strategy = cerebro.run()[0]
+    fast_plot.save(strategy, 'result.png')          # 或 .svg / .html
+
+- 价格 (收盘价) 和总资产用 LTTB (Largest-Triangle-Three-Buckets) 降到 max_points
+  个点, 保留峰谷形状; 另画每段最高/最低价的区间带, 降采样不会抹掉影线极值
+- 回撤由完整的总资产序列算出后再降采样
+- 买卖标记来自成交订单, 全部按实际成交时间和价格画出, 不降采样
+- 横轴为 K 线序号 (与 cerebro.plot 相同, 跳过午休和隔夜), 刻度标日期
+- .png / .svg 用 matplotlib Agg 画布, 不经 pyplot、不切换后端;
+  .html 为自带脚本的单文件 (滚轮缩放、拖动平移、悬停看成交), 不依赖外部资源
+
+出图耗时只取决于 max_points 和成交笔数, 与回测 K 线根数基本无关。
+"""
+import json
+from array import array
+
+import backtrader as bt
+import numpy as np
+
+MAX_POINTS = 2000
+
+
+def lttb(y, n_out, x=None):
+    """
+    Largest-Triangle-Three-Buckets 降采样, 返回保留点的下标 (升序, 含首尾)
+    x 为 None 时按等间距处理
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+
+    # 首尾之外的 n - 2 个点均分成 n_out - 2 个桶
+    edges = np.r_[np.linspace(1, n - 1, n_out - 1).astype(np.int64), n]
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0] = 0
+    picked[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 下一个桶的均值点 (最后一个桶的下一个为末点)
+        nx = x[edges[i + 1]:edges[i + 2]].mean()
+        ny = np.nanmean(y[edges[i + 1]:edges[i + 2]]) if edges[i + 2] > edges[i + 1] else y[-1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - nx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (ny - ay))
+        area[np.isnan(area)] = -1.0
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+    return picked
+
+
+def envelope(high, low, n_out):
+    """把序列均分成最多 n_out 段, 返回 (每段起点下标, 段内最高, 段内最低)"""
+    n = len(high)
+    starts = np.unique(np.linspace(0, n, min(n, n_out), endpoint=False).astype(np.int64))
+    return (starts, np.fmax.reduceat(np.asarray(high, dtype=np.float64), starts),
+            np.fmin.reduceat(np.asarray(low, dtype=np.float64), starts))
+
+
+class PlotRecorder(bt.Analyzer):
+    """逐根 K 线记录总资产, 并记下每笔成交 (数据源序号、时间、价格、数量)"""
+
+    def start(self):
+        self._value = array('d')
+        self._dt = array('d')
+        self._index = {id(data): i for i, data in enumerate(self.strategy.datas)}
+        self.fills = []
+
+    def notify_order(self, order):
+        if order.status != order.Completed:
+            return
+        self.fills.append(dict(data=self._index.get(id(order.data), 0),
+                               dt=order.executed.dt, price=order.executed.price,
+                               size=order.executed.size,
+                               side='buy' if order.isbuy() else 'sell'))
+
+    def next(self):
+        self._dt.append(self.strategy.datetime[0])
+        self._value.append(self.strategy.broker.getvalue())
+
+    def stop(self):
+        self.rets['value'] = np.asarray(self._value)
+        self.rets['dt'] = np.asarray(self._dt)
+        self.rets['fills'] = self.fills
+
+
+def attach(cerebro, name='plot'):
+    """给 cerebro 挂上 PlotRecorder (需在 run 之前调用)"""
+    cerebro.addanalyzer(PlotRecorder, _name=name)
+
+
+def _line(line, size):
+    return np.frombuffer(line.array, dtype=np.float64)[-size:] if size else np.empty(0)
+
+
+def collect(strategy, max_points=MAX_POINTS, name='plot'):
+    """
+    从跑完的策略取出降采样后的序列, 返回可直接 JSON 化的 dict:
+    dates (刻度用) / prices (各数据源) / equity / drawdown / fills
+    """
+    recorded = getattr(strategy.analyzers, name).get_analysis()
+    dtnum = recorded['dt']
+    n = len(dtnum)
+
+    prices = []
+    for i, data in enumerate(strategy.datas):
+        size = min(len(data), n)
+        close = _line(data.close, size)
+        keep = lttb(close, max_points)
+        starts, high, low = envelope(_line(data.high, size), _line(data.low, size),
+                                     max_points)
+        fills = [f for f in recorded['fills'] if f['data'] == i]
+        # 成交时间 -> K 线序号 (取该时刻或之后的第一根)
+        fill_x = np.searchsorted(dtnum, [f['dt'] for f in fills], 'left')
+        prices.append(dict(
+            name=data._name or f"data{i}",
+            x=keep.tolist(), close=close[keep].tolist(),
+            band_x=starts.tolist(), high=high.tolist(), low=low.tolist(),
+            fills=[dict(x=int(x), price=f['price'], size=f['size'], side=f['side'],
+                        dt=bt.num2date(f['dt']).strftime('%Y-%m-%d %H:%M'))
+                   for x, f in zip(fill_x, fills)]))
+
+    value = recorded['value']
+    peak = np.maximum.accumulate(value) if n else value
+    drawdown = (value / peak - 1.0) * 100 if n else value
+    keep_value = lttb(value, max_points)
+    keep_dd = lttb(drawdown, max_points)
+    # 刻度用的日期: 均匀取最多 max_points 个
+    ticks = np.unique(np.linspace(0, max(n - 1, 0), min(n, max_points)).astype(np.int64))
+    return dict(
+        title=type(strategy).__name__, bars=n,
+        dates=dict(x=ticks.tolist(),
+                   text=[bt.num2date(dtnum[i]).strftime('%Y-%m-%d %H:%M') for i in ticks]),
+        prices=prices,
+        equity=dict(x=keep_value.tolist(), y=value[keep_value].tolist()),
+        drawdown=dict(x=keep_dd.tolist(), y=drawdown[keep_dd].tolist()),
+    )
+
+
+def _date_formatter(dates):
+    from matplotlib.ticker import FuncFormatter
+    x = np.asarray(dates['x'])
+    text = dates['text']
+
+    def fmt(value, pos=None):
+        if not len(x):
+            return ''
+        i = min(int(np.searchsorted(x, value)), len(x) - 1)
+        return text[i][:10] if value >= 0 else ''
+    return FuncFormatter(fmt)
+
+
+def render_figure(series, figsize=(16, 10), dpi=100):
+    """
+    collect() 的结果 -> matplotlib Figure (Agg 画布, 不需要图形界面)
+    无图形界面的机器上一般没有中文字体, 图中文字用英文 (同 模拟网格交易.py)
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    n_price = len(series['prices'])
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(n_price + 2, 1, sharex=True,
+                        gridspec_kw=dict(height_ratios=[3] * n_price + [2, 1]))
+    for ax, price in zip(axes, series['prices']):
+        ax.fill_between(price['band_x'], price['low'], price['high'], step='post',
+                        color='0.85', linewidth=0, label='high/low')
+        ax.plot(price['x'], price['close'], color='0.25', linewidth=0.8, label='close')
+        for side, marker, color in (('buy', '^', 'red'), ('sell', 'v', 'green')):
+            fills = [f for f in price['fills'] if f['side'] == side]
+            if fills:
+                ax.scatter([f['x'] for f in fills], [f['price'] for f in fills],
+                           marker=marker, color=color, s=30, zorder=3,
+                           label=side)
+        ax.set_ylabel(price['name'])
+        ax.legend(loc='upper left', fontsize=8)
+        ax.grid(True, alpha=0.3)
+
+    ax_value, ax_dd = axes[-2], axes[-1]
+    ax_value.plot(series['equity']['x'], series['equity']['y'], color='tab:blue',
+                  linewidth=0.9)
+    ax_value.set_ylabel('value')
+    ax_value.grid(True, alpha=0.3)
+    ax_dd.fill_between(series['drawdown']['x'], series['drawdown']['y'], 0,
+                       color='tab:red', alpha=0.4, linewidth=0)
+    ax_dd.set_ylabel('drawdown %')
+    ax_dd.grid(True, alpha=0.3)
+    ax_dd.xaxis.set_major_formatter(_date_formatter(series['dates']))
+    fig.suptitle(f"{series['title']} ({series['bars']} bars)")
+    fig.tight_layout()
+    return fig
+
+
+_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>%(title)s</title>
+<style>
+body { font: 12px sans-serif; margin: 8px; }
+canvas { display: block; border: 1px solid #ddd; margin-bottom: 4px; }
+#tip { position: absolute; background: #fff; border: 1px solid #999; padding: 2px 4px;
+       pointer-events: none; display: none; }
+</style></head><body>
+<div>%(title)s &mdash; 滚轮缩放, 拖动平移, 双击复位</div>
+<div id="panels"></div><div id="tip"></div>
+<script>
+const S = %(data)s;
+const W = Math.max(800, window.innerWidth - 40);
+const panels = [];
+S.prices.forEach(p => panels.push({h: 260, name: p.name, price: p}));
+panels.push({h: 160, name: '总资产', line: S.equity, color: '#1f77b4'});
+panels.push({h: 100, name: '回撤 %%', line: S.drawdown, color: '#d62728', area: true});
+let x0 = 0, x1 = Math.max(S.bars - 1, 1);
+const L = 70, R = 10;
+function sx(x) { return L + (x - x0) / (x1 - x0) * (W - L - R); }
+function inView(xs) { let lo = 0, hi = xs.length;
+  while (lo < hi && xs[lo] < x0) lo++; while (hi > lo && xs[hi - 1] > x1) hi--;
+  return [Math.max(lo - 1, 0), Math.min(hi + 1, xs.length)]; }
+function range(vals) { let lo = Infinity, hi = -Infinity;
+  vals.forEach(v => { if (v < lo) lo = v; if (v > hi) hi = v; });
+  if (!(hi > lo)) { hi = lo + 1; } const pad = (hi - lo) * 0.05; return [lo - pad, hi + pad]; }
+function draw() {
+  panels.forEach(p => {
+    const c = p.canvas, g = c.getContext('2d'), H = p.h;
+    g.clearRect(0, 0, W, H);
+    let ys = [];
+    if (p.price) { const [a, b] = inView(p.price.band_x);
+      ys = p.price.high.slice(a, b).concat(p.price.low.slice(a, b));
+      p.price.fills.forEach(f => { if (f.x >= x0 && f.x <= x1) ys.push(f.price); });
+    } else { const [a, b] = inView(p.line.x); ys = p.line.y.slice(a, b); if (p.area) ys.push(0); }
+    const [lo, hi] = range(ys);
+    const sy = y => H - 15 - (y - lo) / (hi - lo) * (H - 25);
+    p.sy = sy;
+    g.strokeStyle = '#eee'; g.fillStyle = '#666';
+    for (let k = 0; k <= 4; k++) { const v = lo + (hi - lo) * k / 4, y = sy(v);
+      g.beginPath(); g.moveTo(L, y); g.lineTo(W - R, y); g.stroke(); g.fillText(v.toFixed(3), 2, y + 4); }
+    const path = (xs, vals) => { const [a, b] = inView(xs); g.beginPath();
+      for (let i = a; i < b; i++) { const X = sx(xs[i]), Y = sy(vals[i]);
+        i === a ? g.moveTo(X, Y) : g.lineTo(X, Y); } return [a, b]; };
+    if (p.price) {
+      const q = p.price, [a, b] = inView(q.band_x);
+      g.fillStyle = '#ddd'; g.beginPath();
+      for (let i = a; i < b; i++) g.lineTo(sx(q.band_x[i]), sy(q.high[i]));
+      for (let i = b - 1; i >= a; i--) g.lineTo(sx(q.band_x[i]), sy(q.low[i]));
+      g.fill();
+      g.strokeStyle = '#444'; path(q.x, q.close); g.stroke();
+      q.fills.forEach(f => { if (f.x < x0 || f.x > x1) return;
+        const X = sx(f.x), Y = sy(f.price), d = f.side === 'buy' ? 1 : -1;
+        g.fillStyle = f.side === 'buy' ? 'red' : 'green'; g.beginPath();
+        g.moveTo(X, Y); g.lineTo(X - 5, Y + 9 * d); g.lineTo(X + 5, Y + 9 * d); g.fill(); });
+    } else {
+      g.strokeStyle = p.color; const [a, b] = path(p.line.x, p.line.y);
+      if (p.area && b > a) { g.lineTo(sx(p.line.x[b - 1]), sy(0)); g.lineTo(sx(p.line.x[a]), sy(0));
+        g.fillStyle = 'rgba(214,39,40,0.4)'; g.fill(); } else { g.stroke(); }
+    }
+    g.fillStyle = '#000'; g.fillText(p.name, L + 4, 12);
+  });
+  const last = panels[panels.length - 1], g = last.canvas.getContext('2d');
+  g.fillStyle = '#666';
+  for (let k = 0; k <= 6; k++) { const x = x0 + (x1 - x0) * k / 6;
+    let i = 0; while (i < S.dates.x.length - 1 && S.dates.x[i] < x) i++;
+    g.fillText((S.dates.text[i] || '').slice(0, 16), Math.min(sx(x), W - 100), last.h - 2); }
+}
+const root = document.getElementById('panels'), tip = document.getElementById('tip');
+panels.forEach(p => { const c = document.createElement('canvas'); c.width = W; c.height = p.h;
+  p.canvas = c; root.appendChild(c);
+  c.addEventListener('wheel', e => { e.preventDefault();
+    const k = e.deltaY > 0 ? 1.25 : 0.8, m = x0 + (e.offsetX - L) / (W - L - R) * (x1 - x0);
+    x0 = Math.max(0, m - (m - x0) * k); x1 = Math.min(S.bars - 1, m + (x1 - m) * k);
+    if (x1 - x0 < 10) x1 = x0 + 10; draw(); });
+  let drag = null;
+  c.addEventListener('mousedown', e => drag = [e.offsetX, x0, x1]);
+  window.addEventListener('mouseup', () => drag = null);
+  c.addEventListener('dblclick', () => { x0 = 0; x1 = Math.max(S.bars - 1, 1); draw(); });
+  c.addEventListener('mousemove', e => {
+    if (drag) { const dx = (drag[0] - e.offsetX) / (W - L - R) * (drag[2] - drag[1]);
+      const span = drag[2] - drag[1];
+      x0 = Math.min(Math.max(0, drag[1] + dx), Math.max(S.bars - 1 - span, 0)); x1 = x0 + span; draw(); return; }
+    tip.style.display = 'none';
+    if (!p.price) return;
+    let best = null, bd = 8;
+    p.price.fills.forEach(f => { const d = Math.hypot(sx(f.x) - e.offsetX, p.sy(f.price) - e.offsetY);
+      if (d < bd) { bd = d; best = f; } });
+    if (best) { tip.style.display = 'block'; tip.style.left = (e.pageX + 12) + 'px';
+      tip.style.top = (e.pageY + 12) + 'px';
+      tip.textContent = `${best.dt} ${best.side === 'buy' ? '买入' : '卖出'} ${best.size} @ ${best.price}`; }
+  });
+});
+draw();
+</script></body></html>
+"""
+
+
+def write_html(series, path):
+    """collect() 的结果 -> 单文件交互式 HTML"""
+    html = _HTML % dict(title=series['title'],
+                        data=json.dumps(series, ensure_ascii=False, separators=(',', ':')))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(html)
+
+
+def save(strategy, path, max_points=MAX_POINTS, title=None, name='plot'):
+    """
+    降采样出图; path 的扩展名决定格式 (.png / .svg / .pdf / .html), 可传多个路径
+    (列表) 一次写出, 返回 collect() 的结果
+    """
+    series = collect(strategy, max_points, name)
+    if title:
+        series['title'] = title
+    fig = None
+    for p in ([path] if isinstance(path, str) else path):
+        if p.lower().endswith('.html'):
+            write_html(series, p)
+        else:
+            if fig is None:
+                fig = render_figure(series)
+            fig.savefig(p)
+    return series
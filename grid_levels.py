@@ -0,0 +1,151 @@
+"""
+有序网格价位索引
+
+GridStrategy 原来每根 K 线遍历全部网格价位, 逐个 round(price, 3) 查集合、算容差,
+再对候选排序; 网格一密 (0.001 间距上千层) 每根 K 线就是上千次 Python 运算。
+
+GridLevels 把价位排好序, 已触发状态按整数 tick (round(price, 3) 对应的 0.001 个数)
+记在数组里:
+
+    - 触发判定 "|现价 - 价位| <= 容差, 或价位落在 (上根收盘, 现价] 之间" 在现价两侧
+      各是一段紧挨现价的连续价位, 距现价最近的候选一定是两侧各自最近的未触发价位
+    - 现价的位置二分查找; "最近的未触发价位" 用两组跳转指针 (带路径压缩) 跳过已
+      触发的价位, 价位触发后不会恢复, 指针只需单向合并
+
+每根 K 线的开销与网格层数无关 (二分为 O(log n), 跳转均摊近似 O(1))。选出的价位和
+遍历写法逐位一致: 同距离时取价格较低者 (与稳定排序相同)。
+
+PriceBuckets 是按价格分桶的挂单索引, 供网格策略查重挂单, 不必每根 K 线遍历
+broker.orders (其中保留了全部历史订单)。
+"""
+import bisect
+from array import array
+
+
+class GridLevels(object):
+    """
+    有序网格价位; key 为 round(price, 3), 同 key 的价位一起触发
+    """
+
+    def __init__(self, prices, decimals=3):
+        self.prices = sorted(float(p) for p in prices)
+        self.decimals = decimals
+        scale = 10 ** decimals
+        self.ticks = array('q', [int(round(round(p, decimals) * scale)) for p in self.prices])
+        n = len(self.prices)
+        # _down[i]: i 及以下最近的未触发下标 (-1 为没有); _up[i]: i 及以上 (n 为没有)
+        self._down = array('q', range(n))
+        self._up = array('q', range(n))
+        self.active = set()     # 已触发的 key
+
+    def __len__(self):
+        return len(self.prices)
+
+    def key(self, index):
+        return round(self.prices[index], self.decimals)
+
+    def _find_down(self, i):
+        down = self._down
+        root = i
+        while root >= 0 and down[root] != root:
+            root = down[root]
+        while i >= 0 and down[i] != i:
+            down[i], i = root, down[i]
+        return root
+
+    def _find_up(self, i):
+        up = self._up
+        n = len(up)
+        root = i
+        while root < n and up[root] != root:
+            root = up[root]
+        while i < n and up[i] != i:
+            up[i], i = root, up[i]
+        return root
+
+    def deactivate(self, index):
+        """触发 index 所在 key 的全部价位, 返回 key"""
+        tick = self.ticks[index]
+        lo = bisect.bisect_left(self.ticks, tick)
+        hi = bisect.bisect_right(self.ticks, tick)
+        for i in range(lo, hi):
+            self._down[i] = i - 1
+            self._up[i] = i + 1
+        key = self.key(index)
+        self.active.add(key)
+        return key
+
+    def crossed(self, current, previous, tolerance):
+        """
+        本根 K 线触发的价位下标 (未触发价位中满足条件且距 current 最近者), 没有则
+        返回 None; previous 为上根收盘价, 第一根 K 线传 None
+        """
+        def hit(price):
+            if abs(current - price) <= tolerance:
+                return True
+            return previous is not None and (previous < price <= current or
+                                             previous > price >= current)
+
+        pos = bisect.bisect_right(self.prices, current)
+        below = self._find_down(pos - 1) if pos > 0 else -1
+        above = self._find_up(pos) if pos < len(self.prices) else len(self.prices)
+
+        best = None
+        if below >= 0 and hit(self.prices[below]):
+            best = below
+        if above < len(self.prices) and hit(self.prices[above]):
+            # 同距离时取价格较低的 (below)
+            if best is None or abs(current - self.prices[above]) < abs(current - self.prices[best]):
+                best = above
+        return best
+
+
+class PriceBuckets(object):
+    """
+    按价格分桶的挂单索引: 桶号为 floor(price / tick), 桶内为 {order.ref: order}
+    查 "是否有挂单价与 price 相差小于 distance" 只看覆盖该区间的几个桶, 与历史
+    订单总数无关
+    """
+
+    def __init__(self, tick=0.001):
+        self.tick = tick
+        self._buckets = {}
+        self._bucket_of = {}    # ref -> 桶号
+
+    def __len__(self):
+        return len(self._bucket_of)
+
+    def __contains__(self, order):
+        return order.ref in self._bucket_of
+
+    def add(self, order):
+        if order.ref in self._bucket_of:
+            return
+        bucket = int(order.price // self.tick)
+        self._buckets.setdefault(bucket, {})[order.ref] = order
+        self._bucket_of[order.ref] = bucket
+
+    def remove(self, order):
+        bucket = self._bucket_of.pop(order.ref, None)
+        if bucket is None:
+            return False
+        orders = self._buckets[bucket]
+        del orders[order.ref]
+        if not orders:
+            del self._buckets[bucket]
+        return True
+
+    def any_within(self, price, distance):
+        """是否有挂单满足 abs(挂单价 - price) < distance"""
+        lo = int((price - distance) // self.tick)
+        hi = int((price + distance) // self.tick)
+        if hi - lo + 1 <= len(self._buckets):
+            buckets = (self._buckets.get(b) for b in range(lo, hi + 1))
+        else:
+            buckets = (orders for b, orders in self._buckets.items() if lo <= b <= hi)
+        for orders in buckets:
+            if orders:
+                for order in orders.values():
+                    if abs(order.price - price) < distance:
+                        return True
+        return False
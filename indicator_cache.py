@@ -0,0 +1,370 @@
+"""
+指标预计算缓存
+
+cerebro.optstrategy 每组参数都会重新构造 RSI / EMA / SMA / ATR / 布林带, 即使
+只改了 rsi_low、atr_multiplier 这类阈值。这里按 (数据指纹, 指标类型, 指标参数)
+缓存整条指标序列, 每条序列只算一次:
+
+    - 数据指纹为指标输入列 (收盘价, ATR 另含最高/最低价) 的 sha1, 与品种名、
+      数据源对象无关, 同一段行情在任何进程里得到同一个 key
+    - 序列的算法与 backtrader 内置指标逐位一致
+    - RSI / EMA / SMA / ATR / BollingerBands 是可直接替换 bt.indicators 同名
+      指标的 bt.Indicator, 计算时从缓存拷贝整段序列, 不再逐根计算
+
+在主进程预计算并放进共享内存后, 优化用的子进程直接映射同一块内存:
+
+    cache = default_cache()
+    cache.precompute(bars, [('rsi', dict(period=14)), ('ema', dict(period=50))])
+    with cache.shared():
+        cerebro.run()
+
+共享内存的描述放在环境变量 INDICATOR_CACHE_SHM 里, fork 和 spawn 启动的子进程
+都能看到; 子进程中的 default_cache() 首次调用时自动映射。
+"""
+import hashlib
+import json
+import math
+import os
+from array import array
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import backtrader as bt
+import numpy as np
+
+SHM_ENV = 'INDICATOR_CACHE_SHM'
+
+
+def _smooth(values, period, alpha, start):
+    """
+    backtrader ExponentialSmoothing: 第 start + period - 1 根为前 period 个值的
+    算术平均, 之后 prev * (1 - alpha) + value * alpha
+    """
+    out = np.full(len(values), np.nan)
+    seed = start + period - 1
+    if seed >= len(values):
+        return out
+    alpha1 = 1.0 - alpha
+    out[seed] = prev = math.fsum(values[start:seed + 1]) / period
+    for i in range(seed + 1, len(values)):
+        out[i] = prev = prev * alpha1 + values[i] * alpha
+    return out
+
+
+def _mean(values, period):
+    # bt Average.once: 每根都对窗口做 math.fsum
+    out = np.full(len(values), np.nan)
+    for i in range(period - 1, len(values)):
+        out[i] = math.fsum(values[i - period + 1:i + 1]) / period
+    return out
+
+
+def sma(close, period):
+    """bt.indicators.SimpleMovingAverage"""
+    return {'sma': _mean(np.asarray(close, dtype=np.float64).tolist(), period)}
+
+
+def ema(close, period):
+    """bt.indicators.ExponentialMovingAverage"""
+    values = np.asarray(close, dtype=np.float64).tolist()
+    return {'ema': _smooth(values, period, 2.0 / (1.0 + period), 0)}
+
+
+def rsi(close, period):
+    """bt.indicators.RSI (Wilder 平滑, safediv=False)"""
+    close = np.asarray(close, dtype=np.float64)
+    diff = np.empty(len(close))
+    diff[:1] = np.nan
+    diff[1:] = close[1:] - close[:-1]
+    maup = _smooth(np.maximum(diff, 0.0).tolist(), period, 1.0 / period, 1)
+    madown = _smooth(np.maximum(-diff, 0.0).tolist(), period, 1.0 / period, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {'rsi': 100.0 - 100.0 / (1.0 + maup / madown)}
+
+
+def atr(high, low, close, period):
+    """bt.indicators.ATR: 真实波幅的 Wilder 平滑"""
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    tr = np.empty(len(close))
+    tr[:1] = np.nan
+    tr[1:] = np.maximum(high[1:], close[:-1]) - np.minimum(low[1:], close[:-1])
+    return {'atr': _smooth(tr.tolist(), period, 1.0 / period, 1)}
+
+
+def _pow(values, exponent):
+    # 与 LinesOperation 的 operator.pow 相同; 负数开方记为 nan
+    return [v ** exponent if v >= 0.0 or exponent == 2 else math.nan for v in values]
+
+
+def bollinger(close, period=20, devfactor=2.0):
+    """bt.indicators.BollingerBands (movav=SMA)"""
+    values = np.asarray(close, dtype=np.float64).tolist()
+    mid = _mean(values, period)
+    meansq = _mean(_pow(values, 2), period)
+    sqmean = np.array(_pow(mid.tolist(), 2))
+    stddev = devfactor * np.array(_pow((meansq - sqmean).tolist(), 0.5))
+    return {'mid': mid, 'top': mid + stddev, 'bot': mid - stddev}
+
+
+# 指标类型 -> (计算函数, 输入列)
+INDICATORS = {
+    'sma': (sma, ('close',)),
+    'ema': (ema, ('close',)),
+    'rsi': (rsi, ('close',)),
+    'atr': (atr, ('high', 'low', 'close')),
+    'bollinger': (bollinger, ('close',)),
+}
+
+
+def fingerprint(inputs):
+    """输入列 -> 数据指纹"""
+    h = hashlib.sha1()
+    for name in sorted(inputs):
+        column = np.ascontiguousarray(inputs[name], dtype=np.float64)
+        h.update(name.encode())
+        h.update(len(column).to_bytes(8, 'little'))
+        h.update(column.tobytes())
+    return h.hexdigest()
+
+
+def _params_key(params):
+    return tuple(sorted(params.items()))
+
+
+class IndicatorCache(object):
+    """
+    (数据指纹, 指标类型, 参数) -> {line 名: float64 数组}
+    """
+
+    def __init__(self):
+        self._series = {}
+        self._shm = None
+        self._owner = False
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._series)
+
+    def get(self, kind, inputs, **params):
+        """
+        取 (或计算并缓存) 一条指标序列; inputs 为 {列名: 数组}, 只用到该指标的
+        输入列
+        """
+        func, columns = INDICATORS[kind]
+        inputs = {name: inputs[name] for name in columns}
+        key = (fingerprint(inputs), kind, _params_key(params))
+        series = self._series.get(key)
+        if series is not None:
+            self.hits += 1
+            return series
+
+        self.misses += 1
+        series = func(*[inputs[name] for name in columns], **params)
+        self._series[key] = series
+        return series
+
+    def precompute(self, bars, specs):
+        """bars 为列式 K 线或 DataFrame; specs 为 [(指标类型, 参数 dict), ...]"""
+        for kind, params in specs:
+            self.get(kind, bars, **params)
+
+    def share(self):
+        """
+        把已缓存的序列搬进一块共享内存, 并通过环境变量告知之后启动的子进程
+        """
+        self.close()
+        entries = []
+        offset = 0
+        for key, series in self._series.items():
+            lines = {}
+            for name, values in series.items():
+                lines[name] = [offset, len(values)]
+                offset += len(values) * 8
+            entries.append([key[0], key[1], [list(p) for p in key[2]], lines])
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 8))
+        self._owner = True
+        buf = np.ndarray((offset // 8,), dtype=np.float64, buffer=self._shm.buf)
+        for fp, kind, params, lines in entries:
+            series = self._series[(fp, kind, tuple(tuple(p) for p in params))]
+            for name, (start, length) in lines.items():
+                view = buf[start // 8:start // 8 + length]
+                view[:] = series[name]
+                series[name] = view
+
+        os.environ[SHM_ENV] = json.dumps({'name': self._shm.name, 'entries': entries})
+        return self._shm.name
+
+    def attach(self, description):
+        """映射 share() 创建的共享内存 (description 为环境变量中的 JSON)"""
+        info = json.loads(description)
+        # 子进程与主进程共用 resource_tracker, 这里只 close 不 unlink, 由创建方删除
+        shm = shared_memory.SharedMemory(name=info['name'])
+        buf = np.ndarray((shm.size // 8,), dtype=np.float64, buffer=shm.buf)
+        for fp, kind, params, lines in info['entries']:
+            key = (fp, kind, tuple(tuple(p) for p in params))
+            self._series.setdefault(key, {
+                name: buf[start // 8:start // 8 + length]
+                for name, (start, length) in lines.items()
+            })
+        self._shm = shm
+        self._owner = False
+
+    def close(self):
+        """释放共享内存; 创建方同时删除它并清掉环境变量"""
+        if self._shm is None:
+            return
+        # 序列换回普通数组, 缓存在共享内存释放后仍可用
+        for series in self._series.values():
+            for name in series:
+                series[name] = np.array(series[name])
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+            os.environ.pop(SHM_ENV, None)
+        self._shm = None
+
+    @contextmanager
+    def shared(self):
+        self.share()
+        try:
+            yield self
+        finally:
+            self.close()
+
+    def clear(self):
+        self.close()
+        self._series.clear()
+
+
+_default_cache = None
+
+
+def default_cache():
+    """进程内全局缓存; 子进程中首次调用时映射主进程共享的序列"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = IndicatorCache()
+        description = os.environ.get(SHM_ENV)
+        if description:
+            try:
+                _default_cache.attach(description)
+            except (OSError, ValueError):
+                pass
+    return _default_cache
+
+
+def _column(line):
+    values = line.array
+    if isinstance(values, array):
+        return np.frombuffer(values, dtype=np.float64)
+    return np.asarray(values, dtype=np.float64)
+
+
+class _CachedIndicator(bt.Indicator):
+    """
+    从 default_cache() 拷贝整条序列的指标; 需要数据已预加载 (cerebro 默认
+    preload=True)
+    """
+
+    kind = None
+
+    def _inputs(self):
+        if self.kind == 'atr':
+            return {'high': _column(self.data.high), 'low': _column(self.data.low),
+                    'close': _column(self.data.close)}
+        return {'close': _column(self.data.lines[0])}
+
+    def _cache_params(self):
+        return {}
+
+    def _load_series(self):
+        if self.data.buflen() <= len(self.data):
+            raise ValueError(f"{type(self).__name__} 需要预加载的数据 (preload=True)")
+        self._series = default_cache().get(self.kind, self._inputs(),
+                                           **self._cache_params())
+
+    def once(self, start, end):
+        if getattr(self, '_series', None) is None:
+            self._load_series()
+        for name in self.lines.getlinealiases():
+            chunk = array('d')
+            chunk.frombytes(np.ascontiguousarray(self._series[name][start:end]).tobytes())
+            getattr(self.lines, name).array[start:end] = chunk
+
+    def next(self):
+        if getattr(self, '_series', None) is None:
+            self._load_series()
+        i = len(self) - 1
+        for name in self.lines.getlinealiases():
+            getattr(self.lines, name)[0] = float(self._series[name][i])
+
+
+class SMA(_CachedIndicator):
+    lines = ('sma',)
+    params = (('period', 30),)
+    kind = 'sma'
+
+    def __init__(self):
+        self.addminperiod(self.p.period)
+
+    def _cache_params(self):
+        return {'period': self.p.period}
+
+
+class EMA(_CachedIndicator):
+    lines = ('ema',)
+    params = (('period', 30),)
+    kind = 'ema'
+
+    def __init__(self):
+        self.addminperiod(self.p.period)
+
+    def _cache_params(self):
+        return {'period': self.p.period}
+
+
+class RSI(_CachedIndicator):
+    lines = ('rsi',)
+    params = (('period', 14), ('upperband', 70.0), ('lowerband', 30.0))
+    kind = 'rsi'
+
+    def __init__(self):
+        self.addminperiod(self.p.period + 1)
+
+    def _cache_params(self):
+        return {'period': self.p.period}
+
+
+class ATR(_CachedIndicator):
+    lines = ('atr',)
+    params = (('period', 14),)
+    kind = 'atr'
+
+    def __init__(self):
+        self.addminperiod(self.p.period + 1)
+
+    def _cache_params(self):
+        return {'period': self.p.period}
+
+
+class BollingerBands(_CachedIndicator):
+    lines = ('mid', 'top', 'bot')
+    params = (('period', 20), ('devfactor', 2.0))
+    kind = 'bollinger'
+
+    def __init__(self):
+        self.addminperiod(self.p.period)
+
+    def _cache_params(self):
+        return {'period': self.p.period, 'devfactor': self.p.devfactor}
+
+
+# 与 bt.indicators 相同的别名, 便于整体替换
+SimpleMovingAverage = SMA
+ExponentialMovingAverage = EMA
+RelativeStrengthIndex = RSI
+AverageTrueRange = ATR
@@ -1,77 +1,210 @@
-import struct
-from datetime import datetime, timedelta
-import csv
-import sys
+import argparse
+import glob
+import json
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def read_lc1_file(file_path):
-    with open(file_path, "rb") as ofile:
-        data = ofile.read()
-
-    kline_data = []
-    record_size = 32
-    record_count = len(data) // record_size
-    cols = ["date", "time", "open", "high", "low", "close", "amount", "vol"]
-
-    for i in range(record_count):
-        start = i * record_size
-        record = data[start : start + record_size]
-        unpacked_data = struct.unpack("hhfffffii", record)
-
-        year = str(int(unpacked_data[0] / 2048) + datetime.now().year + 10)
-        month = str(int(unpacked_data[0] % 2048 / 100)).zfill(2)
-        day = str(unpacked_data[0] % 2048 % 100).zfill(2)
-        hour = str(int(unpacked_data[1] / 60)).zfill(2)
-        minute = str(unpacked_data[1] % 60).zfill(2)
-        second = "00"
-        _open = round(unpacked_data[2], 3)
-        _high = round(unpacked_data[3], 3)
-        _low = round(unpacked_data[4], 3)
-        _close = round(unpacked_data[5], 3)
-        _amt = unpacked_data[6]
-        _vol = unpacked_data[7] / 100.0
-
-        dt = datetime(
-            int(year), int(month), int(day), int(hour), int(minute), int(second)
-        )
-        dt = dt - timedelta(minutes=1)
-
-        kline_data.append(
-            {
-                cols[0]: f"{dt.year}-{dt.month}-{dt.day}",
-                cols[1]: f"{dt.hour}:{dt.minute}:{dt.second}",
-                cols[2]: _open,
-                cols[3]: _high,
-                cols[4]: _low,
-                cols[5]: _close,
-                cols[6]: _amt,
-                cols[7]: _vol,
-            }
-        )
-
-    return kline_data, cols
-
-def write_to_csv(kline_data, cols, csv_file_path):
-    os.makedirs(os.path.dirname(csv_file_path), exist_ok=True)
-    with open(csv_file_path, "w", newline="", encoding="utf-8") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=cols)
-        writer.writeheader()
-        for kline in kline_data:
-            writer.writerow(kline)
+from bar_writers import APPENDABLE_FORMATS, FORMATS, output_name, write_bars
+from tdx_reader import RECORD_SIZE, decode_lc1
+
+# 输出目录下记录每个源文件上次转换时的状态:
+#   size / mtime_ns  源文件大小和修改时间, 用于跳过未变化的品种
+#   offset           已转换到的字节偏移 (记录数 * 32)
+#   last             已转换的最后一条原始记录 (hex), 增量模式用来确认文件只是追加
+#   output / format  对应的输出文件及格式
+STATE_FILE = ".lc1_to_csv_state.json"
+
+
+def _appendable_offset(lc1_file, out_file, fmt, entry):
+    """
+    增量模式下可以续写的起始偏移; 不满足条件 (首次转换、输出丢失或格式不同、
+    格式不支持续写、源文件被截断或改写) 时返回 None, 走全量转换
+    """
+    if fmt not in APPENDABLE_FORMATS or not entry:
+        return None
+    if entry.get("output") != os.path.abspath(out_file) or entry.get("format", "csv") != fmt:
+        return None
+    offset = entry.get("offset", 0)
+    if not offset or offset % RECORD_SIZE or not os.path.exists(out_file):
+        return None
+    if os.path.getsize(lc1_file) < offset:
+        return None
+    with open(lc1_file, "rb") as f:
+        f.seek(offset - RECORD_SIZE)
+        if f.read(RECORD_SIZE).hex() != entry.get("last"):
+            return None
+    return offset
+
+
+def convert_file(lc1_file, out_file, entry=None, incremental=False, fmt="csv"):
+    """
+    转换单个文件, 返回新的状态记录
+    incremental=True 且上次状态有效时只解码 offset 之后新追加的记录并续写到 out_file
+    """
+    offset = _appendable_offset(lc1_file, out_file, fmt, entry) if incremental else None
+    with open(lc1_file, "rb") as f:
+        if offset:
+            f.seek(offset)
+        data = f.read()
+
+    count = len(data) // RECORD_SIZE
+    data = data[:count * RECORD_SIZE]
+    if count or not offset:
+        write_bars(decode_lc1(data), out_file, fmt, append=bool(offset))
+
+    st = os.stat(lc1_file)
+    if count:
+        last = data[-RECORD_SIZE:].hex()
+    else:
+        last = entry.get("last") if offset else None
+    return {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "offset": (offset or 0) + count * RECORD_SIZE,
+        "last": last,
+        "output": os.path.abspath(out_file),
+        "format": fmt,
+        "appended": count if offset else None,
+    }
+
+
+def is_unchanged(src, entry):
+    if not entry:
+        return False
+    st = os.stat(src)
+    return entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns
+
+
+def find_sources(source):
+    """目录 (递归查找 *.lc1) 或通配符 -> 源文件列表"""
+    if os.path.isdir(source):
+        pattern = os.path.join(source, "**", "*.lc1")
+    else:
+        pattern = source
+    return sorted(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+
+
+def output_path(lc1_file, output_dir, fmt="csv"):
+    stem = os.path.splitext(os.path.basename(lc1_file))[0]
+    return os.path.join(output_dir, output_name(stem, fmt))
+
+
+def load_state(output_dir):
+    try:
+        with open(os.path.join(output_dir, STATE_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("用法: python script.py <源.lc1文件路径> <目标.csv文件路径>")
-        print("例如: python convert.py data/70#US0452.lc1 output/kline.csv")
-        sys.exit(1)
 
-    lc1_file = sys.argv[1]
-    csv_file = sys.argv[2]
+def save_state(output_dir, state):
+    path = os.path.join(output_dir, STATE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, path)
 
-    if not os.path.isfile(lc1_file):
-        print(f"错误：源文件不存在：{lc1_file}")
-        sys.exit(1)
 
-    kline_data, cols = read_lc1_file(lc1_file)
-    write_to_csv(kline_data, cols, csv_file)
-    print(f"数据已成功写入：{csv_file}")
\ No newline at end of file
+def convert_batch(source, output_dir, jobs=None, force=False, incremental=False,
+                  fmt="csv"):
+    """
+    批量转换: 源文件未变化 (大小/修改时间与上次一致) 且输出存在时跳过,
+    其余文件分发到进程池并行转换, 按完成顺序打印进度
+    incremental=True 时只续写各文件新追加的记录
+    返回 (转换数, 跳过数, 失败数)
+    """
+    sources = find_sources(source)
+    if not sources:
+        print(f"未找到 .lc1 文件：{source}")
+        return 0, 0, 0
+
+    os.makedirs(output_dir, exist_ok=True)
+    state = {} if force else load_state(output_dir)
+
+    todo = []
+    for src in sources:
+        entry = state.get(os.path.abspath(src))
+        dst = output_path(src, output_dir, fmt)
+        if is_unchanged(src, entry) and entry.get("format", "csv") == fmt \
+                and os.path.exists(dst):
+            continue
+        todo.append((src, dst, entry))
+
+    skipped = len(sources) - len(todo)
+    print(f"共 {len(sources)} 个文件, 需转换 {len(todo)} 个, 未变化跳过 {skipped} 个")
+
+    failed = 0
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(convert_file, src, dst, entry, incremental, fmt): src
+                       for src, dst, entry in todo}
+            for done, future in enumerate(as_completed(futures), 1):
+                src = futures[future]
+                try:
+                    entry = future.result()
+                    state[os.path.abspath(src)] = entry
+                    print(f"[{done}/{len(todo)}] {os.path.basename(src)}{_describe(entry)}")
+                except Exception as e:
+                    failed += 1
+                    print(f"[{done}/{len(todo)}] {os.path.basename(src)} 转换失败: {e}")
+        save_state(output_dir, state)
+
+    return len(todo) - failed, skipped, failed
+
+
+def _describe(entry):
+    if entry.get("appended") is None:
+        return ""
+    return f" (增量 +{entry['appended']} 条)"
+
+
+def convert_single(lc1_file, out_file, incremental=False, fmt="csv"):
+    """单文件转换; 增量模式的状态记在目标文件所在目录"""
+    output_dir = os.path.dirname(os.path.abspath(out_file))
+    key = os.path.abspath(lc1_file)
+    state = load_state(output_dir) if incremental else {}
+    entry = convert_file(lc1_file, out_file, state.get(key), incremental, fmt)
+    if incremental:
+        state[key] = entry
+        save_state(output_dir, state)
+    return entry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="通达信 .lc1 分钟线转 CSV / Parquet / Feather / npy",
+        epilog="例如: python lc1_to_csv_cli.py data/70#US0452.lc1 output/kline.csv\n"
+               "      python lc1_to_csv_cli.py C:/new_tdx/vipdoc output/ -j 8",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("source", help="源 .lc1 文件; 或目录/通配符 (批量模式)")
+    parser.add_argument("target", help="目标文件 (npy 格式为目录); 批量模式下为输出目录")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="csv",
+                        help="输出格式 (默认 csv); npy 为每列一个 .npy 文件的目录")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="批量模式的并行进程数 (默认 CPU 核数)")
+    parser.add_argument("--force", action="store_true",
+                        help="批量模式下忽略上次的转换记录, 全部重新转换")
+    parser.add_argument("-i", "--incremental", action="store_true",
+                        help="增量模式: 只解码上次转换之后追加的记录并续写到已有输出"
+                             " (csv / npy)")
+    args = parser.parse_args(argv)
+
+    if os.path.isfile(args.source):
+        entry = convert_single(args.source, args.target, args.incremental, args.format)
+        print(f"数据已成功写入：{args.target}{_describe(entry)}")
+        return 0
+
+    if not os.path.isdir(args.source) and not glob.has_magic(args.source):
+        print(f"错误：源文件不存在：{args.source}")
+        return 1
+
+    converted, skipped, failed = convert_batch(args.source, args.target, args.jobs,
+                                               args.force, args.incremental, args.format)
+    print(f"完成: 转换 {converted} 个, 跳过 {skipped} 个, 失败 {failed} 个")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
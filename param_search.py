@@ -0,0 +1,343 @@
+"""
+自适应参数搜索
+
+optstrategy 只能穷举各参数 range() 的笛卡尔积, 维度一多组合数就爆炸。这里把
+"怎么挑参数" 和 "怎么回测一组参数" 分开:
+
+    搜索空间  {参数名: 候选值序列}, 参数名必须是策略 params 里有的
+    目标函数  objective(参数列表, fraction) -> 每组参数一条记录 (RunSummary 字段)
+              fraction < 1 时只用最近 fraction 比例的 K 线 (便宜的短窗口)
+    优化器    RandomSearch / SuccessiveHalving / TPESearch, run(objective) 返回
+              全部试验记录
+
+    space = search_space(RSI_EMA_IntradayStrategy, rsi_low=range(20, 46),
+                         rsi_high=range(55, 81), ema_period=range(20, 201, 10))
+    objective = CerebroObjective(RSI_EMA_IntradayStrategy, bars,
+                                 fixed=dict(printlog=False), cash=1500000)
+    trials = TPESearch(space, n_trials=60).run(objective)
+    best = best_trial(trials)
+
+CerebroObjective 适用于仓库里任何 bt.Strategy; 进程池的每个子进程只在启动时
+收到一次 K 线, 之后每个任务只传参数。
+"""
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import backtrader as bt
+import numpy as np
+
+from array_feed import ArrayData
+from run_summary import RunSummary, summary_record
+
+
+def search_space(strategy, **dims):
+    """
+    校验并整理搜索空间: 每个维度为候选值序列, 名称必须是 strategy.params 中的参数
+    """
+    known = set(strategy.params._getkeys())
+    space = {}
+    for name, values in dims.items():
+        if name not in known:
+            raise KeyError(f"{strategy.__name__} 没有参数 {name}")
+        values = list(values)
+        if not values:
+            raise ValueError(f"参数 {name} 没有候选值")
+        space[name] = values
+    return space
+
+
+def space_size(space):
+    return int(np.prod([len(v) for v in space.values()], dtype=np.float64))
+
+
+def window(bars, fraction=1.0):
+    """列式 K 线的最近 fraction 部分"""
+    n = len(bars['datetime'])
+    if fraction >= 1.0:
+        return bars
+    start = n - max(1, int(round(n * fraction)))
+    return {name: col[start:] for name, col in bars.items()}
+
+
+def score_of(record, metric='total_return', maximize=True):
+    """记录 -> 越大越好的分数; None/NaN 视为最差"""
+    value = record.get(metric)
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return -math.inf
+    return value if maximize else -value
+
+
+def best_trial(trials):
+    """全量窗口上分数最高的试验"""
+    full = [t for t in trials if t['fraction'] >= 1.0] or trials
+    return max(full, key=lambda t: t['score'])
+
+
+# ---------------------------------------------------------------------------
+# 目标函数
+
+_worker_bars = None
+
+
+def _init_worker(bars):
+    global _worker_bars
+    _worker_bars = bars
+
+
+def _backtest(strategy, params, fraction, settings, bars=None):
+    bars = window(_worker_bars if bars is None else bars, fraction)
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(ArrayData(dataname=bars, timeframe=settings['timeframe'],
+                              compression=settings['compression']))
+    cerebro.broker.setcash(settings['cash'])
+    cerebro.broker.setcommission(commission=settings['commission'])
+    cerebro.addstrategy(strategy, **params)
+    cerebro.addanalyzer(RunSummary, _name='summary',
+                        riskfreerate=settings['riskfreerate'])
+    return summary_record(cerebro.run()[0], list(params))
+
+
+class CerebroObjective(object):
+    """
+    用 cerebro 逐组回测; fixed 为不参与搜索的策略参数, jobs > 1 时用进程池并行
+    (jobs=None 为 CPU 核数)
+    """
+
+    def __init__(self, strategy, bars, fixed=None, cash=1500000.0, commission=0.00005,
+                 riskfreerate=0.0, timeframe=bt.TimeFrame.Minutes, compression=1,
+                 jobs=1):
+        self.strategy = strategy
+        self.bars = bars
+        self.fixed = dict(fixed or {})
+        self.settings = dict(cash=cash, commission=commission, riskfreerate=riskfreerate,
+                             timeframe=timeframe, compression=compression)
+        self.jobs = jobs or os.cpu_count() or 1
+        self._pool = None
+
+    def __call__(self, params_list, fraction=1.0):
+        tasks = [dict(self.fixed, **params) for params in params_list]
+        if self.jobs <= 1 or len(tasks) <= 1:
+            records = [_backtest(self.strategy, p, fraction, self.settings, self.bars)
+                       for p in tasks]
+        else:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.jobs,
+                                                 initializer=_init_worker,
+                                                 initargs=(self.bars,))
+            futures = [self._pool.submit(_backtest, self.strategy, p, fraction,
+                                         self.settings) for p in tasks]
+            records = [f.result() for f in futures]
+        # 只保留参与搜索的参数列
+        for params, record in zip(params_list, records):
+            for name in self.fixed:
+                if name not in params:
+                    record.pop(name, None)
+        return records
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------------------------------------------------------------------------
+# 优化器
+
+class _Search(object):
+    """
+    公共部分: 采样、去重、约束、记录试验; trials 中每条为
+    参数 + 目标函数记录 + score / fraction
+    """
+
+    def __init__(self, space, n_trials=30, metric='total_return', maximize=True,
+                 constraint=None, seed=None):
+        self.space = space
+        self.names = list(space)
+        self.n_trials = n_trials
+        self.metric = metric
+        self.maximize = maximize
+        self.constraint = constraint
+        self.rng = random.Random(seed)
+        self.trials = []
+        self.cost = 0.0         # 折算成全量回测的次数
+        self._seen = set()
+
+    def _key(self, params):
+        return tuple(params[name] for name in self.names)
+
+    def _valid(self, params):
+        return self.constraint is None or self.constraint(params)
+
+    def _sample(self, count, exclude=None):
+        """不重复地随机采样 count 组满足约束的参数"""
+        exclude = self._seen if exclude is None else exclude
+        picked = []
+        keys = set()
+        attempts = 0
+        while len(picked) < count and attempts < count * 200:
+            attempts += 1
+            params = {name: self.rng.choice(values) for name, values in self.space.items()}
+            key = self._key(params)
+            if key in exclude or key in keys or not self._valid(params):
+                continue
+            keys.add(key)
+            picked.append(params)
+        return picked
+
+    def _evaluate(self, objective, params_list, fraction=1.0):
+        if not params_list:
+            return []
+        records = objective(params_list, fraction)
+        results = []
+        for params, record in zip(params_list, records):
+            trial = dict(params)
+            trial.update(record)
+            trial['score'] = score_of(record, self.metric, self.maximize)
+            trial['fraction'] = fraction
+            self.trials.append(trial)
+            results.append(trial)
+            if fraction >= 1.0:
+                self._seen.add(self._key(params))
+        self.cost += len(params_list) * fraction
+        return results
+
+
+class RandomSearch(_Search):
+    """随机搜索: 不重复地抽 n_trials 组参数, 全量回测"""
+
+    def __init__(self, space, n_trials=30, batch=8, **kwargs):
+        super(RandomSearch, self).__init__(space, n_trials, **kwargs)
+        self.batch = batch
+
+    def run(self, objective):
+        while len(self._seen) < self.n_trials:
+            params_list = self._sample(min(self.batch, self.n_trials - len(self._seen)))
+            if not params_list:
+                break
+            self._evaluate(objective, params_list)
+        return self.trials
+
+
+class SuccessiveHalving(_Search):
+    """
+    逐级减半: n_trials 组参数先在最近 min_fraction 的数据上回测, 每级保留前
+    1/eta, 窗口放大 eta 倍, 最后只有幸存者跑全量数据
+    分钟线上窗口太短 (几个交易日) 时排名和全量相差很大, min_fraction 不宜过小
+    """
+
+    def __init__(self, space, n_trials=81, eta=3, min_fraction=1.0 / 3, **kwargs):
+        super(SuccessiveHalving, self).__init__(space, n_trials, **kwargs)
+        self.eta = eta
+        self.min_fraction = min_fraction
+
+    def run(self, objective):
+        configs = self._sample(self.n_trials)
+        fraction = min(1.0, self.min_fraction)
+        while configs:
+            results = self._evaluate(objective, configs, fraction)
+            if fraction >= 1.0:
+                break
+            results.sort(key=lambda t: t['score'], reverse=True)
+            keep = max(1, len(results) // self.eta)
+            configs = [{name: t[name] for name in self.names} for t in results[:keep]]
+            fraction = min(1.0, fraction * self.eta)
+        return self.trials
+
+
+class TPESearch(_Search):
+    """
+    Tree-structured Parzen Estimator: 前 n_startup 组随机; 之后把已回测的参数
+    按分数分成好 (前 gamma) / 差两组, 各维在候选值下标上做核密度估计, 从
+    "好" 的分布里抽 n_candidates 个候选, 取 l(x)/g(x) 最大的去回测
+    """
+
+    def __init__(self, space, n_trials=40, n_startup=10, gamma=0.25, n_candidates=24,
+                 batch=1, **kwargs):
+        super(TPESearch, self).__init__(space, n_trials, **kwargs)
+        self.n_startup = n_startup
+        self.gamma = gamma
+        self.n_candidates = n_candidates
+        self.batch = batch
+        self._index = {name: {v: i for i, v in enumerate(values)}
+                       for name, values in space.items()}
+
+    def _density(self, name, trials):
+        size = len(self.space[name])
+        grid = np.arange(size)
+        width = max(1.0, size * 0.15)
+        # 均匀先验, 权重相当于一个观测
+        density = np.full(size, 1.0 / size)
+        for t in trials:
+            center = self._index[name][t[name]]
+            kernel = np.exp(-0.5 * ((grid - center) / width) ** 2)
+            density += kernel / kernel.sum()
+        return density / density.sum()
+
+    def _propose(self, count):
+        full = [t for t in self.trials if t['fraction'] >= 1.0]
+        ranked = sorted(full, key=lambda t: t['score'], reverse=True)
+        n_good = max(1, int(math.ceil(self.gamma * len(ranked))))
+        good, bad = ranked[:n_good], ranked[n_good:]
+        dens_l = {name: self._density(name, good) for name in self.names}
+        dens_g = {name: self._density(name, bad) for name in self.names}
+
+        exclude = self._seen
+        scored = []
+        for _ in range(self.n_candidates * 4):
+            idx = {name: self.rng.choices(range(len(self.space[name])),
+                                          weights=dens_l[name])[0]
+                   for name in self.names}
+            params = {name: self.space[name][i] for name, i in idx.items()}
+            key = self._key(params)
+            if key in exclude or not self._valid(params):
+                continue
+            ratio = sum(math.log(dens_l[name][i]) - math.log(dens_g[name][i])
+                        for name, i in idx.items())
+            scored.append((ratio, key, params))
+            if len(scored) >= self.n_candidates:
+                break
+        scored.sort(key=lambda x: x[0], reverse=True)
+
+        picked, keys = [], set()
+        for _, key, params in scored:
+            if key not in keys:
+                keys.add(key)
+                picked.append(params)
+            if len(picked) == count:
+                break
+        if len(picked) < count:
+            picked += self._sample(count - len(picked), exclude | keys)
+        return picked
+
+    def run(self, objective):
+        startup = self._sample(min(self.n_startup, self.n_trials))
+        self._evaluate(objective, startup)
+        while len(self._seen) < self.n_trials:
+            count = min(self.batch, self.n_trials - len(self._seen))
+            params_list = self._propose(count)
+            if not params_list:
+                break
+            self._evaluate(objective, params_list)
+        return self.trials
+
+
+OPTIMIZERS = {
+    'random': RandomSearch,
+    'halving': SuccessiveHalving,
+    'tpe': TPESearch,
+}
+
+
+def make_optimizer(method, space, **kwargs):
+    """'random' / 'halving' / 'tpe' -> 优化器实例"""
+    if method not in OPTIMIZERS:
+        raise ValueError(f"不支持的搜索方法: {method}")
+    return OPTIMIZERS[method](space, **kwargs)
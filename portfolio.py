@@ -0,0 +1,194 @@
+"""
+多品种组合回测
+
+各脚本都只 adddata 一个品种, 513300 / 513310 / 511700 只能分开跑, 无法共用资金。
+这里把几个品种经 bar_store (bar_cache 缓存) 一次取出, 对齐到同一个时间轴后
+各自作为 ArrayData 加入同一个 cerebro, 一个策略在共用的 broker 上同时交易:
+
+    result = run_portfolio(AdvancedGridStrategy, ['513310', '513300', '511700'],
+                           datetime(2025, 8, 5), datetime(2025, 10, 31), cash=1500000)
+    result['total']             # 总资产 (numpy 数组, 每根 K 线一个值)
+    result['equity']['513310']  # 该品种持仓市值
+    to_frame(result)            # 合成一个 DataFrame
+
+时间轴对齐 (align_bars):
+    - 各品种的 int64 时间索引取并集, 再截到所有品种都有数据的区间 (最晚的开始 ~
+      最早的结束), 午休、收盘后不会凭空多出 K 线
+    - 每个品种用 searchsorted 一次算出时间轴上每个时刻对应的最近一根原始 K 线,
+      整列取下标; 没有成交的分钟补一根 open = high = low = close = 上一根收盘、
+      vol = amount = 0 的 K 线 (filled 列为 1)
+    - 各数据源时间完全一致, backtrader 不必逐根比较各数据源的时间, runonce 照常可用
+
+策略里用 self.datas 遍历品种, data._name 为品种代码, 下单时传 data=。
+"""
+import argparse
+import importlib.util
+import os
+import sys
+from array import array
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from array_feed import ArrayData, bt_timeframe
+from bar_store import default_store, normalize_symbol, parse_when
+
+PRICE_COLUMNS = ('open', 'high', 'low', 'close')
+
+
+def align_bars(symbols, start=None, end=None, freq='1min', store=None):
+    """
+    取几个品种 [start, end] 区间的 K 线并对齐到同一时间轴; end 为日期时含当天
+    返回 {品种代码: 列式 K 线 dict}, 各 dict 的 datetime 列相同, 另有 filled 列
+    """
+    store = store or default_store()
+    symbols = [normalize_symbol(s) for s in symbols]
+    if len(set(symbols)) != len(symbols):
+        raise ValueError(f"品种重复: {symbols}")
+    raw = {s: store.get_bars(s, start, end, freq, as_frame=False) for s in symbols}
+    index = {s: np.asarray(bars['datetime'], dtype='M8[ns]').view(np.int64)
+             for s, bars in raw.items()}
+    empty = [s for s in symbols if not len(index[s])]
+    if empty:
+        raise ValueError(f"以下品种在区间内没有数据: {empty}")
+
+    first = max(int(ns[0]) for ns in index.values())
+    last = min(int(ns[-1]) for ns in index.values())
+    if first > last:
+        raise ValueError("各品种的数据区间没有重叠")
+    clock = np.unique(np.concatenate([ns[(ns >= first) & (ns <= last)]
+                                      for ns in index.values()]))
+
+    aligned = {}
+    for symbol in symbols:
+        ns, bars = index[symbol], raw[symbol]
+        # 时间轴上每个时刻对应的最近一根原始 K 线 (first 处各品种都有 K 线, pos >= 0)
+        pos = np.searchsorted(ns, clock, 'right') - 1
+        filled = ns[pos] != clock
+        columns = {'datetime': clock.view('M8[ns]')}
+        close = np.asarray(bars['close'], dtype=np.float64)[pos]
+        for name, col in bars.items():
+            if name == 'datetime':
+                continue
+            values = np.asarray(col)[pos]
+            if filled.any():
+                values = values.astype(np.float64)
+                values[filled] = close[filled] if name in PRICE_COLUMNS else 0.0
+            columns[name] = values
+        columns['filled'] = filled.astype(np.int8)
+        aligned[symbol] = columns
+    return aligned
+
+
+class PortfolioValue(bt.Analyzer):
+    """
+    逐根 K 线记录总资产、现金和各品种持仓市值
+    get_analysis(): {'datetime', 'cash', 'total', 'equity': {品种: 数组}}, 值为 numpy 数组
+    """
+
+    def start(self):
+        self._dt = array('d')
+        self._cash = array('d')
+        self._total = array('d')
+        self._equity = [array('d') for _ in self.strategy.datas]
+
+    def next(self):
+        broker = self.strategy.broker
+        self._dt.append(self.strategy.datetime[0])
+        self._cash.append(broker.getcash())
+        self._total.append(broker.getvalue())
+        for data, values in zip(self.strategy.datas, self._equity):
+            values.append(broker.getvalue([data]))
+
+    def stop(self):
+        dt = np.array([bt.num2date(x) for x in self._dt], dtype='M8[ns]')
+        self.rets = {
+            'datetime': dt,
+            'cash': np.asarray(self._cash),
+            'total': np.asarray(self._total),
+            'equity': {data._name: np.asarray(values)
+                       for data, values in zip(self.strategy.datas, self._equity)},
+        }
+
+
+def to_frame(result):
+    """run_portfolio 的结果 -> datetime 索引的 DataFrame (各品种市值 + cash + total)"""
+    frame = pd.DataFrame(result['equity'], index=pd.DatetimeIndex(result['datetime'],
+                                                                 name='datetime'))
+    frame['cash'] = result['cash']
+    frame['total'] = result['total']
+    return frame
+
+
+def build_cerebro(symbols, start=None, end=None, cash=1000000.0, commission=0.00005,
+                  freq='1min', store=None):
+    """对齐后的各品种加入同一个 cerebro (数据源名为品种代码), 并挂上 PortfolioValue"""
+    aligned = align_bars(symbols, start, end, freq, store)
+    timeframe, compression = bt_timeframe(freq)
+    cerebro = bt.Cerebro()
+    for symbol, bars in aligned.items():
+        cerebro.adddata(ArrayData(dataname=bars, timeframe=timeframe,
+                                  compression=compression), name=symbol)
+    cerebro.broker.setcash(cash)
+    cerebro.broker.setcommission(commission=commission)
+    cerebro.addanalyzer(PortfolioValue, _name='portfolio')
+    return cerebro
+
+
+def run_portfolio(strategy, symbols, start=None, end=None, cash=1000000.0,
+                  commission=0.00005, freq='1min', store=None, **params):
+    """
+    多品种共用资金跑一个策略; params 为策略参数
+    返回 PortfolioValue 的结果, 另加 'strategy' (策略实例)
+    """
+    cerebro = build_cerebro(symbols, start, end, cash, commission, freq, store)
+    cerebro.addstrategy(strategy, **params)
+    strat = cerebro.run()[0]
+    result = dict(strat.analyzers.portfolio.get_analysis())
+    result['strategy'] = strat
+    return result
+
+
+def _load_strategy(spec):
+    """'11.13.py:AdvancedGridStrategy' -> 策略类"""
+    filename, _, name = spec.partition(':')
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    module_name = '_portfolio_' + os.path.splitext(filename)[0].replace('.', '_')
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return getattr(module, name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='多品种组合回测 (共用资金)')
+    parser.add_argument('symbols', nargs='+', help='品种代码, 如 513310 513300 511700')
+    parser.add_argument('--strategy', default='11.13.py:AdvancedGridStrategy',
+                        help='策略, 格式为 文件:类名')
+    # 只给日期时 --end 含当天全部 K 线
+    parser.add_argument('--start', type=parse_when, help='如 2025-08-05 或 2025-08-05T10:00')
+    parser.add_argument('--end', type=parse_when, help='如 2025-10-31 (含当天)')
+    parser.add_argument('--freq', default='1min')
+    parser.add_argument('--cash', type=float, default=1500000.0)
+    parser.add_argument('--commission', type=float, default=0.00005)
+    parser.add_argument('--output', help='逐根 K 线资产曲线 CSV')
+    parser.add_argument('--quiet', action='store_true', help='关闭策略日志')
+    args = parser.parse_args()
+
+    params = {}
+    strategy = _load_strategy(args.strategy)
+    if args.quiet:
+        params['log_level'] = 'OFF'
+    result = run_portfolio(strategy, args.symbols, args.start, args.end, args.cash,
+                           args.commission, args.freq, **params)
+    frame = to_frame(result)
+    print(f"\n{len(frame)} 根 K 线, {frame.index[0]} ~ {frame.index[-1]}")
+    print(f"期初资产: {args.cash:.2f}  期末资产: {frame['total'].iloc[-1]:.2f}  "
+          f"期末现金: {frame['cash'].iloc[-1]:.2f}")
+    for symbol in result['equity']:
+        print(f"  {symbol} 期末持仓市值: {frame[symbol].iloc[-1]:.2f}")
+    if args.output:
+        frame.to_csv(args.output)
+        print(f"资产曲线已保存到 {args.output}")
@@ -0,0 +1,100 @@
+"""
+分钟线合成大周期 K 线 (向量化)
+
+把 1 分钟 (或其他整分钟) 列式 K 线合成 5/15/30/60 分钟线和日线, 不经 backtrader
+的 resampledata 逐根在线合成:
+
+    bars_5 = resample_bars(bars, '5min')
+    daily = resample_bars(bars, 'D')
+
+A 股交易时段: 上午 09:30-11:30, 下午 13:00-15:00, K 线时间为开始时间 (与
+tdx_reader 解码 .lc1/.lc5 一致):
+    - 分钟周期按时段内的偏移分桶, 桶不跨午休, 60 分钟线为 09:30 / 10:30 / 13:00 /
+      14:00 四根 (同通达信); 周期不能整除 120 分钟时, 每个时段最后一根不足周期
+    - 09:30 之前 (集合竞价) 的 K 线并入上午第一根, 11:30-13:00 之间的并入上午最后
+      一根, 15:00 及之后的并入下午最后一根
+    - 日线时间为当日 0 点 (与 .day 一致)
+
+输入需按时间升序 (bar_store / bar_cache 加载的数据都是); 每根合成 K 线的桶号由
+时间戳直接算出, 再用 np.*.reduceat 在相邻同桶的区段上一次聚合:
+open 取首根, close 取末根, high / low 取极值, amount / vol 求和。
+
+bar_cache.load_resampled() 把结果缓存在源文件旁的 .bar_cache/ 目录。
+"""
+import numpy as np
+
+import tdx_reader
+
+NS_PER_MINUTE = 60 * 1000000000
+NS_PER_DAY = 1440 * NS_PER_MINUTE
+
+# 各时段开始的当日分钟数和时长 (分钟)
+MORNING_OPEN = 9 * 60 + 30
+AFTERNOON_OPEN = 13 * 60
+SESSION_MINUTES = 120
+
+FREQS = ('5min', '15min', '30min', '60min', 'D')
+
+
+def freq_minutes(freq):
+    """'5min' -> 5; 'D' -> None"""
+    if freq == 'D':
+        return None
+    if freq.endswith('min') and freq[:-3].isdigit() and int(freq[:-3]) > 0:
+        return int(freq[:-3])
+    raise ValueError(f"不支持的周期: {freq} (可用 'Nmin' 或 'D')")
+
+
+def can_resample(source_freq, freq):
+    """source_freq 周期的 K 线能否合成 freq 周期"""
+    target = freq_minutes(freq)
+    source = freq_minutes(source_freq)
+    if source is None:
+        return False
+    if target is None:
+        return True
+    return target > source and target % source == 0
+
+
+def bucket_labels(dt, freq):
+    """每根 K 线所属合成 K 线的开始时间 (int64 纳秒)"""
+    ns = np.asarray(dt, dtype='M8[ns]').view(np.int64)
+    day = ns - ns % NS_PER_DAY
+    minutes = freq_minutes(freq)
+    if minutes is None:
+        return day
+
+    tod = (ns - day) // NS_PER_MINUTE
+    afternoon = tod >= AFTERNOON_OPEN
+    session_open = np.where(afternoon, AFTERNOON_OPEN, MORNING_OPEN)
+    offset = np.clip(tod - session_open, 0, SESSION_MINUTES - 1)
+    label = session_open + offset // minutes * minutes
+    return day + label * NS_PER_MINUTE
+
+
+def resample_bars(bars, freq):
+    """列式 K 线 -> freq 周期的列式 K 线 (输入需按时间升序)"""
+    labels = bucket_labels(bars['datetime'], freq)
+    if len(labels) == 0:
+        return {name: np.asarray(col)[:0] for name, col in bars.items()}
+    if np.any(labels[1:] < labels[:-1]):
+        raise ValueError("K 线未按时间升序排列")
+
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    ends = np.r_[starts[1:], len(labels)] - 1
+    result = {'datetime': labels[starts].view('M8[ns]')}
+    for name in tdx_reader.BAR_FIELDS:
+        if name not in bars:
+            continue
+        col = np.asarray(bars[name], dtype=np.float64)
+        if name == 'open':
+            result[name] = col[starts]
+        elif name == 'close':
+            result[name] = col[ends]
+        elif name == 'high':
+            result[name] = np.maximum.reduceat(col, starts)
+        elif name == 'low':
+            result[name] = np.minimum.reduceat(col, starts)
+        else:
+            result[name] = np.add.reduceat(col, starts)
+    return result
@@ -0,0 +1,268 @@
+"""
+回测结果库 (SQLite)
+
+analyze_and_plot_results 每次都会覆盖结果 CSV, 网格里多加一个参数值也要把所有
+组合重跑一遍。这里把每次回测的汇总记录存进本地 SQLite, 键为:
+
+    strategy  策略类名
+    params    完整参数 (策略默认值 + 本次指定的值, JSON), 不含 IGNORED_PARAMS
+    data      K 线内容的 sha1 (与文件名/格式无关, 数据文件改动后自然失效)
+    start/end 首末 K 线时间
+    broker    资金、佣金等撮合设置 (JSON)
+
+numpy 引擎与 cerebro 逐笔一致, 引擎不在键里, 两边的结果互相复用。
+
+    db = ResultsDB('backtest_results.db')
+    scope = db.scope(RSI_EMA_IntradayStrategy, bars, cash=1500000, commission=0.00005)
+    records = cached_grid(db, scope, run, fixed=dict(rsi_period=14),
+                          rsi_low=range(20, 41, 5), rsi_high=range(60, 81, 5))
+    heatmap = db.query(scope, rsi_period=14, ema_period=50)
+"""
+import datetime
+import hashlib
+import itertools
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import param_search
+from run_summary import SUMMARY_FIELDS
+
+# 只影响日志/实现方式、不影响回测结果的参数
+IGNORED_PARAMS = ('printlog', 'print_log', 'log_level', 'log_file', 'cache_indicators')
+
+KEY_FIELDS = ['strategy', 'params', 'data', 'start', 'end', 'broker']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    strategy TEXT NOT NULL,
+    params TEXT NOT NULL,
+    data TEXT NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    broker TEXT NOT NULL,
+    final_value REAL,
+    total_return REAL,
+    sharpe_ratio REAL,
+    max_drawdown REAL,
+    trade_count INTEGER,
+    created TEXT,
+    PRIMARY KEY (strategy, params, data, start, end, broker)
+)
+"""
+
+
+def _plain(value):
+    # numpy 标量 -> Python 标量, 保证 JSON 键稳定
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _dumps(mapping):
+    return json.dumps({k: _plain(v) for k, v in mapping.items()}, sort_keys=True)
+
+
+def _columns(bars):
+    if isinstance(bars, pd.DataFrame):
+        columns = {name: bars[name].to_numpy() for name in bars.columns}
+        if 'datetime' not in columns:
+            columns['datetime'] = bars.index.to_numpy()
+        return columns
+    return bars
+
+
+def data_fingerprint(bars):
+    """列式 K 线 (或 DataFrame) 内容的 sha1"""
+    h = hashlib.sha1()
+    for name, column in sorted(_columns(bars).items()):
+        column = np.ascontiguousarray(column)
+        h.update(name.encode())
+        h.update(str(column.dtype).encode())
+        h.update(column.tobytes())
+    return h.hexdigest()
+
+
+def _timestamp(value):
+    return str(pd.Timestamp(value))
+
+
+class ResultsDB(object):
+    """
+    SQLite 结果库; 只应在主进程里读写 (优化子进程的结果回到主进程后再写入)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def scope(self, strategy, bars, **broker):
+        """
+        一组回测的公共键: 策略、数据指纹、首末 K 线时间、撮合设置, 另带策略参数
+        默认值 (defaults) 用于补全参数
+        """
+        columns = _columns(bars)
+        dt = columns['datetime']
+        return {
+            'strategy': strategy.__name__,
+            'data': data_fingerprint(columns),
+            'start': _timestamp(dt[0]),
+            'end': _timestamp(dt[-1]),
+            'broker': _dumps(broker),
+            'defaults': {k: v for k, v in strategy.params._getitems()
+                         if k not in IGNORED_PARAMS},
+        }
+
+    def _params_key(self, scope, params):
+        full = dict(scope['defaults'])
+        full.update((k, v) for k, v in params.items() if k not in IGNORED_PARAMS)
+        return _dumps(full)
+
+    def _key(self, scope, params):
+        return (scope['strategy'], self._params_key(scope, params), scope['data'],
+                scope['start'], scope['end'], scope['broker'])
+
+    def get(self, scope, params):
+        """已存的汇总记录 (SUMMARY_FIELDS), 没有则返回 None"""
+        return self.lookup(scope, [params])[0]
+
+    def lookup(self, scope, params_list):
+        """与 params_list 对齐的记录列表, 库中没有的位置为 None"""
+        rows = self._conn.execute(
+            "SELECT params, " + ", ".join(SUMMARY_FIELDS) + " FROM results "
+            "WHERE strategy=? AND data=? AND start=? AND end=? AND broker=?",
+            (scope['strategy'], scope['data'], scope['start'], scope['end'],
+             scope['broker'])).fetchall()
+        stored = {row[0]: dict(zip(SUMMARY_FIELDS, row[1:])) for row in rows}
+        return [stored.get(self._params_key(scope, params)) for params in params_list]
+
+    def put(self, scope, params, record):
+        self.put_many(scope, [(params, record)])
+
+    def put_many(self, scope, items):
+        """items 为 [(参数, 含 SUMMARY_FIELDS 的记录), ...]; 同键覆盖"""
+        created = datetime.datetime.now().isoformat(timespec='seconds')
+        rows = [self._key(scope, params) +
+                tuple(_plain(record[field]) for field in SUMMARY_FIELDS) + (created,)
+                for params, record in items]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (" + ", ".join("?" * 12) + ")",
+                rows)
+
+    def query(self, scope=None, **params):
+        """
+        按键字段 (scope 中的 strategy / data / start / end / broker, 可只给一部分)
+        和参数值筛选, 返回 [完整参数 + SUMMARY_FIELDS + 键字段] 记录, 不做任何回测
+        """
+        scope = scope or {}
+        where = [f"{field}=?" for field in KEY_FIELDS if field in scope]
+        args = [scope[field] for field in KEY_FIELDS if field in scope]
+        sql = "SELECT " + ", ".join(KEY_FIELDS + SUMMARY_FIELDS) + " FROM results"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        records = []
+        for row in self._conn.execute(sql, args):
+            key = dict(zip(KEY_FIELDS, row))
+            stored = json.loads(key.pop('params'))
+            if any(stored.get(name) != value for name, value in params.items()):
+                continue
+            record = dict(stored)
+            record.update(zip(SUMMARY_FIELDS, row[len(KEY_FIELDS):]))
+            record.update(key)
+            records.append(record)
+        return records
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def cached_grid(db, scope, run, fixed=None, **axes):
+    """
+    网格 axes (参数名 -> 候选值) 中库里已有的组合直接取出; 缺失组合所在的最小子
+    网格 (各维取缺失组合用到的值) 交给 run(**子网格) 回测, run 返回含参数列的
+    记录, 新结果写回库。按网格顺序 (第一维在外层) 返回全部记录
+    """
+    fixed = dict(fixed or {})
+    names = list(axes)
+    combos = list(itertools.product(*[list(axes[name]) for name in names]))
+    params_list = [dict(fixed, **dict(zip(names, combo))) for combo in combos]
+    found = dict(zip(combos, db.lookup(scope, params_list)))
+
+    missing = [combo for combo in combos if found[combo] is None]
+    if missing:
+        sub = {name: [v for v in axes[name] if v in {combo[k] for combo in missing}]
+               for k, name in enumerate(names)}
+        fresh = run(**sub)
+        items = []
+        for record in fresh:
+            combo = tuple(record[name] for name in names)
+            found[combo] = {field: record[field] for field in SUMMARY_FIELDS}
+            items.append((dict(fixed, **dict(zip(names, combo))), record))
+        db.put_many(scope, items)
+
+    records = []
+    for combo in combos:
+        record = dict(zip(names, combo))
+        record.update(found[combo])
+        records.append(record)
+    return records
+
+
+class CachedObjective(object):
+    """
+    param_search 目标函数的缓存层: 先查库, 只把缺失的参数交给 objective, 新结果
+    写回库; 短窗口 (fraction < 1) 的数据指纹不同, 各自成键
+    """
+
+    def __init__(self, objective, db, strategy, bars, fixed=None, **broker):
+        self.objective = objective
+        self.db = db
+        self.strategy = strategy
+        self.bars = bars
+        self.fixed = dict(fixed or {})
+        self.broker = broker
+        self._scopes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _scope(self, fraction):
+        if fraction not in self._scopes:
+            self._scopes[fraction] = self.db.scope(
+                self.strategy, param_search.window(self.bars, fraction), **self.broker)
+        return self._scopes[fraction]
+
+    def __call__(self, params_list, fraction=1.0):
+        scope = self._scope(fraction)
+        full = [dict(self.fixed, **params) for params in params_list]
+        stored = self.db.lookup(scope, full)
+        todo = [k for k, record in enumerate(stored) if record is None]
+        self.hits += len(params_list) - len(todo)
+        self.misses += len(todo)
+
+        records = [None] * len(params_list)
+        for k, record in enumerate(stored):
+            if record is not None:
+                records[k] = dict(params_list[k], **record)
+        if todo:
+            fresh = self.objective([params_list[k] for k in todo], fraction)
+            self.db.put_many(scope, [(full[k], record) for k, record in zip(todo, fresh)])
+            for k, record in zip(todo, fresh):
+                records[k] = record
+        return records
+
+    def close(self):
+        close = getattr(self.objective, 'close', None)
+        if close is not None:
+            close()
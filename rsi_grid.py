@@ -0,0 +1,270 @@
+"""
+RSI_EMA_IntradayStrategy 参数网格的向量化回测
+
+RSI 和 EMA 与 rsi_low / rsi_high 无关, 整个网格只需算一次指标; 之后按 K 线
+顺序走一遍, 每一步用 numpy 同时推进所有参数组合的持仓/资金状态。
+
+撮合和统计逐项复刻 backtrader 的默认行为 (结果与 cerebro 逐笔一致):
+    - 指标: RSI 为 Wilder 平滑 (SMMA), EMA 以前 period 根的均值为种子
+    - 策略从最小周期 max(rsi_period + 1, ema_period) 那根 K 线开始运行
+    - 市价单在下一根 K 线开盘价成交; 提交时按下单价检查资金, 成交时按开盘价
+      检查资金, 不足则作废 (Margin)
+    - order_target_value 的股数为 int(总资产 * order_percent // 收盘价)
+    - 佣金按成交额比例收取
+    - total_return / sharpe_ratio / max_drawdown / trade_count 与 Returns /
+      SharpeRatio(按年) / DrawDown / TradeAnalyzer 的算法相同
+
+    records = run_grid(bars, range(20, 41, 5), range(60, 81, 5))
+"""
+import math
+
+import backtrader as bt
+import numpy as np
+
+import param_search
+from indicator_cache import default_cache
+
+RESULT_FIELDS = ['rsi_low', 'rsi_high', 'final_value', 'total_return', 'sharpe_ratio',
+                 'max_drawdown', 'trade_count']
+
+
+def _sharpe(returns, riskfreerate):
+    """bt.analyzers.SharpeRatio (timeframe=Years, 不年化, 总体标准差)"""
+    if not returns:
+        return None
+    rate = pow(1.0 + riskfreerate, 1.0 / 1.0) - 1.0
+    ret_free = [r - rate for r in returns]
+    avg = math.fsum(ret_free) / len(ret_free)
+    dev = math.sqrt(math.fsum([pow(r - avg, 2.0) for r in ret_free]) / len(ret_free))
+    try:
+        return avg / dev
+    except ZeroDivisionError:
+        return None
+
+
+def run_grid(bars, rsi_lows, rsi_highs, rsi_period=14, ema_period=50,
+             order_percent=0.95, cash=1500000.0, commission=0.00005,
+             riskfreerate=0.0, record_fills=False, record_equity=False):
+    """
+    一次回测 rsi_lows x rsi_highs 的全部组合 (rsi_low 在外层, 与 optstrategy 的
+    顺序相同), 返回 RESULT_FIELDS 字段的记录列表
+
+    bars 为列式 K 线 (bar_store.get_bars(as_frame=False)), 至少含 datetime /
+    open / close; record_fills=True 时另返回每个组合的成交列表
+    [(K 线序号, 带符号股数, 成交价), ...], record_equity=True 时再另返回
+    (K 线数, 组合数) 的逐根总资产数组, 依次排在 records 之后
+    """
+    close = np.asarray(bars['close'], dtype=np.float64)
+    opens = np.asarray(bars['open'], dtype=np.float64)
+    years = np.asarray(bars['datetime'], dtype='M8[ns]').astype('M8[Y]')
+    n = len(close)
+
+    # 指标经 indicator_cache 取得, 与同进程内 cerebro 路径共用
+    cache = default_cache()
+    rsi = cache.get('rsi', {'close': close}, period=rsi_period)['rsi']
+    ema = cache.get('ema', {'close': close}, period=ema_period)['ema']
+    uptrend = close > ema
+    first = max(rsi_period + 1, ema_period) - 1
+
+    low_grid, high_grid = np.meshgrid(np.asarray(rsi_lows, dtype=np.float64),
+                                      np.asarray(rsi_highs, dtype=np.float64),
+                                      indexing='ij')
+    low = low_grid.ravel()
+    high = high_grid.ravel()
+    size = len(low)
+
+    cash = np.full(size, float(cash))
+    start_value = cash.copy()
+    pos = np.zeros(size)
+    entry = np.zeros(size)
+    pending = np.zeros(size, dtype=np.int8)     # 1 买入 / -1 平仓, 下一根开盘成交
+    order_size = np.zeros(size)
+    order_price = np.zeros(size)
+    trades = np.zeros(size, dtype=np.int64)
+    value = cash.copy()
+    max_value = np.full(size, -np.inf)
+    max_drawdown = np.zeros(size)
+    year_values = []
+    fills = [[] for _ in range(size)] if record_fills else None
+    equity = np.empty((n, size)) if record_equity else None
+    has_pending = False
+
+    for i in range(n):
+        c = close[i]
+        if has_pending:
+            o = opens[i]
+            buy = np.flatnonzero(pending == 1)
+            if len(buy):
+                q = order_size[buy]
+                # 提交检查 (下单时的收盘价) 与成交检查 (开盘价), 资金不足则作废
+                checked = cash[buy] - q * order_price[buy]
+                checked = checked - q * commission * order_price[buy]
+                left = cash[buy] - q * o
+                left = left - q * commission * o
+                ok = (checked >= 0.0) & (left >= 0.0)
+                done = buy[ok]
+                cash[done] = left[ok]
+                pos[done] = q[ok]
+                entry[done] = o
+                trades[done] += 1
+                if record_fills:
+                    for g, qty in zip(done.tolist(), q[ok].tolist()):
+                        fills[g].append((i, qty, float(o)))
+
+            sell = np.flatnonzero(pending == -1)
+            if len(sell):
+                q = pos[sell]
+                e = entry[sell]
+                left = cash[sell] + (q * e + q * (o - e) * 1.0)
+                cash[sell] = left - q * commission * o
+                pos[sell] = 0.0
+                if record_fills:
+                    for g, qty in zip(sell.tolist(), q.tolist()):
+                        fills[g].append((i, -qty, float(o)))
+
+            pending[:] = 0
+            has_pending = False
+
+        # 总资产 (与 BackBroker._get_value 的运算顺序一致)
+        unrealized = pos * (c - entry) * 1.0
+        value = cash + ((pos * c - unrealized) + unrealized)
+        if record_equity:
+            equity[i] = value
+
+        np.maximum(max_value, value, out=max_value)
+        np.maximum(max_drawdown, 100.0 * (max_value - value) / max_value, out=max_drawdown)
+
+        if i + 1 == n or years[i + 1] != years[i]:
+            year_values.append(value.copy())
+
+        if i < first:
+            continue
+
+        flat = pos == 0.0
+        if uptrend[i]:
+            buy = flat & (rsi[i] < low)
+            if buy.any():
+                qty = np.floor_divide(value * order_percent, c)
+                buy &= qty > 0.0
+                pending[buy] = 1
+                order_size[buy] = qty[buy]
+                order_price[buy] = c
+                has_pending = True
+        sell = ~flat & (rsi[i] > high)
+        if sell.any():
+            pending[sell] = -1
+            has_pending = True
+
+    records = []
+    prev = start_value
+    yearly = []
+    for values in year_values:
+        yearly.append(values / prev - 1.0)
+        prev = values
+    for g in range(size):
+        ratio = value[g] / start_value[g]
+        total_return = math.log(ratio) if ratio > 0.0 else float('-inf')
+        records.append({
+            'rsi_low': _param(rsi_lows, low[g]),
+            'rsi_high': _param(rsi_highs, high[g]),
+            'final_value': float(value[g]),
+            'total_return': total_return * 100,
+            'sharpe_ratio': _sharpe([float(r[g]) for r in yearly], riskfreerate),
+            'max_drawdown': float(max_drawdown[g]),
+            'trade_count': int(trades[g]),
+        })
+
+    extra = []
+    if record_fills:
+        extra.append(fills)
+    if record_equity:
+        extra.append(equity)
+    if extra:
+        return (records,) + tuple(extra)
+    return records
+
+
+def _param(values, x):
+    # 参数原样返回 (int 阈值不变成 float)
+    for v in values:
+        if v == x:
+            return v
+    return x
+
+
+class FillRecorder(bt.Analyzer):
+    """记录 cerebro 路径的成交 [(K 线序号, 带符号股数, 成交价), ...], 用于对比"""
+
+    def create_analysis(self):
+        self.rets = []
+
+    def notify_order(self, order):
+        if order.status == order.Completed:
+            self.rets.append((len(self.data) - 1, order.executed.size,
+                              order.executed.price))
+
+
+def compare_results(expected, actual, expected_fills=None, actual_fills=None,
+                    rtol=1e-9):
+    """
+    按 (rsi_low, rsi_high) 对比两组记录 (及成交), 返回差异说明列表, 为空表示一致
+    """
+    problems = []
+    index = {(r['rsi_low'], r['rsi_high']): k for k, r in enumerate(actual)}
+    for k, exp in enumerate(expected):
+        key = (exp['rsi_low'], exp['rsi_high'])
+        if key not in index:
+            problems.append(f"{key}: 缺少结果")
+            continue
+        got = actual[index[key]]
+        for field in RESULT_FIELDS[2:]:
+            a, b = exp[field], got[field]
+            if a is None or b is None:
+                same = a is b
+            else:
+                same = math.isclose(a, b, rel_tol=rtol, abs_tol=rtol)
+            if not same:
+                problems.append(f"{key}: {field} {a} != {b}")
+        if expected_fills is not None and actual_fills is not None:
+            fa, fb = expected_fills[k], actual_fills[index[key]]
+            if len(fa) != len(fb):
+                problems.append(f"{key}: 成交笔数 {len(fa)} != {len(fb)}")
+            for x, y in zip(fa, fb):
+                if x[0] != y[0] or x[1] != y[1] or not math.isclose(x[2], y[2], rel_tol=rtol):
+                    problems.append(f"{key}: 成交 {x} != {y}")
+                    break
+    return problems
+
+
+class GridObjective(object):
+    """
+    param_search 的目标函数: rsi_period / ema_period 相同的参数一起交给 run_grid
+    批量回测; 未参与搜索的参数取 defaults
+    """
+
+    def __init__(self, bars, **defaults):
+        self.bars = bars
+        self.defaults = dict(rsi_low=30, rsi_high=70, rsi_period=14, ema_period=50)
+        self.defaults.update(defaults)
+
+    def __call__(self, params_list, fraction=1.0):
+        bars = param_search.window(self.bars, fraction)
+        groups = {}
+        for k, params in enumerate(params_list):
+            full = dict(self.defaults, **params)
+            key = tuple(sorted((n, v) for n, v in full.items()
+                               if n not in ('rsi_low', 'rsi_high')))
+            groups.setdefault(key, []).append((k, full))
+
+        records = [None] * len(params_list)
+        for key, members in groups.items():
+            lows = sorted({full['rsi_low'] for _, full in members})
+            highs = sorted({full['rsi_high'] for _, full in members})
+            found = {(r['rsi_low'], r['rsi_high']): r
+                     for r in run_grid(bars, lows, highs, **dict(key))}
+            for k, full in members:
+                record = dict(found[(full['rsi_low'], full['rsi_high'])])
+                for name in params_list[k]:
+                    record[name] = params_list[k][name]
+                records[k] = record
+        return records
@@ -0,0 +1,122 @@
+"""
+参数优化的精简结果
+
+cerebro.optstrategy 配合 optreturn=False 时, 每组参数都要把完整的策略实例
+(所有 line、指标和分析器) 从子进程 pickle 回主进程, 内存和进程间通信量随
+K 线数 * 参数组合数增长。
+
+RunSummary 分析器在子进程内把收益率、夏普、最大回撤、交易次数算好, 只保留
+一条扁平记录; 配合 optreturn=True, 回传的只有参数和这条记录。ResultStreamer
+作为 cerebro.optcallback, 每跑完一组参数就把记录追加写入 CSV 并 flush。
+
+    cerebro = bt.Cerebro(maxcpus=None, optreturn=True)
+    cerebro.addanalyzer(RunSummary, _name='summary')
+    streamer = ResultStreamer('results.csv', ['rsi_low', 'rsi_high'])
+    cerebro.optcallback(streamer)
+    cerebro.run()
+    streamer.close()
+"""
+import csv
+
+import backtrader as bt
+
+SUMMARY_FIELDS = ['final_value', 'total_return', 'sharpe_ratio', 'max_drawdown',
+                  'trade_count']
+
+
+class RunSummary(bt.Analyzer):
+    """
+    单次回测的汇总: params / final_value / total_return (%) / sharpe_ratio /
+    max_drawdown (%) / trade_count
+    """
+
+    params = (
+        ('riskfreerate', 0.0),
+    )
+
+    def __init__(self):
+        self._returns = bt.analyzers.Returns()
+        self._sharpe = bt.analyzers.SharpeRatio(riskfreerate=self.p.riskfreerate)
+        self._drawdown = bt.analyzers.DrawDown()
+        self._trades = bt.analyzers.TradeAnalyzer()
+
+    def stop(self):
+        # 子分析器先于本分析器 stop, 此时结果已就绪
+        trades = self._trades.get_analysis()
+        self.rets['params'] = dict(self.strategy.params._getkwargs())
+        self.rets['final_value'] = self.strategy.broker.getvalue()
+        self.rets['total_return'] = self._returns.get_analysis().get('rtot', 0) * 100
+        self.rets['sharpe_ratio'] = self._sharpe.get_analysis().get('sharperatio', 0)
+        self.rets['max_drawdown'] = self._drawdown.get_analysis().max.drawdown
+        self.rets['trade_count'] = trades.total.total if 'total' in trades else 0
+
+        # 只保留汇总, 子分析器不随结果回传
+        self._children = []
+        self._returns = self._sharpe = self._drawdown = self._trades = None
+
+
+def summary_record(strategy, param_names=None, name='summary'):
+    """
+    从策略或 OptReturn 取出扁平记录: 所选参数 + SUMMARY_FIELDS
+    param_names 为 None 时带上全部参数
+    """
+    analysis = getattr(strategy.analyzers, name).get_analysis()
+    params = analysis['params']
+    names = list(params) if param_names is None else param_names
+    record = {p: params[p] for p in names}
+    for field in SUMMARY_FIELDS:
+        record[field] = analysis[field]
+    return record
+
+
+class ResultStreamer(object):
+    """
+    cerebro.optcallback 回调: 每跑完一组参数立即写入一行 CSV,
+    同时在内存中保留精简记录 (records); path 为 None 时只保留记录
+
+    maxcpus != 1 时 cerebro (连同 optcallback) 会被 pickle 到子进程, 所以文件在
+    主进程第一次回调时才打开, pickle 时不带文件句柄
+    """
+
+    def __init__(self, path, param_names, name='summary'):
+        self.path = path
+        self.param_names = list(param_names)
+        self.name = name
+        self.records = []
+        self._file = self._writer = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_file'] = state['_writer'] = None
+        return state
+
+    def _open(self):
+        if self.path is None or self._file is not None:
+            return
+        self._file = open(self.path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file,
+                                      fieldnames=self.param_names + SUMMARY_FIELDS)
+        self._writer.writeheader()
+        self._file.flush()
+
+    def __call__(self, strategies):
+        self._open()
+        for strategy in strategies:
+            record = summary_record(strategy, self.param_names, self.name)
+            if self._writer is not None:
+                self._writer.writerow(record)
+            self.records.append(record)
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        # 一组参数都没跑时也写出只有表头的文件
+        self._open()
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,312 @@
+"""
+通达信 (TDX) 本地行情文件解码
+
+所有格式每条记录都是 32 字节 (小端), 布局见 RECORD_LAYOUTS:
+
+.lc1 / .lc5 (1 分钟 / 5 分钟线):
+    uint16 日期  (年份-2004)*2048 + 月*100 + 日
+    uint16 分钟  当日 0 点起的分钟数 (K 线结束时间)
+    float32 开 高 低 收, float32 成交额
+    uint32 成交量 (股), uint32 保留
+
+.day (日线):
+    uint32 日期  YYYYMMDD
+    uint32 开 高 低 收  价格 * 100 (股票) 或 * 1000 (ETF/基金)
+    float32 成交额, uint32 成交量 (股), uint32 保留
+
+整个文件用结构化 dtype 一次性 np.frombuffer, 日期/时间/价格按列整体换算,
+不再逐条 struct.unpack。各格式都解码成同一种列式 K 线结构:
+datetime (K 线开始时间) / open / high / low / close / amount / vol (手)。
+
+只需要某个日期窗口时用 Lc1Archive: 文件以 np.memmap 映射, 在日期/分钟字段上
+二分查找, 只解码窗口内的记录, 耗时与文件覆盖的年份长短无关:
+
+    with Lc1Archive('sh513300.lc1') as arc:
+        df = arc.read_frame(datetime(2025, 7, 28), date(2025, 7, 28))
+"""
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+RECORD_SIZE = 32
+
+LC1_DTYPE = np.dtype([
+    ('date', '<u2'),
+    ('minute', '<u2'),
+    ('open', '<f4'),
+    ('high', '<f4'),
+    ('low', '<f4'),
+    ('close', '<f4'),
+    ('amount', '<f4'),
+    ('vol', '<u4'),
+    ('reserved', '<u4'),
+])
+
+DAY_DTYPE = np.dtype([
+    ('date', '<u4'),
+    ('open', '<u4'),
+    ('high', '<u4'),
+    ('low', '<u4'),
+    ('close', '<u4'),
+    ('amount', '<f4'),
+    ('vol', '<u4'),
+    ('reserved', '<u4'),
+])
+
+# 扩展名 -> (记录 dtype, 每根 K 线的分钟数; None 表示日线)
+RECORD_LAYOUTS = {
+    '.lc1': (LC1_DTYPE, 1),
+    '.lc5': (LC1_DTYPE, 5),
+    '.day': (DAY_DTYPE, None),
+}
+
+# 旧版 read_lc1_file 输出的列顺序
+COLS = ["date", "time", "open", "high", "low", "close", "amount", "vol"]
+
+# 列式 K 线结构中的价格/量列
+BAR_FIELDS = ["open", "high", "low", "close", "amount", "vol"]
+
+
+def _dates_from_parts(year, month, day):
+    """年/月/日整数数组 -> datetime64[D]"""
+    months = (year - 1970) * 12 + (month - 1)
+    return months.astype('M8[M]').astype('M8[D]') + (day - 1).astype('m8[D]')
+
+
+def _layout(file_path):
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext not in RECORD_LAYOUTS:
+        raise ValueError(f"不支持的通达信文件类型: {file_path}")
+    return ext, RECORD_LAYOUTS[ext]
+
+
+def guess_price_divisor(file_path):
+    """
+    .day 文件价格的放大倍数: ETF/基金 (sh5xxxxx, sz15/16/18xxxx) 为 1000, 其余 100
+    """
+    name = os.path.basename(file_path).lower()
+    market, code = name[:2], name[2:8]
+    if (market == 'sh' and code.startswith('5')) or \
+       (market == 'sz' and code[:2] in ('15', '16', '18')):
+        return 1000
+    return 100
+
+
+def _bar_columns(rec, dt, prices, ndigits):
+    bars = {'datetime': dt.astype('M8[ns]')}
+    for name in ('open', 'high', 'low', 'close'):
+        bars[name] = np.round(prices(rec[name]), ndigits)
+    bars['amount'] = rec['amount'].astype(np.float64)
+    bars['vol'] = rec['vol'].astype(np.float64) / 100.0
+    return bars
+
+
+def decode_minute_records(rec, bar_minutes=1, ndigits=3):
+    """
+    把 LC1_DTYPE 结构化数组 (.lc1/.lc5) 解码为列式 K 线 (dict of ndarray)
+    datetime 为 K 线开始时间 (记录中的结束时间减去 bar_minutes), 与旧脚本一致
+    """
+    packed = rec['date'].astype(np.int64)
+    year = packed // 2048 + 2004
+    month = packed % 2048 // 100
+    day = packed % 2048 % 100
+    minute = rec['minute'].astype(np.int64) - bar_minutes
+
+    dt = _dates_from_parts(year, month, day).astype('M8[m]') + minute.astype('m8[m]')
+    return _bar_columns(rec, dt, lambda col: col.astype(np.float64), ndigits)
+
+
+def decode_day_records(rec, price_divisor=100, ndigits=3):
+    """把 DAY_DTYPE 结构化数组 (.day) 解码为列式 K 线, datetime 为当日 0 点"""
+    ymd = rec['date'].astype(np.int64)
+    dt = _dates_from_parts(ymd // 10000, ymd // 100 % 100, ymd % 100)
+    return _bar_columns(rec, dt, lambda col: col / float(price_divisor), ndigits)
+
+
+def decode_lc1_records(rec, ndigits=3):
+    """.lc1 记录解码 (1 分钟线)"""
+    return decode_minute_records(rec, 1, ndigits)
+
+
+def decode_lc1(buf, ndigits=3):
+    """解码 .lc1 二进制内容 (bytes / memoryview), 末尾不足 32 字节的残片忽略"""
+    count = len(buf) // RECORD_SIZE
+    rec = np.frombuffer(buf, dtype=LC1_DTYPE, count=count)
+    return decode_lc1_records(rec, ndigits)
+
+
+def decode_records(rec, file_path, ndigits=3, price_divisor=None):
+    """按 file_path 的扩展名选择布局, 解码结构化记录"""
+    ext, (dtype, bar_minutes) = _layout(file_path)
+    if bar_minutes is None:
+        if price_divisor is None:
+            price_divisor = guess_price_divisor(file_path)
+        return decode_day_records(rec, price_divisor, ndigits)
+    return decode_minute_records(rec, bar_minutes, ndigits)
+
+
+def read_bars(file_path, ndigits=3, price_divisor=None):
+    """
+    读取 .lc1 / .lc5 / .day 文件, 返回列式 K 线 dict
+    price_divisor 只对 .day 有效, 默认按代码推断 (见 guess_price_divisor)
+    """
+    ext, (dtype, bar_minutes) = _layout(file_path)
+    with open(file_path, "rb") as ofile:
+        data = ofile.read()
+    rec = np.frombuffer(data, dtype=dtype, count=len(data) // RECORD_SIZE)
+    return decode_records(rec, file_path, ndigits, price_divisor)
+
+
+def read_bars_frame(file_path, ndigits=3, price_divisor=None):
+    """读取 .lc1 / .lc5 / .day 文件为 DataFrame (datetime 索引)"""
+    return bars_to_frame(read_bars(file_path, ndigits, price_divisor))
+
+
+def read_lc1(file_path, ndigits=3):
+    """读取 .lc1 文件, 返回列式 K 线 dict: datetime/open/high/low/close/amount/vol"""
+    with open(file_path, "rb") as ofile:
+        data = ofile.read()
+    return decode_lc1(data, ndigits)
+
+
+def bars_to_frame(bars):
+    """列式 K 线 -> 以 datetime 为索引的 DataFrame"""
+    index = pd.DatetimeIndex(bars['datetime'], name='datetime')
+    return pd.DataFrame({name: bars[name] for name in BAR_FIELDS}, index=index)
+
+
+def read_lc1_frame(file_path, ndigits=3):
+    """读取 .lc1 文件为 DataFrame (datetime 索引)"""
+    return bars_to_frame(read_lc1(file_path, ndigits))
+
+
+def bars_to_records(bars):
+    """
+    列式 K 线 -> 旧格式的 dict 列表
+    date/time 为 '2025-7-28' / '9:30:0' 形式的字符串
+    """
+    dt = bars['datetime']
+    days = dt.astype('M8[D]')
+    ymd = days.astype(object)
+    minutes = ((dt - days) // np.timedelta64(1, 'm')).astype(np.int64)
+
+    dates = [f"{d.year}-{d.month}-{d.day}" for d in ymd]
+    times = [f"{m // 60}:{m % 60}:0" for m in minutes.tolist()]
+
+    return [
+        dict(zip(COLS, row))
+        for row in zip(dates, times,
+                       bars['open'].tolist(), bars['high'].tolist(),
+                       bars['low'].tolist(), bars['close'].tolist(),
+                       bars['amount'].tolist(), bars['vol'].tolist())
+    ]
+
+
+def read_lc1_file(file_path, ndigits=3):
+    """兼容旧接口: 返回 (kline_data, cols), kline_data 为每根 K 线一个 dict"""
+    return bars_to_records(read_lc1(file_path, ndigits)), list(COLS)
+
+
+def _pack_date(d):
+    """date -> .lc1 日期字段"""
+    return (d.year - 2004) * 2048 + d.month * 100 + d.day
+
+
+def _record_key(packed_date, minute):
+    """(日期字段, 分钟字段) -> 单调递增的整数键"""
+    return packed_date * 2048 + minute
+
+
+def _start_key(when):
+    """区间起点: 第一根开始时间 >= when 的 K 线"""
+    if not isinstance(when, datetime.datetime) and isinstance(when, datetime.date):
+        return _record_key(_pack_date(when), 0)
+    ts = pd.Timestamp(when)
+    # 记录中的分钟是 K 线结束时间, 比开始时间多 1 分钟
+    return _record_key(_pack_date(ts), ts.hour * 60 + ts.minute + 1)
+
+
+def _end_key(when):
+    """区间终点 (含): 纯日期表示包含当天全部 K 线"""
+    if not isinstance(when, datetime.datetime) and isinstance(when, datetime.date):
+        return _record_key(_pack_date(when), 2047)
+    ts = pd.Timestamp(when)
+    return _record_key(_pack_date(ts), ts.hour * 60 + ts.minute + 1)
+
+
+class Lc1Archive(object):
+    """
+    .lc1 文件的内存映射视图, 按日期区间随机读取
+    记录按时间升序存放 (通达信追加写入), 区间定位只访问 O(log n) 条记录
+    """
+
+    def __init__(self, file_path, ndigits=3):
+        self.file_path = file_path
+        self.ndigits = ndigits
+        self.count = os.path.getsize(file_path) // RECORD_SIZE
+        if self.count:
+            self._rec = np.memmap(file_path, dtype=LC1_DTYPE, mode='r',
+                                  shape=(self.count,))
+        else:
+            self._rec = np.empty(0, dtype=LC1_DTYPE)
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        mm = getattr(self._rec, '_mmap', None)
+        self._rec = np.empty(0, dtype=LC1_DTYPE)
+        self.count = 0
+        if mm is not None:
+            mm.close()
+
+    def _key(self, i):
+        r = self._rec[i]
+        return _record_key(int(r['date']), int(r['minute']))
+
+    def _bisect_left(self, key):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _bisect_right(self, key):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key < self._key(mid):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def locate(self, fromdate=None, todate=None):
+        """返回区间 [fromdate, todate] 对应的记录下标 (lo, hi), 不含 hi"""
+        lo = self._bisect_left(_start_key(fromdate)) if fromdate is not None else 0
+        hi = self._bisect_right(_end_key(todate)) if todate is not None else self.count
+        return lo, max(lo, hi)
+
+    def records(self, fromdate=None, todate=None):
+        """区间内的原始记录 (拷贝出映射区, 文件关闭后仍可用)"""
+        lo, hi = self.locate(fromdate, todate)
+        return np.array(self._rec[lo:hi])
+
+    def read(self, fromdate=None, todate=None):
+        """区间内的列式 K 线"""
+        return decode_lc1_records(self.records(fromdate, todate), self.ndigits)
+
+    def read_frame(self, fromdate=None, todate=None):
+        """区间内的 K 线 DataFrame (datetime 索引)"""
+        return bars_to_frame(self.read(fromdate, todate))
@@ -0,0 +1,195 @@
+"""
+滚动窗口 (walk-forward) 优化
+
+在整段行情上优化再报告样本内最优, 说明不了参数的稳健性。这里把时间轴按交易日
+切成滚动的 训练/测试 窗口:
+
+    训练窗口  optimize(训练段 K 线) -> (最优参数, 样本内记录)
+    测试窗口  evaluate(测试段 K 线, 参数) -> (样本外记录, 逐根总资产)
+
+各窗口的样本外资金曲线首尾相接成一条样本外曲线, 另出一张参数稳定性报告。
+
+    windows = split_windows(bars['datetime'], train_days=40, test_days=10, warmup=49)
+    results = run_walk_forward(bars, windows, optimize, evaluate, jobs=None)
+    equity = stitch_equity(results, cash=1500000)
+    table, summary = stability_report(results, ['rsi_low', 'rsi_high'])
+
+K 线只加载一次, 各窗口按下标切片; jobs > 1 时各窗口在进程池里并行, 子进程只在
+启动时收到一次 K 线, 任务只传窗口下标。optimize / evaluate 需为模块级函数 (或其
+functools.partial), 以便传给子进程。
+
+测试段前会带上 warmup 根 K 线给指标预热 (策略在预热期内不交易), 资金曲线只取
+测试段本身; 每个测试窗口以初始资金空仓开始, 期末持仓按收盘价计值。
+"""
+import math
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+
+def split_windows(datetimes, train_days, test_days, step_days=None, warmup=0):
+    """
+    按交易日切分滚动窗口, 返回 [{'train': (lo, hi), 'test': (lo, hi),
+    'eval': (lo, hi), 'train_start', 'train_end', 'test_start', 'test_end',
+    'train_days', 'test_days'}, ...]
+    其中 (lo, hi) 为 K 线下标区间 [lo, hi); eval 为测试段加前面 warmup 根预热
+    step_days 默认等于 test_days (测试窗口首尾相接); 最后一个测试窗口可以不足
+    test_days
+    """
+    days = np.asarray(datetimes, dtype='M8[ns]').astype('M8[D]')
+    uniq = np.unique(days)
+    step = step_days or test_days
+    windows = []
+    first = 0
+    while first + train_days < len(uniq):
+        train = uniq[first:first + train_days]
+        test = uniq[first + train_days:first + train_days + test_days]
+        train_lo = int(np.searchsorted(days, train[0], 'left'))
+        train_hi = int(np.searchsorted(days, train[-1], 'right'))
+        test_hi = int(np.searchsorted(days, test[-1], 'right'))
+        windows.append({
+            'train': (train_lo, train_hi),
+            'test': (train_hi, test_hi),
+            'eval': (max(0, train_hi - warmup), test_hi),
+            'train_start': pd.Timestamp(train[0]),
+            'train_end': pd.Timestamp(train[-1]),
+            'test_start': pd.Timestamp(test[0]),
+            'test_end': pd.Timestamp(test[-1]),
+            'train_days': len(train),
+            'test_days': len(test),
+        })
+        first += step
+    return windows
+
+
+def _slice(bars, lo, hi):
+    return {name: col[lo:hi] for name, col in bars.items()}
+
+
+_worker_bars = None
+
+
+def _init_worker(bars):
+    global _worker_bars
+    _worker_bars = bars
+
+
+def _run_window(window, optimize, evaluate, bars=None):
+    bars = _worker_bars if bars is None else bars
+    params, in_sample = optimize(_slice(bars, *window['train']))
+    out_of_sample, values = evaluate(_slice(bars, *window['eval']), params)
+    skip = window['test'][0] - window['eval'][0]
+    result = dict(window)
+    result.update(params=params, in_sample=in_sample, out_of_sample=out_of_sample,
+                  datetime=np.asarray(bars['datetime'][slice(*window['test'])]),
+                  equity=np.asarray(values, dtype=np.float64)[skip:])
+    return result
+
+
+def run_walk_forward(bars, windows, optimize, evaluate, jobs=1):
+    """
+    逐窗口优化 + 样本外回测, 按窗口顺序返回结果 (窗口信息 + params / in_sample /
+    out_of_sample / datetime / equity); jobs > 1 时各窗口并行 (None 为 CPU 核数)
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs <= 1 or len(windows) <= 1:
+        return [_run_window(w, optimize, evaluate, bars) for w in windows]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(windows)),
+                             initializer=_init_worker, initargs=(bars,)) as pool:
+        futures = [pool.submit(_run_window, w, optimize, evaluate) for w in windows]
+        return [f.result() for f in futures]
+
+
+def stitch_equity(results, cash):
+    """
+    各测试窗口的资金曲线按收益率首尾相接, 得到从 cash 起步的样本外资金曲线
+    (以 datetime 为索引的 Series)
+    """
+    pieces = []
+    level = float(cash)
+    for result in results:
+        equity = result['equity']
+        if not len(equity):
+            continue
+        curve = level * equity / equity[0]
+        pieces.append(pd.Series(curve, index=pd.DatetimeIndex(result['datetime'])))
+        level = curve[-1]
+    if not pieces:
+        return pd.Series(dtype=np.float64)
+    return pd.concat(pieces)
+
+
+def stability_report(results, param_names, metric='total_return'):
+    """
+    参数稳定性报告, 返回 (逐窗口表, 逐参数汇总表)
+
+    逐窗口表: 窗口日期、所选参数、样本内/样本外的 metric、样本外回撤和交易次数
+    汇总表: 各参数的均值、标准差、最小/最大值、取值个数、最常见取值及其占比、
+    相邻窗口间的平均变化
+    """
+    rows = []
+    for k, result in enumerate(results, 1):
+        row = {'window': k,
+               'train_start': result['train_start'].date(),
+               'train_end': result['train_end'].date(),
+               'test_start': result['test_start'].date(),
+               'test_end': result['test_end'].date()}
+        for name in param_names:
+            row[name] = result['params'][name]
+        row['is_' + metric] = result['in_sample'].get(metric)
+        row['oos_' + metric] = result['out_of_sample'].get(metric)
+        row['oos_max_drawdown'] = result['out_of_sample'].get('max_drawdown')
+        row['oos_trade_count'] = result['out_of_sample'].get('trade_count')
+        rows.append(row)
+    table = pd.DataFrame(rows)
+
+    summary = []
+    for name in param_names:
+        values = [result['params'][name] for result in results]
+        if not values:
+            continue
+        mode, count = Counter(values).most_common(1)[0]
+        steps = [abs(b - a) for a, b in zip(values, values[1:])]
+        summary.append({
+            'param': name,
+            'mean': float(np.mean(values)),
+            'std': float(np.std(values)),
+            'min': min(values),
+            'max': max(values),
+            'n_unique': len(set(values)),
+            'mode': mode,
+            'mode_share': count / len(values),
+            'mean_step': float(np.mean(steps)) if steps else 0.0,
+        })
+    return table, pd.DataFrame(summary)
+
+
+def efficiency(results, metric='total_return'):
+    """
+    walk-forward 效率: 样本外每交易日的 metric / 样本内每交易日的 metric;
+    样本内不为正时返回 nan
+    """
+    is_total = sum(r['in_sample'].get(metric) or 0.0 for r in results)
+    oos_total = sum(r['out_of_sample'].get(metric) or 0.0 for r in results)
+    is_days = sum(r['train_days'] for r in results)
+    oos_days = sum(r['test_days'] for r in results)
+    if is_total <= 0.0 or not oos_days:
+        return math.nan
+    return (oos_total / oos_days) / (is_total / is_days)
+
+
+class EquityCurve(bt.Analyzer):
+    """逐根记录总资产 (含策略最小周期之前的 K 线), rets 为数值列表"""
+
+    def create_analysis(self):
+        self.rets = []
+
+    def prenext(self):
+        self.rets.append(self.strategy.broker.getvalue())
+
+    def next(self):
+        self.rets.append(self.strategy.broker.getvalue())
@@ -3,14 +3,12 @@ import matplotlib.pyplot as plt
 from datetime import datetime
 import matplotlib.dates as mdates
 from matplotlib.widgets import TextBox
+from bar_cache import load_frame
 
 # 1. 读取数据
 file_path = "my513300.xlsx"
-df = pd.read_excel(file_path)
-
-# 2. 数据预处理
-# 合并 date 和 time 列为一个 datetime 列
-df['datetime'] = pd.to_datetime(df['date'].astype(str) + ' ' + df['time'].astype(str))
+# 首次解析Excel后走列式缓存, datetime 已合并好
+df = load_frame(file_path).reset_index()
 
 def update_plot(text):
     """根据文本框中的日期更新图像"""